@@ -0,0 +1,707 @@
+"""
+Analytic questions answered straight from SQL.
+
+``parse`` turns a question such as "revenue for Himalaya last month", "how many
+Churna products under 150" or "top 3 brands by units sold this year" into an
+``Intent``:
+- a metric
+- filters on product, brand, category, price, stock, expiry and sale date
+- an optional group-by or top-N ranking
+Product, brand and category names are matched against the catalog.
+
+``answer`` runs the intent as one parameterized aggregate query and phrases
+the result. Sales figures come from the daily rollup, as on the dashboard.
+
+Parsing is strict: every word has to be accounted for. A question that names
+something outside the catalog, or asks for a condition the parser doesn't
+know, is not treated as analytic. /rag/ask then falls back to retrieval
+instead of exactly answering a different question.
+"""
+import operator
+import re
+from datetime import date, timedelta
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session
+
+from . import cache, models
+
+Rollup = models.SalesDailyRollup
+Product = models.Product
+
+# same defaults as the dashboard's low-stock and expiry alerts
+LOW_STOCK_THRESHOLD = 10
+EXPIRY_DAYS = 30
+DEFAULT_TOP = 5
+MAX_ROWS = 20
+
+_TOKEN = re.compile(r"\d+(?:\.\d+)?(?:-\d+){0,2}|[a-z]+(?:/[a-z]+)?|[<>]=?|₹")
+
+# metric -> (label, kind); kind selects the number format
+_SALES_METRICS = {
+    "revenue": ("Revenue", "money"),
+    "units_sold": ("Units sold", "int"),
+    "orders": ("Number of sales", "int"),
+    "avg_order_value": ("Average sale value", "money"),
+    "profit": ("Profit", "money"),
+}
+_PRODUCT_METRICS = {
+    "product_count": ("Number of products", "int"),
+    "stock": ("Units in stock", "int"),
+    "stock_value": ("Stock value", "money"),
+    "avg_price": ("Average price", "money"),
+    "price": ("Price", "money"),
+}
+
+_GROUP_COLUMNS = {"product": Product.name, "brand": Product.Brand, "category": Product.category}
+_PERIODS = ("day", "week", "month", "year")
+
+_OPERATORS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+_OPERATOR_WORDS = {"<": "under", "<=": "at most", ">": "over", ">=": "at least"}
+_CONDITION_COLUMNS = {"price": Product.price, "quantity": Product.quantity, "expiry_date": Product.expiry_date}
+
+_MONTHS = {name: i + 1 for i, name in enumerate(
+    ("january", "february", "march", "april", "may", "june", "july",
+     "august", "september", "october", "november", "december"))}
+_MONTHS.update({name[:3]: number for name, number in list(_MONTHS.items())})
+_MONTHS["sept"] = 9
+_MONTH_PATTERN = "|".join(sorted(_MONTHS, key=len, reverse=True))
+
+_SELL = {"sold", "sell", "sells", "selling", "seller", "sellers", "bestseller", "bestsellers"}
+_SALES = {"sale", "sales"}
+_REVENUE = {"revenue", "turnover", "income", "earnings", "earned", "earn", "earning"}
+_ORDERS = {"orders", "order", "transactions", "transaction", "bills", "bill", "invoices", "invoice"}
+_UNITS = {"units", "unit", "quantity", "qty", "pieces", "pcs"}
+_STOCK = {"stock", "stocks", "inventory"}
+_PRICE = {"price", "prices", "priced", "cost", "costs", "mrp"}
+_AVERAGE = {"average", "avg", "mean"}
+_PROFIT = {"profit", "profits", "margin", "margins"}
+_PRODUCTS = {"products", "product", "items", "item", "skus", "sku"}
+_EXPIRY = {"expiring", "expire", "expires", "expiry", "expired"}
+
+# words that carry no condition of their own, plus the metric vocabulary above
+_KNOWN_WORDS = _SELL | _SALES | _REVENUE | _ORDERS | _UNITS | _STOCK | _PRICE | _AVERAGE | _PROFIT | _PRODUCTS | _EXPIRY | {
+    "what", "which", "who", "is", "are", "was", "were", "be", "been", "the", "a", "an", "of", "for", "in", "on",
+    "at", "to", "from", "by", "with", "and", "our", "we", "us", "my", "me", "i", "you", "your", "did", "do",
+    "does", "have", "has", "had", "how", "much", "many", "total", "overall", "all", "show", "tell", "give",
+    "list", "get", "find", "please", "there", "that", "this", "these", "those", "it", "its", "any", "so", "far",
+    "currently", "current", "right", "now", "available", "number", "count", "no", "brand", "brands", "category",
+    "categories", "costing", "rs", "rupees", "inr", "₹", "each", "per", "wise", "every", "across", "breakdown",
+    "split", "value", "worth", "amount", "level", "levels", "left", "remaining", "make", "made", "generate",
+    "generated", "basket", "top", "best", "worst", "bottom", "least", "most", "highest", "lowest", "popular",
+    "expensive", "costliest", "cheapest", "priciest", "low", "running", "out", "need", "needs", "restock",
+    "restocking", "reorder", "soon", "day", "days", "week", "weeks", "month", "months", "year", "years",
+    "daily", "weekly", "monthly", "yearly", "annually", "can", "could", "would", "will", "about", "display",
+    "see", "know", "want", "fetch", "report", "summary", "figures", "numbers", "stats", "data", "store", "shop",
+    "business", "till", "until", "date", "as", "ever", "time", "altogether", "combined", "sum", "where", "whose",
+    "having", "them", "they", "their", "only", "just", "also", "gross", "net", "may",
+}
+
+
+class Intent:
+    def __init__(self):
+        self.metric = None
+        self.products, self.brands, self.categories = [], [], []
+        self.conditions = []  # (column, operator, value), e.g. ("price", "<", 150.0)
+        self.start = self.end = None  # sale date range, inclusive
+        self.group_by = None  # "product" / "brand" / "category" / a period in _PERIODS
+        self.top = None  # number of rows for a ranking
+        self.descending = True
+
+    def as_dict(self) -> dict:
+        return {
+            "metric": self.metric,
+            "products": self.products,
+            "brands": self.brands,
+            "categories": self.categories,
+            "conditions": [[column, op, str(value)] for column, op, value in self.conditions],
+            "start": self.start.isoformat() if self.start else None,
+            "end": self.end.isoformat() if self.end else None,
+            "group_by": self.group_by,
+            "top": self.top,
+            "descending": self.descending,
+        }
+
+
+class Catalog:
+    """Product names, brands and categories, keyed by their tokens."""
+
+    def __init__(self, rows):
+        self.products, self.brands, self.categories = {}, {}, {}
+        for name, brand, category in rows:
+            for names, value in ((self.products, name), (self.brands, brand), (self.categories, category)):
+                if value:
+                    names.setdefault(tuple(_tokens(value)), value)
+        self.longest = max((len(key) for names in (self.products, self.brands, self.categories) for key in names),
+                           default=1)
+
+
+def _tokens(text: str) -> list:
+    text = text.lower().replace("’", "'")
+    text = re.sub(r"'s\b", "", text)
+    # 1,500 -> 1500
+    text = re.sub(r"(?<=\d),(?=\d{3})", "", text)
+    return _TOKEN.findall(text)
+
+
+def load_catalog(db: Session) -> Catalog:
+    catalog = cache.analytics_catalog_cache.get("catalog")
+    if catalog is cache.MISSING:
+        catalog = Catalog(db.execute(select(Product.name, Product.Brand, Product.category)).all())
+        cache.analytics_catalog_cache.set("catalog", catalog)
+    return catalog
+
+
+class _Scanner:
+    """Tokens of a question, and which of them a parsing step has already claimed."""
+
+    def __init__(self, tokens: list):
+        self.tokens = tokens
+        self.used = [False] * len(tokens)
+
+    def matches(self, pattern: re.Pattern):
+        """(match, token indexes) for each match over the unclaimed tokens, claiming them."""
+        text, starts = "", []
+        for token, used in zip(self.tokens, self.used):
+            starts.append(len(text))
+            text += ("_" if used else token) + " "
+        found = []
+        for m in pattern.finditer(text):
+            indexes = [i for i, start in enumerate(starts) if m.start() <= start < m.end()]
+            if any(self.used[i] for i in indexes):
+                continue
+            for i in indexes:
+                self.used[i] = True
+            found.append(m)
+        return found
+
+    def remaining(self) -> list:
+        return [token for token, used in zip(self.tokens, self.used) if not used]
+
+
+def _match_names(scanner: _Scanner, catalog: Catalog, intent: Intent):
+    tokens, used = scanner.tokens, scanner.used
+    # products first, so "Ashwagandha Churna" is not read as the category Churna
+    for names, found in ((catalog.products, intent.products), (catalog.brands, intent.brands),
+                         (catalog.categories, intent.categories)):
+        for size in range(min(catalog.longest, len(tokens)), 0, -1):
+            for i in range(len(tokens) - size + 1):
+                if any(used[i:i + size]):
+                    continue
+                key = tuple(tokens[i:i + size])
+                value = names.get(key)
+                if value is None and names is not catalog.products and key[-1].endswith("s"):
+                    # plurals: "oils", "Churnas"
+                    value = names.get(key[:-1] + (key[-1][:-1],))
+                if value is not None:
+                    if value not in found:
+                        found.append(value)
+                    used[i:i + size] = [True] * size
+
+
+def _add_months(d: date, months: int) -> date:
+    month = d.month - 1 + months
+    year = d.year + month // 12
+    month = month % 12 + 1
+    days_in_month = ((date(year + month // 12, month % 12 + 1, 1)) - date(year, month, 1)).days
+    return date(year, month, min(d.day, days_in_month))
+
+
+def _period_start(d: date, unit: str) -> date:
+    if unit == "week":
+        return d - timedelta(days=d.weekday())
+    if unit == "month":
+        return d.replace(day=1)
+    if unit == "quarter":
+        return d.replace(month=(d.month - 1) // 3 * 3 + 1, day=1)
+    if unit == "year":
+        return d.replace(month=1, day=1)
+    return d
+
+
+def _period_length(unit: str) -> int:
+    return {"week": 0, "month": 1, "quarter": 3, "year": 12}[unit]
+
+
+_ISO = r"(\d{4}-\d{1,2}-\d{1,2})"
+_DATE_PATTERNS = [
+    ("between", re.compile(rf"\b(?:from|between) {_ISO} (?:to|and|until|till) {_ISO}\b")),
+    ("since", re.compile(rf"\b(?:since|from|after) {_ISO}\b")),
+    ("before", re.compile(rf"\b(?:before|until|till) {_ISO}\b")),
+    ("on", re.compile(rf"\b(?:on )?{_ISO}\b")),
+    ("today", re.compile(r"\btoday\b")),
+    ("yesterday", re.compile(r"\byesterday\b")),
+    ("this", re.compile(r"\b(?:(?:so far )?(?:this|current) (week|month|quarter|year)(?: so far| to date)?|(week|month|quarter|year) to date)\b")),
+    ("to_date", re.compile(r"\b(wtd|mtd|qtd|ytd)\b")),
+    ("last_n", re.compile(r"\b(?:last|past|previous) (\d+) (days?|weeks?|months?|years?)\b")),
+    ("last", re.compile(r"\b(?:last|previous|past|prior) (week|month|quarter|year)\b")),
+    ("month", re.compile(rf"\b(?:(?:in|during|for|of) )?({_MONTH_PATTERN})(?: (\d{{4}}))?\b")),
+    ("year", re.compile(r"\b(?:in|during|for|of) ((?:19|20)\d\d)\b")),
+]
+
+
+def _match_dates(scanner: _Scanner, intent: Intent, today: date) -> bool:
+    """Sets intent.start/end from the first date phrase. False if there is more than one."""
+    found = 0
+    for kind, pattern in _DATE_PATTERNS:
+        for m in scanner.matches(pattern):
+            if kind == "month" and m.group(1) == "may" and not m.group(2) and not m.group(0).startswith(("in", "during", "for", "of")):
+                # "may" the verb; give its tokens back
+                for i, token in enumerate(scanner.tokens):
+                    if token == "may" and scanner.used[i]:
+                        scanner.used[i] = False
+                continue
+            found += 1
+            try:
+                intent.start, intent.end = _date_range(kind, m, today)
+            except ValueError:
+                return False
+    return found <= 1
+
+
+def _date_range(kind: str, m: re.Match, today: date):
+    if kind == "between":
+        return date.fromisoformat(_iso(m.group(1))), date.fromisoformat(_iso(m.group(2)))
+    if kind == "since":
+        start = date.fromisoformat(_iso(m.group(1)))
+        return (start + timedelta(days=1) if m.group(0).startswith("after") else start), today
+    if kind == "before":
+        end = date.fromisoformat(_iso(m.group(1)))
+        return None, (end - timedelta(days=1) if m.group(0).startswith("before") else end)
+    if kind == "on":
+        day = date.fromisoformat(_iso(m.group(1)))
+        return day, day
+    if kind == "today":
+        return today, today
+    if kind == "yesterday":
+        return today - timedelta(days=1), today - timedelta(days=1)
+    if kind in ("this", "to_date"):
+        unit = m.group(1) or (m.group(2) if kind == "this" else None)
+        if kind == "to_date":
+            unit = {"wtd": "week", "mtd": "month", "qtd": "quarter", "ytd": "year"}[m.group(1)]
+        return _period_start(today, unit), today
+    if kind == "last_n":
+        n, unit = int(m.group(1)), m.group(2).rstrip("s")
+        if unit == "day":
+            return today - timedelta(days=n - 1), today
+        if unit == "week":
+            return today - timedelta(days=7 * n - 1), today
+        return _add_months(today, -n * (12 if unit == "year" else 1)) + timedelta(days=1), today
+    if kind == "last":
+        unit = m.group(1)
+        if unit == "week":
+            start = _period_start(today, "week") - timedelta(days=7)
+            return start, start + timedelta(days=6)
+        start = _add_months(_period_start(today, unit), -_period_length(unit))
+        return start, _period_start(today, unit) - timedelta(days=1)
+    if kind == "month":
+        month = _MONTHS[m.group(1)]
+        year = int(m.group(2)) if m.group(2) else (today.year if month <= today.month else today.year - 1)
+        start = date(year, month, 1)
+        return start, _add_months(start, 1) - timedelta(days=1)
+    year = int(m.group(1))
+    return date(year, 1, 1), date(year, 12, 31)
+
+
+def _iso(text: str) -> str:
+    year, month, day = text.split("-")
+    return f"{year}-{int(month):02d}-{int(day):02d}"
+
+
+_NUMBER = r"(\d+(?:\.\d+)?)"
+_CURRENCY = r"(?:(?:rs|inr|₹) )?"
+_FIELD = r"(?:(price|priced|cost|costs|costing|mrp|stock|quantity|qty|units?) (?:is |are |of |at )?)?"
+_UNIT = r"(?: (rs|rupees|inr|units?|pieces|pcs|in stock|left|qty))?"
+_OPERATOR_PHRASES = {
+    "<": ("under", "below", "less than", "lower than", "cheaper than", "fewer than", "<"),
+    "<=": ("at most", "up to", "upto", "not more than", "max", "maximum", "<="),
+    ">": ("over", "above", "more than", "greater than", "higher than", "costlier than", ">"),
+    ">=": ("at least", "min", "minimum", ">="),
+}
+_OPERATOR_BY_PHRASE = {phrase: op for op, phrases in _OPERATOR_PHRASES.items() for phrase in phrases}
+_COMPARE = re.compile(
+    rf"{_FIELD}({'|'.join(sorted(map(re.escape, _OPERATOR_BY_PHRASE), key=len, reverse=True))}) {_CURRENCY}{_NUMBER}{_UNIT}(?= |$)"
+)
+_BETWEEN = re.compile(rf"{_FIELD}between {_CURRENCY}{_NUMBER} and {_CURRENCY}{_NUMBER}{_UNIT}(?= |$)")
+_QUANTITY_WORDS = {"stock", "quantity", "qty", "unit", "units", "pieces", "pcs", "in stock", "left"}
+
+
+def _condition_column(field, unit, op_phrase=None) -> str:
+    if field in _QUANTITY_WORDS or unit in _QUANTITY_WORDS or op_phrase == "fewer than":
+        return "quantity"
+    return "price"
+
+
+def _match_conditions(scanner: _Scanner, intent: Intent):
+    for m in scanner.matches(_BETWEEN):
+        column = _condition_column(m.group(1), m.group(4))
+        low, high = sorted((float(m.group(2)), float(m.group(3))))
+        intent.conditions += [(column, ">=", low), (column, "<=", high)]
+    for m in scanner.matches(_COMPARE):
+        column = _condition_column(m.group(1), m.group(4), m.group(2))
+        intent.conditions.append((column, _OPERATOR_BY_PHRASE[m.group(2)], float(m.group(3))))
+
+
+_TOP = re.compile(r"\b(top|best|bottom|worst|least|highest|lowest) (\d+)\b")
+_GROUP = re.compile(
+    r"\b(?:(?:by|per|each|every|across|for each|for every|breakdown by|split by) "
+    r"(brand|brands|category|categories|product|products|item|items|day|days|date|week|weeks|month|months|year|years)"
+    r"|(brand|category|product|item|day|date|week|month|year) wise"
+    r"|(daily|weekly|monthly|yearly|annually))\b"
+)
+_GROUP_NAMES = {
+    "brands": "brand", "categories": "category", "products": "product", "item": "product", "items": "product",
+    "days": "day", "date": "day", "weeks": "week", "months": "month", "years": "year", "daily": "day",
+    "weekly": "week", "monthly": "month", "yearly": "year", "annually": "year",
+}
+_RANK_UP = re.compile(
+    r"\b(?:best|top|most|highest) ?(?:selling|sellers?|sold|popular|revenue|earning|grossing|profitable|expensive)\b"
+    r"|\bbestsellers?\b|\bsold (?:the )?most\b|\bmost expensive\b|\b(?:costliest|priciest)\b"
+)
+_RANK_DOWN = re.compile(
+    r"\b(?:worst|least|lowest|slowest) ?(?:selling|sellers?|sold|popular|revenue|earning|grossing|profitable|expensive)\b"
+    r"|\bsold (?:the )?least\b|\bcheapest\b"
+)
+
+
+def parse(question: str, catalog: Catalog, today: date | None = None) -> Intent | None:
+    """The analytic intent of ``question``, or None if it isn't (entirely) an analytic question."""
+    today = today or date.today()
+    tokens = _tokens(question)
+    if not tokens:
+        return None
+    scanner = _Scanner(tokens)
+    intent = Intent()
+
+    _match_names(scanner, catalog, intent)
+    if not _match_dates(scanner, intent, today):
+        return None
+    for m in scanner.matches(_TOP):
+        intent.top = int(m.group(2))
+        intent.descending = m.group(1) in ("top", "best", "highest")
+    _match_conditions(scanner, intent)
+    for m in scanner.matches(_GROUP):
+        group = m.group(1) or m.group(2) or m.group(3)
+        intent.group_by = _GROUP_NAMES.get(group, group)
+
+    text = " ".join(scanner.remaining())
+    words = set(scanner.remaining())
+    if not _choose_metric(intent, text, words, today):
+        return None
+    if words - _KNOWN_WORDS:
+        return None
+
+    if intent.metric in _PRODUCT_METRICS or intent.metric == "products":
+        # sale dates mean nothing for catalog figures (expiry ranges were consumed already)
+        if intent.start or intent.end or intent.group_by in _PERIODS:
+            return None
+    if intent.top is not None and intent.top < 1:
+        return None
+    if intent.top is not None and intent.group_by in _PERIODS:
+        # "top 5 products per week" wants a ranking within each period, which one query doesn't give;
+        # without an entity ("top 3 revenue by month") the periods themselves are ranked
+        if words & _RANKED_ENTITIES:
+            return None
+    if intent.top is not None and intent.group_by is None:
+        intent.group_by = _ranked_entity(words)
+    return intent
+
+
+_RANKED_ENTITIES = {"product", "products", "item", "items", "brand", "brands", "category", "categories",
+                    "skus", "sellers", "bestsellers"}
+
+
+def _ranked_entity(words: set) -> str:
+    if words & {"brand", "brands"}:
+        return "brand"
+    if words & {"category", "categories"}:
+        return "category"
+    return "product"
+
+
+def _choose_metric(intent: Intent, text: str, words: set, today: date) -> bool:
+    counting = "how many" in text or "number of" in text or "count" in words
+
+    if words & _EXPIRY:
+        if "expired" in words:
+            intent.conditions.append(("expiry_date", "<", today))
+        else:
+            start, end = intent.start or today, intent.end or today + timedelta(days=EXPIRY_DAYS)
+            intent.conditions += [("expiry_date", ">=", start), ("expiry_date", "<=", end)]
+        intent.start = intent.end = None
+        intent.metric = "product_count" if counting else "products"
+        return True
+    if "out of stock" in text:
+        intent.conditions.append(("quantity", "<=", 0))
+        intent.metric = "product_count" if counting else "products"
+        return True
+    if re.search(r"\blow (?:on )?(?:stock|inventory)\b|\brunning low\b|\brestock|\breorder\b", text):
+        intent.conditions.append(("quantity", "<=", LOW_STOCK_THRESHOLD))
+        intent.metric = "product_count" if counting else "products"
+        return True
+
+    ranking = intent.top is not None
+    rank_up, rank_down = _RANK_UP.search(text), _RANK_DOWN.search(text)
+    if rank_up or rank_down or "which" in words and ("most" in words or "least" in words):
+        ranking = True
+        if intent.top is None:
+            intent.descending = not rank_down and "least" not in words
+            plural = words & {"products", "items", "brands", "categories", "skus", "sellers", "bestsellers"}
+            intent.top = DEFAULT_TOP if plural else 1
+
+    if ranking:
+        if words & {"expensive", "costliest", "priciest", "cheapest"} or words & _PRICE and not words & _SALES:
+            intent.metric = "price"
+            intent.group_by = "product"
+        elif words & _PROFIT or "profitable" in words:
+            intent.metric = "profit"
+        elif words & _REVENUE or "grossing" in words:
+            intent.metric = "revenue"
+        elif words & _ORDERS:
+            intent.metric = "orders"
+        elif words & _STOCK and not words & _SELL:
+            intent.metric = "stock"
+        else:
+            intent.metric = "units_sold"
+        return True
+
+    if words & _AVERAGE and words & (_ORDERS | _SALES | {"basket"}):
+        intent.metric = "avg_order_value"
+    elif words & _AVERAGE and words & _PRICE:
+        intent.metric = "avg_price"
+    elif words & _STOCK and words & {"value", "worth"}:
+        intent.metric = "stock_value"
+    elif words & _PROFIT:
+        intent.metric = "profit"
+    elif words & _REVENUE:
+        intent.metric = "revenue"
+    elif words & _SELL and (counting or words & _UNITS):
+        intent.metric = "units_sold"
+    elif words & (_ORDERS | _SALES) and (counting or "count" in text):
+        intent.metric = "orders"
+    elif "how much" in text and words & (_SELL | {"make", "made"}):
+        intent.metric = "revenue"
+    elif words & _SALES or words & _SELL:
+        intent.metric = "revenue"
+    elif words & _STOCK or words & {"left", "remaining"} and not counting or words & _UNITS:
+        intent.metric = "stock"
+    elif counting:
+        intent.metric = "product_count"
+    elif words & _PRICE and intent.products:
+        intent.metric = "price"
+    elif words & _PRICE:
+        intent.metric = "avg_price"
+    elif words & _PRODUCTS and (words & {"which", "list", "show", "what"}):
+        intent.metric = "products"
+    else:
+        return False
+    return True
+
+
+def _value_expression(metric: str):
+    if metric == "revenue":
+        return func.sum(Rollup.revenue)
+    if metric == "units_sold":
+        return func.sum(Rollup.quantity)
+    if metric == "orders":
+        return func.sum(Rollup.order_count)
+    if metric == "avg_order_value":
+        return func.sum(Rollup.revenue) / func.nullif(func.sum(Rollup.order_count), 0)
+    if metric == "profit":
+        return func.sum(Rollup.revenue - Rollup.quantity * func.coalesce(Product.cost_price, 0))
+    if metric == "product_count":
+        return func.count(Product.id)
+    if metric == "stock":
+        return func.sum(Product.quantity)
+    if metric == "stock_value":
+        return func.sum(Product.price * Product.quantity)
+    return func.avg(Product.price)
+
+
+def _product_filters(intent: Intent) -> list:
+    filters = []
+    if intent.products:
+        filters.append(Product.name.in_(intent.products))
+    if intent.brands:
+        filters.append(func.lower(Product.Brand).in_([b.lower() for b in intent.brands]))
+    if intent.categories:
+        filters.append(func.lower(Product.category).in_([c.lower() for c in intent.categories]))
+    for column, op, value in intent.conditions:
+        filters.append(_OPERATORS[op](_CONDITION_COLUMNS[column], value))
+    return filters
+
+
+def _date_filters(intent: Intent) -> list:
+    # half-open, like the dashboard, so the predicates stay sargable
+    filters = []
+    if intent.start:
+        filters.append(Rollup.sale_date >= intent.start)
+    if intent.end:
+        filters.append(Rollup.sale_date < intent.end + timedelta(days=1))
+    return filters
+
+
+def run(db: Session, intent: Intent) -> list:
+    """Rows of (group key or None, value) for the intent; (name, quantity, price, expiry) rows for listings."""
+    if intent.metric == "products":
+        order = Product.expiry_date if any(c[0] == "expiry_date" for c in intent.conditions) else Product.quantity
+        stmt = (
+            select(Product.name, Product.quantity, Product.price, Product.expiry_date)
+            .where(*_product_filters(intent)).order_by(order, Product.name).limit(MAX_ROWS + 1)
+        )
+        return db.execute(stmt).all()
+
+    value = _value_expression(intent.metric)
+    sales = intent.metric in _SALES_METRICS
+    group = intent.group_by
+
+    if group in _PERIODS:
+        stmt = (
+            select(Rollup.sale_date, value)
+            .join(Product, Rollup.product_id == Product.id)
+            .where(*_product_filters(intent), *_date_filters(intent))
+            .group_by(Rollup.sale_date)
+        )
+        if intent.metric == "avg_order_value":
+            # averages don't add up across days: sum the parts per bucket instead
+            stmt = stmt.with_only_columns(Rollup.sale_date, func.sum(Rollup.revenue), func.sum(Rollup.order_count))
+        buckets = _bucket(db.execute(stmt).all(), group, intent.metric)
+        if intent.top is not None:
+            buckets.sort(key=lambda row: row[1], reverse=intent.descending)
+            buckets = buckets[:intent.top]
+        return buckets
+
+    if group is None:
+        stmt = select(value)
+        if sales:
+            stmt = stmt.select_from(Rollup).join(Product, Rollup.product_id == Product.id)
+        stmt = stmt.where(*_product_filters(intent), *(_date_filters(intent) if sales else []))
+        return [(None, db.execute(stmt).scalar())]
+
+    key = _GROUP_COLUMNS[group]
+    if sales:
+        # outer join, so products without sales in the range rank too (with 0)
+        stmt = (
+            select(key, func.coalesce(value, 0))
+            .select_from(Product)
+            .outerjoin(Rollup, and_(Rollup.product_id == Product.id, *_date_filters(intent)))
+        )
+    else:
+        stmt = select(key, value)
+    order = value.desc() if intent.descending else value.asc()
+    stmt = (
+        stmt.where(*_product_filters(intent), key.is_not(None))
+        .group_by(key).order_by(order, key).limit(intent.top if intent.top is not None else MAX_ROWS + 1)
+    )
+    return db.execute(stmt).all()
+
+
+def _bucket(rows: list, period: str, metric: str) -> list:
+    totals = {}
+    for row in rows:
+        day = row[0] if isinstance(row[0], date) else date.fromisoformat(str(row[0]))
+        bucket = day if period == "day" else _period_start(day, period)
+        parts = totals.setdefault(bucket, [0, 0])
+        if metric == "avg_order_value":
+            parts[0] += row[1] or 0
+            parts[1] += row[2] or 0
+        else:
+            parts[0] += row[1] or 0
+    if metric == "avg_order_value":
+        return [(bucket, revenue / orders if orders else 0) for bucket, (revenue, orders) in sorted(totals.items())]
+    return [(bucket, total) for bucket, (total, _) in sorted(totals.items())]
+
+
+def _format_period(start: date, period: str) -> str:
+    if period == "year":
+        return str(start.year)
+    if period == "month":
+        return start.strftime("%Y-%m")
+    if period == "week":
+        return f"week of {start.isoformat()}"
+    return start.isoformat()
+
+
+def _format(value, kind: str) -> str:
+    value = value or 0
+    return f"{value:,.2f}" if kind == "money" else f"{int(round(value)):,}"
+
+
+def _format_condition(column: str, op: str, value) -> str:
+    shown = f"{value:,.2f}" if column == "price" else f"{int(value):,}"
+    return f"{'stock' if column == 'quantity' else 'price'} {_OPERATOR_WORDS[op]} {shown}"
+
+
+def describe_scope(intent: Intent) -> str:
+    """The filters of ``intent`` as a phrase: " for brand Himalaya with price under 150.00, from ... to ..."."""
+    subjects = list(intent.products)
+    subjects += [f"brand {b}" for b in intent.brands]
+    subjects += [f"category {c}" for c in intent.categories]
+    scope = f" for {', '.join(subjects)}" if subjects else ""
+    conditions = [c for c in intent.conditions if c[0] != "expiry_date"]
+    if conditions:
+        scope += f"{',' if scope else ''} with " + " and ".join(_format_condition(*c) for c in conditions)
+    expiry = {op: value for column, op, value in intent.conditions if column == "expiry_date"}
+    if ">=" in expiry:
+        scope += f"{',' if scope else ''} expiring from {expiry['>='].isoformat()} to {expiry['<='].isoformat()}"
+    elif "<" in expiry:
+        scope += f"{',' if scope else ''} expired before {expiry['<'].isoformat()}"
+    if intent.start and intent.end:
+        scope += f", on {intent.start.isoformat()}" if intent.start == intent.end else \
+            f", from {intent.start.isoformat()} to {intent.end.isoformat()}"
+    elif intent.start:
+        scope += f", since {intent.start.isoformat()}"
+    elif intent.end:
+        scope += f", up to {intent.end.isoformat()}"
+    return scope.lstrip(",")
+
+
+def format_answer(intent: Intent, rows: list) -> str:
+    scope = describe_scope(intent)
+    if intent.metric == "products":
+        shown = rows[:MAX_ROWS]
+        if not shown:
+            return f"No products{scope}."
+        more = " (first 20 shown)" if len(rows) > MAX_ROWS else ""
+        items = []
+        for name, quantity, price, expiry in shown:
+            detail = f"stock {quantity}" if quantity is not None else "stock unknown"
+            if expiry is not None and any(c[0] == "expiry_date" for c in intent.conditions):
+                detail += f", expires {expiry.isoformat()}"
+            items.append(f"{name} ({detail})")
+        return f"Products{scope}{more}: " + "; ".join(items) + "."
+
+    label, kind = {**_SALES_METRICS, **_PRODUCT_METRICS}[intent.metric]
+    if intent.group_by is None:
+        return f"{label}{scope}: {_format(rows[0][1], kind)}."
+    if not rows:
+        return f"No data{scope}."
+    if intent.top is not None:
+        plural = {"product": "products", "brand": "brands", "category": "categories",
+                  "day": "days", "week": "weeks", "month": "months", "year": "years"}[intent.group_by]
+        order = "Top" if intent.descending else "Bottom"
+        ranked = [(_format_period(k, intent.group_by) if isinstance(k, date) else k, v) for k, v in rows]
+        if intent.top == 1:
+            key, value = ranked[0]
+            return f"{order} {intent.group_by} by {label.lower()}{scope}: {key} ({_format(value, kind)})."
+        head = f"{order} {len(rows)} {plural} by {label.lower()}{scope}"
+        return head + ": " + "; ".join(f"{i}. {key} ({_format(v, kind)})" for i, (key, v) in enumerate(ranked, 1)) + "."
+    shown = rows[:MAX_ROWS] if intent.group_by not in _PERIODS else rows
+    more = f" (top {MAX_ROWS} shown)" if len(rows) > len(shown) else ""
+    keys = (_format_period(k, intent.group_by) if isinstance(k, date) else k for k, _ in shown)
+    return f"{label} by {intent.group_by}{scope}{more}: " + "; ".join(
+        f"{key}: {_format(v, kind)}" for key, (_, v) in zip(keys, shown)) + "."
+
+
+def answer(question: str, db: Session, today: date | None = None):
+    """(answer, sources) computed from SQL, or None if ``question`` isn't an analytic question."""
+    intent = parse(question, load_catalog(db), today)
+    if intent is None:
+        return None
+    rows = run(db, intent)
+    text = format_answer(intent, rows)
+    source = {
+        "document": f"Computed from the database: {intent.metric.replace('_', ' ')}{describe_scope(intent)}",
+        "metadata": {"type": "sql_aggregate", **intent.as_dict()},
+    }
+    return text, [source]
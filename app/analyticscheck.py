@@ -0,0 +1,127 @@
+"""
+Checks the analytic question parser (app/analytics.py) against a question corpus.
+
+Each line of ``analytics_questions.jsonl`` is a question with what is expected of it:
+- ``sql``: a query over ``sales`` and ``products`` computing the expected number; the
+  number in the answer must equal it (to the cent). Answers come from the rollup, so
+  this also checks the rollup against the raw tables.
+- ``intent``: fields the parsed intent must have (see Intent.as_dict); fields left out
+  must keep their defaults.
+- ``"intent": null``: the question is not analytic and must fall back to retrieval.
+
+Relative dates in the corpus ("last month", "yesterday") are relative to TODAY. The
+products come from ``--catalog`` (the bundled stock.db, read-only); a scratch copy gets
+seeded sales spread over the preceding 500 days.
+
+    python -m app.analyticscheck [--catalog stock.db] [--corpus app/analytics_questions.jsonl] [-v]
+
+Exits with status 1 if a question doesn't get its expected answer.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+from datetime import date, timedelta
+
+from . import bench
+
+TODAY = date(2026, 10, 18)
+CORPUS = os.path.join(os.path.dirname(__file__), "analytics_questions.jsonl")
+
+
+def seed(path: str, catalog: str, sales: int):
+    """Copy the catalog's products to ``path`` and replace its sales with reproducible ones."""
+    source = sqlite3.connect(f"file:{catalog}?mode=ro", uri=True)
+    db = sqlite3.connect(path)
+    source.backup(db)
+    source.close()
+    rng = random.Random(7)
+    prices = dict(db.execute("SELECT id, price FROM products"))
+    ids = sorted(prices)
+    rows = []
+    for _ in range(sales):
+        product_id, quantity = rng.choice(ids), rng.randint(1, 5)
+        sale_date = TODAY - timedelta(days=rng.randint(0, 500))
+        rows.append((product_id, quantity, sale_date.isoformat(), quantity * (prices[product_id] or 10)))
+    db.execute("DELETE FROM sales")
+    db.executemany("INSERT INTO sales (product_id, quantity_sold, sale_date, total_price) VALUES (?, ?, ?, ?)", rows)
+    db.commit()
+    db.close()
+
+
+def _answered_number(text: str) -> float:
+    # single figures are phrased "<scope>: <number>."
+    return float(text.rsplit(": ", 1)[1].rstrip(".").replace(",", ""))
+
+
+def check(case: dict, db, raw: sqlite3.Connection) -> str | None:
+    """Why ``case`` fails, or None if it passes."""
+    from . import analytics
+
+    question = case["question"]
+    if "sql" in case:
+        result = analytics.answer(question, db, today=TODAY)
+        if result is None:
+            return "not answered"
+        expected = raw.execute(case["sql"]).fetchone()[0] or 0
+        try:
+            got = _answered_number(result[0])
+        except ValueError:
+            return f"no single figure in {result[0]!r}"
+        if abs(got - round(expected, 2)) > 0.01 + 1e-9 * abs(expected):
+            return f"expected {expected:,.2f}, answered {result[0]!r}"
+        return None
+
+    intent = analytics.parse(question, analytics.load_catalog(db), TODAY)
+    if case["intent"] is None:
+        return None if intent is None else f"should fall back, parsed as {intent.as_dict()}"
+    if intent is None:
+        return "not parsed"
+    expected = {**analytics.Intent().as_dict(), **case["intent"]}
+    wrong = {k: v for k, v in intent.as_dict().items() if v != expected[k]}
+    if wrong:
+        return "; ".join(f"{k} {v!r}, expected {expected[k]!r}" for k, v in wrong.items())
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the analytic question parser against a question corpus.")
+    parser.add_argument("--catalog", default="stock.db", help="SQLite database to take the products from (read-only)")
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument("--sales", type=int, default=20000, help="sales to seed the scratch database with")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every question, not just failures")
+    args = parser.parse_args()
+
+    with open(args.corpus) as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+
+    catalog = os.path.abspath(args.catalog)
+    with bench.scratch_app("analyticscheck") as tmp:
+        path = os.path.join(tmp, "analyticscheck.db")
+        seed(path, catalog, args.sales)
+        # not app.main (see bench.load_app): the catalog may hold duplicate product names
+        from . import database, models, rollup
+
+        models.Base.metadata.create_all(bind=database.engine)
+        failures = 0
+        with database.SessionLocal() as db, sqlite3.connect(path) as raw:
+            rollup.rebuild(db)
+            db.commit()
+            for case in cases:
+                problem = check(case, db, raw)
+                failures += problem is not None
+                if problem is not None:
+                    print(f"FAIL {case['question']!r}: {problem}")
+                elif args.verbose:
+                    print(f"ok   {case['question']!r}")
+        database.engine.dispose()
+
+    print(f"{len(cases) - failures} of {len(cases)} questions as expected")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Concurrent request throughput of the sync and async database paths.
+
+Simulates route handlers on one event loop against a seeded scratch SQLite
+database (see dbbench.seed). The "sync" path does what a sync route did:
+each request takes a threadpool slot and runs on a SessionLocal-style session
+from the sync engine. The "async" path does what the routes do now: each
+request opens an AsyncSession on the async engine (aiosqlite / asyncpg), and
+multi-step writes go through run_sync. ``--concurrency`` clients send requests
+back to back. The request mix is:
+- 60% product lookup
+- 20% page of the product list
+- 10% per-product sales summary
+- 10% sale (guarded stock decrement, insert, rollup update, commit)
+
+    python -m app.asyncbench [--concurrency 16 64] [--seconds 10] [--profile balanced]
+
+``--url`` runs against another (scratch!) database, e.g. Postgres, seeded the
+same way if empty; its async URL is derived as for the app (asyncpg).
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from . import models, rollup, schemas
+from .database import DB_PROFILES, _async_url, create_profiled_async_engine, create_profiled_engine
+from .bench import percentile
+from .dbbench import _DAYS, _START, _decrement_stock, _get_product, _product_summary, seed
+
+_products = models.Product.__table__
+_sales = models.Sale.__table__
+_list_page = select(_products).order_by(_products.c.id).limit(100)
+
+
+def _pick(rng: random.Random, ids: list):
+    """(kind, params) of the next request in the mix."""
+    roll = rng.random()
+    params = {"product_id": rng.choice(ids)}
+    if roll < 0.6:
+        return "get", params
+    if roll < 0.8:
+        return "list", params
+    if roll < 0.9:
+        return "summary", {**params, "since": _START + timedelta(days=rng.randrange(_DAYS - 30))}
+    sale = schemas.SaleCreate(product_id=params["product_id"], quantity_sold=1,
+                              sale_date=_START + timedelta(days=rng.randrange(_DAYS)), total_price=10.0)
+    return "sale", sale
+
+
+def _record_sale(db, sale: schemas.SaleCreate):
+    db.execute(_decrement_stock, {"product_id": sale.product_id, "sold": sale.quantity_sold})
+    db.execute(insert(_sales), [sale.model_dump()])
+    rollup.apply_sales(db, added=[sale])
+    db.commit()
+
+
+def _sync_request(Session, kind: str, params):
+    with Session() as db:
+        if kind == "sale":
+            _record_sale(db, params)
+        elif kind == "list":
+            db.execute(_list_page).all()
+        else:
+            db.execute(_get_product if kind == "get" else _product_summary, params).first()
+
+
+async def _async_request(AsyncSession, kind: str, params):
+    async with AsyncSession() as db:
+        if kind == "sale":
+            await db.run_sync(_record_sale, params)
+        elif kind == "list":
+            (await db.execute(_list_page)).all()
+        else:
+            (await db.execute(_get_product if kind == "get" else _product_summary, params)).first()
+
+
+async def run(url: str, path: str, profile: str, concurrency: int, seconds: float) -> dict:
+    """Requests per second, latency percentiles and errors of one path at one concurrency."""
+    if path == "sync":
+        engine = create_profiled_engine(url, profile)
+        Session = sessionmaker(bind=engine, autoflush=False)
+        with engine.connect() as conn:
+            ids = [pid for (pid,) in conn.execute(select(_products.c.id))]
+
+        async def request(kind, params):
+            await run_in_threadpool(_sync_request, Session, kind, params)
+    else:
+        engine = create_profiled_async_engine(_async_url(url), profile)
+        AsyncSession = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+        async with engine.connect() as conn:
+            ids = [pid for (pid,) in await conn.execute(select(_products.c.id))]
+
+        async def request(kind, params):
+            await _async_request(AsyncSession, kind, params)
+
+    latencies, errors = [], 0
+
+    async def client(seed: int, deadline: float):
+        nonlocal errors
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            kind, params = _pick(rng, ids)
+            started = time.perf_counter()
+            try:
+                await request(kind, params)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(i, started + seconds) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    if path == "sync":
+        engine.dispose()
+    else:
+        await engine.dispose()
+    return {
+        "per_sec": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sync (threadpool) and async database paths under concurrent requests.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[16, 64])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--profile", choices=list(DB_PROFILES), default="balanced")
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--sales", type=int, default=200000, help="sales to seed the scratch database with")
+    parser.add_argument("--url", help="scratch database to use instead of a temporary SQLite file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="asyncbench-") as tmp:
+        if args.url is None:
+            seed_path = os.path.join(tmp, "seed.db")
+            seed(f"sqlite:///{seed_path}", "legacy", args.products, args.sales)
+        else:
+            seed(args.url, "legacy", args.products, args.sales)
+
+        print(f"profile {args.profile}, {args.seconds:g}s per run")
+        print(f"{'clients':>7} {'path':<6} {'req/s':>8} {'p50':>8} {'p99':>9} {'errors':>7}")
+        for concurrency in args.concurrency:
+            for path in ("sync", "async"):
+                url = args.url
+                if url is None:
+                    # every run starts from the same seeded file
+                    db_path = os.path.join(tmp, f"{path}-{concurrency}.db")
+                    shutil.copyfile(seed_path, db_path)
+                    url = f"sqlite:///{db_path}"
+                r = asyncio.run(run(url, path, args.profile, concurrency, args.seconds))
+                print(f"{concurrency:>7} {path:<6} {r['per_sec']:>8.0f} {r['p50_ms']:>6.1f}ms "
+                      f"{r['p99_ms']:>7.1f}ms {r['errors']:>7}")
+
+if __name__ == "__main__":
+    main()
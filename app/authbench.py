@@ -0,0 +1,102 @@
+"""
+Concurrent logins vs. everything else: the bounded password hashing pool.
+
+Imports the app against a scratch SQLite database, signs up one user, then
+fires a burst of ``--logins`` concurrent logins (POST /auth/) and ``--signups``
+sign-ups (POST /auth/SignUp) through the ASGI app in process (httpx). While
+the burst runs, ``--reads`` product reads (GET /products/{id}) are issued
+``--read-interval-ms`` apart. bcrypt runs at the configured BCRYPT_ROUNDS.
+
+    python -m app.authbench [--logins 12 30 100] [--signups 2] [--reads 50]
+
+Per burst it prints:
+- the auth status codes (503 means the request was turned away by
+  PASSWORD_HASH_MAX_PENDING)
+- auth latency
+- product read latency during the burst, which should stay flat
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+from datetime import date
+
+from sqlalchemy import insert
+
+from . import bench
+
+_PASSWORD = "bench-password"
+
+
+async def run(bursts: list, signups: int, reads: int, read_interval: float) -> list:
+    app = bench.load_app()
+    from . import database, models
+
+    with database.engine.begin() as conn:
+        conn.execute(insert(models.Product), [{"id": 1, "name": "bench product", "Brand": "bench", "category": "bench",
+                                               "price": 10.0, "cost_price": 6.0, "quantity": 100, "expiry_date": date(2030, 1, 1)}])
+
+    results = []
+    async with bench.serve(app, "authbench") as client:
+        response = await client.post("/auth/SignUp", json={"email": "bench@example.com", "username": "bench", "password": _PASSWORD})
+        response.raise_for_status()
+        read_headers = bench.bearer_headers(response.json()["id"])
+        # the first read fills the principal cache, as for any active user
+        (await client.get("/products/1", headers=read_headers)).raise_for_status()
+
+        for n, logins in enumerate(bursts):
+            async def timed(method, url, **kwargs):
+                started = time.perf_counter()
+                response = await client.request(method, url, **kwargs)
+                return response.status_code, time.perf_counter() - started
+
+            async def read(i):
+                await asyncio.sleep(i * read_interval)
+                return await timed("GET", "/products/1", headers=read_headers)
+
+            auth = [timed("POST", "/auth/", json={"email": "bench@example.com", "password": _PASSWORD})
+                    for _ in range(logins)]
+            auth += [timed("POST", "/auth/SignUp",
+                           json={"email": f"bench{n}-{i}@example.com", "username": f"bench{n}-{i}", "password": _PASSWORD})
+                     for i in range(signups)]
+            started = time.perf_counter()
+            done = await asyncio.gather(*auth, *(read(i) for i in range(reads)))
+            wall = time.perf_counter() - started
+            auth_done, reads_done = done[:len(auth)], done[len(auth):]
+            results.append({
+                "logins": logins,
+                "wall": wall,
+                "statuses": Counter(code for code, _ in auth_done),
+                "auth_p50_ms": bench.percentile([s for code, s in auth_done if code < 500], 50) * 1000,
+                "read_p50_ms": bench.percentile([s for _, s in reads_done], 50) * 1000,
+                "read_p95_ms": bench.percentile([s for _, s in reads_done], 95) * 1000,
+                "read_max_ms": max(s for _, s in reads_done) * 1000,
+                "read_errors": sum(code != 200 for code, _ in reads_done),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Burst concurrent logins and measure product reads alongside.")
+    parser.add_argument("--logins", type=int, nargs="+", default=[12, 30, 100], help="concurrent logins per burst")
+    parser.add_argument("--signups", type=int, default=2, help="concurrent sign-ups per burst")
+    parser.add_argument("--reads", type=int, default=50, help="product reads during each burst")
+    parser.add_argument("--read-interval-ms", type=float, default=10)
+    args = parser.parse_args()
+
+    with bench.scratch_app("authbench"):
+        results = asyncio.run(run(args.logins, args.signups, args.reads, args.read_interval_ms / 1000))
+
+    from . import utils
+
+    print(f"bcrypt rounds {utils.BCRYPT_ROUNDS}, {utils.PASSWORD_HASH_WORKERS} hashing workers, "
+          f"{utils.PASSWORD_HASH_MAX_PENDING} pending allowed; {args.signups} sign-ups and {args.reads} reads per burst")
+    for r in results:
+        statuses = ", ".join(f"{code}: {count}" for code, count in sorted(r["statuses"].items()))
+        print(f"{r['logins']:>4} logins  {r['wall']:5.2f}s  auth {statuses}  auth p50 {r['auth_p50_ms']:.0f}ms")
+        print(f"      product reads  p50 {r['read_p50_ms']:.0f}ms  p95 {r['read_p95_ms']:.0f}ms  "
+              f"max {r['read_max_ms']:.0f}ms  errors {r['read_errors']}")
+
+
+if __name__ == "__main__":
+    main()
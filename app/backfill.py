@@ -0,0 +1,224 @@
+"""
+Streaming importer for historical sales (CSV or NDJSON).
+
+Rows are validated against the set of existing product ids (loaded once) and
+bulk-inserted in chunks. Each chunk is committed together with its rollup
+update and a checkpoint row (byte offset + counters), so an interrupted import
+resumes exactly after the last committed chunk, without duplicating or
+skipping rows.
+
+Imported rows are not queued for the vector index one by one: each chunk
+skips change capture and queues a catch-up build that the sync worker runs.
+
+Stock is not touched per row. With ``--apply-stock`` the net quantity sold per
+product is accumulated (in the checkpoint) and subtracted from
+``Product.quantity`` once, in the transaction that completes the import.
+
+    python -m app.backfill sales.csv [--format ndjson] [--apply-stock] [--rejects rejects.ndjson]
+
+CSV columns / NDJSON keys: product_id, quantity_sold, sale_date, total_price.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+from pydantic import ValidationError
+from sqlalchemy import bindparam, insert, update
+from sqlalchemy.orm import Session
+
+from . import models, rollup, schemas, vector_index
+from .database import SessionLocal, engine
+
+BACKFILL_CHUNK_SIZE = 10000
+
+_apply_stock = (
+    update(models.Product.__table__)
+    .where(models.Product.__table__.c.id == bindparam("product_id"))
+    .values(quantity=models.Product.__table__.c.quantity - bindparam("sold"))
+)
+
+
+class _LineReader:
+    """Iterate a binary file line by line, tracking the byte offset after the last line read."""
+
+    def __init__(self, f):
+        self.f = f
+        self.offset = f.tell()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.f.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode("utf-8")
+
+
+def _iter_records(f, fmt: str, start_offset: int):
+    """
+    Yield (offset after the record, record) from ``start_offset`` on: a dict
+    for CSV, the raw line for NDJSON (parsed in _validate, so bad JSON is a
+    rejected row rather than a failed import).
+    The csv module only pulls the lines it needs for one record, so the offset
+    is exact even for quoted fields that span lines.
+    """
+    lines = _LineReader(f)
+    if fmt == "csv":
+        header = next(csv.reader(lines), None)
+        if header is None:
+            return
+        header = [h.strip().lstrip("\ufeff") for h in header]
+        if start_offset > lines.offset:
+            f.seek(start_offset)
+            lines.offset = start_offset
+        for values in csv.reader(lines):
+            if values:
+                yield lines.offset, dict(zip(header, values))
+    else:
+        if start_offset:
+            f.seek(start_offset)
+            lines.offset = start_offset
+        for line in lines:
+            if line.strip():
+                yield lines.offset, line
+
+
+def _validate(record, product_ids: set) -> schemas.SaleCreate:
+    if isinstance(record, str):
+        record = json.loads(record)
+    if not isinstance(record, dict):
+        raise ValueError("record is not an object")
+    sale = schemas.SaleCreate.model_validate(record)
+    if sale.product_id not in product_ids:
+        raise ValueError(f"unknown product_id {sale.product_id}")
+    return sale
+
+
+def _load_checkpoint(db: Session, source: str, restart: bool) -> models.ImportCheckpoint:
+    checkpoint = db.get(models.ImportCheckpoint, source)
+    if checkpoint is not None and restart:
+        db.delete(checkpoint)
+        db.flush()
+        checkpoint = None
+    if checkpoint is None:
+        checkpoint = models.ImportCheckpoint(
+            source=source, byte_offset=0, rows_read=0, rows_imported=0, rows_rejected=0,
+            stock_deltas="{}", completed=False,
+        )
+        db.add(checkpoint)
+        db.commit()
+    return checkpoint
+
+
+def _commit_chunk(db: Session, checkpoint: models.ImportCheckpoint, sales: list, offset: int,
+                  read: int, rejected: int, stock_deltas: dict | None):
+    if sales:
+        # the vector index picks imported sales up with one catch-up build, rather than
+        # through an outbox entry per row
+        vector_index.queue_sales_catch_up(db)
+        with vector_index.uncaptured_sale_inserts(db):
+            db.execute(insert(models.Sale), [sale.model_dump() for sale in sales])
+        rollup.apply_sales(db, added=sales)
+    checkpoint.byte_offset = offset
+    checkpoint.rows_read += read
+    checkpoint.rows_imported += len(sales)
+    checkpoint.rows_rejected += rejected
+    if stock_deltas is not None:
+        checkpoint.stock_deltas = json.dumps(stock_deltas)
+    db.commit()
+
+
+def import_sales(db: Session, path: str, fmt: str = "csv", apply_stock: bool = False,
+                 chunk_size: int = BACKFILL_CHUNK_SIZE, restart: bool = False,
+                 rejects=None, progress=None) -> models.ImportCheckpoint:
+    """
+    Import sales from ``path``, resuming from its checkpoint if one exists.
+    Returns the (completed) checkpoint with the totals.
+    """
+    source = os.path.abspath(path)
+    checkpoint = _load_checkpoint(db, source, restart)
+    if checkpoint.completed:
+        return checkpoint
+
+    product_ids = {pid for (pid,) in db.query(models.Product.id)}
+    stock_deltas = defaultdict(int, {int(k): v for k, v in json.loads(checkpoint.stock_deltas or "{}").items()})
+
+    chunk, read, rejected, read_this_run = [], 0, 0, 0
+    offset = checkpoint.byte_offset
+    with open(path, "rb") as f:
+        for offset, record in _iter_records(f, fmt, checkpoint.byte_offset):
+            read += 1
+            try:
+                sale = _validate(record, product_ids)
+            except (ValidationError, ValueError) as e:
+                rejected += 1
+                if rejects is not None:
+                    error = e.errors(include_url=False) if isinstance(e, ValidationError) else str(e)
+                    rejects.write(json.dumps({"record": record, "error": error}, default=str) + "\n")
+                continue
+            chunk.append(sale)
+            if apply_stock:
+                stock_deltas[sale.product_id] += sale.quantity_sold
+            if read >= chunk_size:
+                _commit_chunk(db, checkpoint, chunk, offset, read, rejected, stock_deltas if apply_stock else None)
+                read_this_run += read
+                chunk, read, rejected = [], 0, 0
+                if progress is not None:
+                    progress(checkpoint, read_this_run)
+
+    _commit_chunk(db, checkpoint, chunk, offset, read, rejected, stock_deltas if apply_stock else None)
+
+    # the net stock change and the completion flag commit together, so stock is applied exactly once
+    if apply_stock and stock_deltas:
+        db.execute(_apply_stock, [{"product_id": pid, "sold": sold} for pid, sold in stock_deltas.items() if sold])
+        checkpoint.stock_deltas = "{}"
+    checkpoint.completed = True
+    db.commit()
+    return checkpoint
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-import historical sales from CSV or NDJSON.")
+    parser.add_argument("path", help="file with product_id, quantity_sold, sale_date, total_price per row")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="default: from the file extension")
+    parser.add_argument("--apply-stock", action="store_true",
+                        help="subtract the net quantity sold per product from stock once the import completes")
+    parser.add_argument("--chunk-size", type=int, default=BACKFILL_CHUNK_SIZE, help="rows per transaction")
+    parser.add_argument("--restart", action="store_true",
+                        help="ignore an existing checkpoint for this file (rows already imported are kept)")
+    parser.add_argument("--rejects", help="append rejected rows with their errors to this NDJSON file")
+    args = parser.parse_args()
+
+    fmt = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    models.Base.metadata.create_all(bind=engine)
+
+    started = time.perf_counter()
+
+    def progress(checkpoint, read_this_run):
+        elapsed = time.perf_counter() - started
+        rate = read_this_run / elapsed if elapsed else 0
+        print(f"  {checkpoint.rows_read} rows read, {checkpoint.rows_imported} imported, "
+              f"{checkpoint.rows_rejected} rejected ({rate:.0f} rows/s)", file=sys.stderr)
+
+    # line-buffered so rejects survive an interrupted run
+    rejects = open(args.rejects, "a", buffering=1) if args.rejects else None
+    db = SessionLocal()
+    try:
+        # backfill first, or the rollup would only ever contain the imported sales
+        rollup.ensure_populated(db)
+        checkpoint = import_sales(db, args.path, fmt, args.apply_stock, args.chunk_size, args.restart, rejects, progress)
+        print(f"Imported {checkpoint.rows_imported} sales from {checkpoint.rows_read} rows "
+              f"({checkpoint.rows_rejected} rejected) in {time.perf_counter() - started:.1f}s.")
+    finally:
+        db.close()
+        if rejects is not None:
+            rejects.close()
+
+if __name__ == "__main__":
+    main()
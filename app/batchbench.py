@@ -0,0 +1,79 @@
+"""
+Recording many sales one request at a time vs. through POST /sales/batch.
+
+Imports the app against a scratch SQLite database seeded with ``--products``
+products, then records ``--sales`` sales (default 10k) twice, sequentially
+through the ASGI app in process (httpx):
+- one POST /sales/ per sale
+- POST /sales/batch with ``--batch-size`` sales per request
+
+    python -m app.batchbench [--sales 10000] [--batch-size 500] [--group-commit]
+
+Prints the time and sales/s of each, and checks that stock and the rollup
+account for every sale.
+"""
+import argparse
+import asyncio
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import func, insert, select
+
+from . import bench
+
+
+async def run(sales: int, products: int, batch_size: int) -> dict:
+    app = bench.load_app()
+    from . import database, models
+
+    headers = bench.add_user(1, "bench")
+    with database.engine.begin() as conn:
+        conn.execute(insert(models.Product), [
+            {"id": i, "name": f"bench product {i}", "Brand": "bench", "category": f"cat {i % 20}",
+             "price": 5.0, "cost_price": 3.0, "quantity": 10**9, "expiry_date": None}
+            for i in range(1, products + 1)
+        ])
+    items = [{"product_id": 1 + i % products, "quantity_sold": 1,
+              "sale_date": (date(2025, 1, 1) + timedelta(days=i % 365)).isoformat(), "total_price": 5.0}
+             for i in range(sales)]
+
+    timings = {}
+    async with bench.serve(app, "batchbench", headers=headers) as client:
+        started = time.perf_counter()
+        for item in items:
+            response = await client.post("/sales/", json=item)
+            response.raise_for_status()
+        timings["one per request"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for start in range(0, sales, batch_size):
+            response = await client.post("/sales/batch", json=items[start:start + batch_size])
+            response.raise_for_status()
+        timings[f"batches of {batch_size}"] = time.perf_counter() - started
+
+    with database.engine.connect() as conn:
+        stock_sold = 10**9 * products - conn.scalar(select(func.sum(models.Product.quantity)))
+        recorded = conn.scalar(select(func.count()).select_from(models.Sale))
+        rolled_up = conn.scalar(select(func.sum(models.SalesDailyRollup.quantity)))
+    return {"timings": timings, "consistent": stock_sold == recorded == rolled_up == 2 * sales}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare recording sales one per request with POST /sales/batch.")
+    parser.add_argument("--sales", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--products", type=int, default=120)
+    parser.add_argument("--group-commit", action="store_true", help="run with SALES_GROUP_COMMIT on")
+    args = parser.parse_args()
+
+    with bench.scratch_app("batchbench", SALES_GROUP_COMMIT="1" if args.group_commit else "0"):
+        r = asyncio.run(run(args.sales, args.products, args.batch_size))
+
+    print(f"{args.sales:,} sales (group commit {'on' if args.group_commit else 'off'})")
+    for label, seconds in r["timings"].items():
+        print(f"  {label:<16} {seconds:7.2f}s  {args.sales / seconds:>8,.0f} sales/s")
+    print(f"  stock, sales and rollup {'agree' if r['consistent'] else 'DISAGREE'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Scaffolding shared by the benchmarks and checks that run the app in process
+(authbench, batchbench, importbench, ragbench, stockstress, analyticscheck) or
+in a child process (startbench), and by those that only need percentiles.
+
+- ``scratch_app``: a temporary directory, with the environment the app reads at
+  import pointed at a scratch SQLite database in it (``scratch_environ``)
+- ``load_app``: the app imported against that database
+- ``serve``: an httpx client for the app, inside its lifespan
+- ``add_user`` / ``bearer_headers``: a user to send authenticated requests as
+- ``percentile``
+"""
+import os
+import statistics
+import tempfile
+from contextlib import asynccontextmanager, contextmanager
+
+# a benchmark must not write to the databases these point at
+_OTHER_URLS = ("ASYNC_DATABASE_URL", "READ_DATABASE_URL", "ASYNC_READ_DATABASE_URL")
+
+
+def scratch_environ(directory: str, name: str, **overrides) -> dict:
+    """``os.environ`` with the app pointed at ``<directory>/<name>.db``, without the RAG stack at startup."""
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{os.path.join(directory, name + '.db')}",
+           "RAG_WARMUP": "0", "RAG_INDEX_SYNC": "0", **overrides}
+    for key in _OTHER_URLS:
+        env.pop(key, None)
+    env.setdefault("SECRET_KEY", name)
+    env.setdefault("ALGORITHM", "HS256")
+    env.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+    return env
+
+
+@contextmanager
+def scratch_app(name: str, **overrides):
+    """Set up ``scratch_environ`` in a temporary directory, which is yielded and removed afterwards."""
+    with tempfile.TemporaryDirectory(prefix=f"{name}-") as tmp:
+        env = scratch_environ(tmp, name, **overrides)
+        for key in set(os.environ) - set(env):
+            del os.environ[key]
+        os.environ.update(env)
+        yield tmp
+
+
+def load_app():
+    """
+    The FastAPI app of app.main, bound to the scratch database. The app (and with it
+    app.database, app.models and app.oauth2) binds its engines to DATABASE_URL when it
+    is imported, so benchmarks import them after this, inside scratch_app, and never at
+    module level.
+    """
+    from .main import app
+
+    return app
+
+
+@asynccontextmanager
+async def serve(app, name: str, **client_options):
+    """An httpx client sending requests through ``app`` in process, while its lifespan runs."""
+    import httpx
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url=f"http://{name}", timeout=None, **client_options) as client:
+            yield client
+
+
+def add_user(user_id: int, name: str) -> dict:
+    """Insert user ``user_id`` (no usable password) and return bearer headers for it."""
+    from sqlalchemy import insert
+
+    from . import database, models
+
+    with database.engine.begin() as conn:
+        conn.execute(insert(models.User), [{"id": user_id, "username": name, "email": f"{name}@example.com", "password": "-"}])
+    return bearer_headers(user_id)
+
+
+def bearer_headers(user_id: int) -> dict:
+    from . import oauth2
+
+    return {"Authorization": f"Bearer {oauth2.create_access_token({'user_id': user_id})}"}
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1] if len(values) > 1 else values[0]
@@ -0,0 +1,192 @@
+"""
+Small in-process caches.
+
+- ``LRUCache``: a bounded, thread-safe LRU map with optional per-entry TTL and
+  hit/miss counters. The caches below are instances of it.
+- ``data_version``: a counter that write paths bump after committing changes to
+  products or sales. Read caches put it in their keys, so every write makes older
+  entries unreachable and LRU eviction drops them later.
+- ``dashboard_cache``: dashboard sections, keyed by section, parameters,
+  ``data_version`` and the current date.
+- ``principal_cache``: authenticated users, keyed by token hash.
+- ``question_embedding_cache``: /rag/ask question embeddings, keyed by the
+  normalized question.
+- ``rag_answer_cache``: /rag/ask answers, keyed by question, k, ``data_version``
+  and the vector index version.
+- ``analytics_catalog_cache``: the product, brand and category names the analytic
+  question parser matches against.
+- ``SingleFlight``: coalesces concurrent async computations of the same key.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# returned by LRUCache.get when the key is absent or expired
+MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize: int = 256, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl: float | None = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is MISSING:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[0] if entry is not None else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class SingleFlight:
+    """
+    At most one computation per key at a time, for coroutines: callers that arrive
+    while one is running await it and share its result (or exception). If the caller
+    running it is cancelled, the waiting callers are not: one of them runs it again.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, compute):
+        """``await compute()`` for ``key``, or join the computation already running for it."""
+        while (flight := self._flights.get(key)) is not None:
+            self.coalesced += 1
+            try:
+                # shielded: a waiter that is cancelled must not cancel the shared computation
+                return await asyncio.shield(flight)
+            except asyncio.CancelledError:
+                if not flight.cancelled():
+                    raise
+                # the caller running it was cancelled, not this one: take over (or join whoever did)
+        flight = self._flights[key] = asyncio.get_running_loop().create_future()
+        self.calls += 1
+        try:
+            value = await compute()
+        except Exception as e:
+            flight.set_exception(e)
+            # marks the exception retrieved when nobody was waiting
+            flight.exception()
+            raise
+        except BaseException:
+            flight.cancel()
+            raise
+        else:
+            flight.set_result(value)
+            return value
+        finally:
+            del self._flights[key]
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._flights), "calls": self.calls, "coalesced": self.coalesced}
+
+
+_data_version = 0
+_data_changed_at = 0.0
+_version_lock = threading.Lock()
+
+
+def data_version() -> int:
+    return _data_version
+
+
+def data_changed_at() -> float:
+    """Unix time of the last bump_data_version() in this process (0 if none)."""
+    return _data_changed_at
+
+
+def bump_data_version() -> int:
+    """Call after committing any write to products or sales."""
+    global _data_version, _data_changed_at
+    with _version_lock:
+        _data_version += 1
+        _data_changed_at = time.time()
+        return _data_version
+
+
+# The version counter is per process; the TTL bounds staleness when several
+# workers serve the same database.
+_dashboard_ttl = os.getenv("DASHBOARD_CACHE_TTL_SECONDS", "60")
+dashboard_cache = LRUCache(
+    maxsize=int(os.getenv("DASHBOARD_CACHE_SIZE", "256")),
+    ttl=float(_dashboard_ttl) if _dashboard_ttl else None,
+)
+
+# Authenticated users keyed by token hash (see oauth2.get_current_user). Cleared
+# when a user row changes; the TTL bounds staleness across worker processes.
+_principal_ttl = os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60")
+principal_cache = LRUCache(
+    maxsize=int(os.getenv("PRINCIPAL_CACHE_SIZE", "1024")),
+    ttl=float(_principal_ttl) if _principal_ttl else None,
+)
+
+# /rag/ask: question embeddings by normalized question (the model is fixed, so no
+# TTL), and answers keyed by question, k, data_version and the vector index version.
+# The answer TTL bounds staleness across worker processes.
+question_embedding_cache = LRUCache(maxsize=int(os.getenv("RAG_EMBEDDING_CACHE_SIZE", "1024")))
+_rag_answer_ttl = os.getenv("RAG_ANSWER_CACHE_TTL_SECONDS", "300")
+rag_answer_cache = LRUCache(
+    maxsize=int(os.getenv("RAG_ANSWER_CACHE_SIZE", "256")),
+    ttl=float(_rag_answer_ttl) if _rag_answer_ttl else None,
+)
+
+# Product names, brands and categories for the analytic question parser
+# (analytics.load_catalog). New names show up once the TTL lapses.
+_analytics_catalog_ttl = os.getenv("ANALYTICS_CATALOG_TTL_SECONDS", "60")
+analytics_catalog_cache = LRUCache(
+    maxsize=1,
+    ttl=float(_analytics_catalog_ttl) if _analytics_catalog_ttl else None,
+)
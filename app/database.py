@@ -1,6 +1,8 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects import postgresql, sqlite
 from dotenv import load_dotenv
 import os
 
@@ -8,17 +10,163 @@ load_dotenv()
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 
+# async drivers for the async engine, by backend
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+def _async_url(url: str, override: str | None = None) -> str:
+    """``url`` with its driver swapped for the backend's async driver, unless ``override`` is given."""
+    if override:
+        return override
+    parsed = make_url(url)
+    backend = "postgresql" if parsed.get_backend_name() in ("postgresql", "postgres") else parsed.get_backend_name()
+    return parsed.set(drivername=_ASYNC_DRIVERS.get(backend, parsed.drivername)).render_as_string(hide_password=False)
+
+# Engine profiles, picked with DB_PROFILE. "legacy" is the driver/SQLAlchemy defaults
+# (rollback journal on SQLite, so readers and writers block each other).
+# "balanced" switches SQLite to WAL with synchronous=NORMAL: readers never block the
+# writer, and a commit only fsyncs at checkpoints, at the cost of possibly losing the
+# last commits (never consistency) on power loss. "durable" keeps WAL but fsyncs every commit.
+_BALANCED_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,       # ms to wait for a lock before "database is locked"
+    "cache_size": -65536,       # page cache per connection, negative = KiB (64 MiB)
+    "mmap_size": 268435456,     # read pages through a 256 MiB memory map
+    "temp_store": "MEMORY",     # sorts and temp indexes in memory
+}
+_BALANCED_POOL = {"pool_size": 10, "max_overflow": 20, "pool_timeout": 30, "pool_recycle": 1800}
+
+DB_PROFILES = {
+    "legacy": {"sqlite_pragmas": {}, "pool": {}, "pre_ping": False, "statement_cache_size": None},
+    "balanced": {
+        "sqlite_pragmas": _BALANCED_PRAGMAS,
+        "pool": _BALANCED_POOL,
+        # drop connections the server closed while idle instead of failing a request
+        "pre_ping": True,
+        # prepared statements kept per asyncpg connection (asyncpg's default is 100)
+        "statement_cache_size": 500,
+    },
+    "durable": {
+        "sqlite_pragmas": {**_BALANCED_PRAGMAS, "synchronous": "FULL"},
+        "pool": _BALANCED_POOL,
+        "pre_ping": True,
+        "statement_cache_size": 500,
+    },
+}
+
+DB_PROFILE = os.getenv("DB_PROFILE", "balanced")
+if DB_PROFILE not in DB_PROFILES:
+    raise RuntimeError(f"Unknown DB_PROFILE {DB_PROFILE!r}, expected one of {', '.join(DB_PROFILES)}")
+
+def _env_pragmas() -> dict:
+    """SQLITE_PRAGMAS="cache_size=-131072,mmap_size=0" overrides single pragmas of the profile."""
+    pragmas = {}
+    for item in filter(None, (part.strip() for part in os.getenv("SQLITE_PRAGMAS", "").split(","))):
+        name, _, value = item.partition("=")
+        pragmas[name.strip()] = value.strip()
+    return pragmas
+
+def _env_pool() -> dict:
+    env = {
+        "pool_size": ("DB_POOL_SIZE", int),
+        "max_overflow": ("DB_MAX_OVERFLOW", int),
+        "pool_timeout": ("DB_POOL_TIMEOUT", float),
+        "pool_recycle": ("DB_POOL_RECYCLE", int),
+    }
+    return {option: cast(os.environ[var]) for option, (var, cast) in env.items() if os.getenv(var)}
+
+def sqlite_pragmas(profile: str = DB_PROFILE) -> dict:
+    return {**DB_PROFILES[profile]["sqlite_pragmas"], **_env_pragmas()}
+
+def engine_options(url: str, profile: str = DB_PROFILE, is_async: bool = False) -> dict:
+    """create_engine()/create_async_engine() keyword arguments for ``url`` under ``profile``."""
+    settings = DB_PROFILES[profile]
+    parsed = make_url(url)
+    pool = {**settings["pool"], **_env_pool()}
+    if parsed.get_backend_name() == "sqlite":
+        options = {"connect_args": {"check_same_thread": False}}
+        if parsed.database in (None, "", ":memory:"):
+            # in-memory databases use a single shared connection, no pool to size
+            return options
+        return {**options, **pool}
+
+    options = {**pool, "pool_pre_ping": settings["pre_ping"]}
+    cache_size = os.getenv("PG_STATEMENT_CACHE_SIZE") or settings["statement_cache_size"]
+    # a prepared_statement_cache_size in the URL itself wins over the profile
+    if (is_async and cache_size is not None and parsed.get_driver_name() == "asyncpg"
+            and "prepared_statement_cache_size" not in parsed.query):
+        options["connect_args"] = {"prepared_statement_cache_size": int(cache_size)}
+    return options
+
+def apply_sqlite_pragmas(sync_engine, pragmas: dict):
+    """Run ``PRAGMA name=value`` on every new DBAPI connection of a SQLite engine."""
+    if sync_engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+def create_profiled_engine(url: str, profile: str = DB_PROFILE):
+    engine = create_engine(url, **engine_options(url, profile))
+    apply_sqlite_pragmas(engine, sqlite_pragmas(profile))
+    return engine
+
+
+# The sync engine serves startup, CLIs, streaming exports and background writer threads;
+# request handlers use the async engine below.
+engine = create_profiled_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def create_profiled_async_engine(url: str, profile: str = DB_PROFILE):
+    engine = create_async_engine(url, **engine_options(url, profile, is_async=True))
+    # connection events are registered on the sync engine the async one wraps
+    apply_sqlite_pragmas(engine.sync_engine, sqlite_pragmas(profile))
+    return engine
+
+async_engine = create_profiled_async_engine(_async_url(SQLALCHEMY_DATABASE_URL, os.getenv("ASYNC_DATABASE_URL")))
+# objects stay readable after commit, since lazy refreshes can't happen outside the greenlet
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Optional read replica for dashboards, listings and RAG indexing (see app/replica.py,
+# which decides per request whether it is fresh enough to use). Without one the
+# read sessions below are bound to the primary.
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")
+if READ_DATABASE_URL:
+    read_engine = create_profiled_engine(READ_DATABASE_URL)
+    read_async_engine = create_profiled_async_engine(_async_url(READ_DATABASE_URL, os.getenv("ASYNC_READ_DATABASE_URL")))
+else:
+    read_engine, read_async_engine = engine, async_engine
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+AsyncReadSessionLocal = async_sessionmaker(read_async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
+# dialect-specific insert() constructs that support ON CONFLICT DO UPDATE / DO NOTHING
+_UPSERT_INSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+def upsert_insert(db):
+    """Return the ON CONFLICT capable insert() for the session's dialect, or None."""
+    return _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
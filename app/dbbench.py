@@ -0,0 +1,186 @@
+"""
+Mixed read/write benchmark for the engine profiles in database.DB_PROFILES.
+
+For each profile a copy of one seeded scratch SQLite database is opened with
+that profile's engine, then reader threads (product lookups and per-product
+sales summaries, like the product and dashboard routes) and writer threads
+(guarded stock decrement, sale insert, rollup update and commit, like
+POST /sales/) run against it for a fixed time.
+
+    python -m app.dbbench [--profiles legacy balanced durable] [--readers 8] [--writers 2] [--seconds 10]
+
+``--url`` runs against another (scratch!) database instead, e.g. a Postgres
+one; it is seeded the same way if it has no products, and sales are written to it.
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from . import models, rollup, schemas
+from .bench import percentile
+from .database import DB_PROFILES, create_profiled_engine
+
+_products = models.Product.__table__
+_sales = models.Sale.__table__
+
+_decrement_stock = (
+    update(_products)
+    .where(_products.c.id == bindparam("product_id"), _products.c.quantity >= bindparam("sold"))
+    .values(quantity=_products.c.quantity - bindparam("sold"))
+)
+_get_product = select(_products).where(_products.c.id == bindparam("product_id"))
+_product_summary = (
+    select(func.count(), func.sum(_sales.c.quantity_sold), func.sum(_sales.c.total_price))
+    .where(_sales.c.product_id == bindparam("product_id"), _sales.c.sale_date >= bindparam("since"))
+)
+
+_START = date(2024, 1, 1)
+_DAYS = 365
+
+
+def seed(url: str, profile: str, products: int, sales: int):
+    engine = create_profiled_engine(url, profile)
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        if conn.execute(select(func.count()).select_from(_products)).scalar():
+            engine.dispose()
+            return
+        conn.execute(insert(_products), [
+            {"name": f"bench product {i}", "Brand": "bench", "category": f"cat {i % 20}",
+             "price": 10.0, "cost_price": 6.0, "quantity": 10**9, "expiry_date": None}
+            for i in range(products)
+        ])
+        ids = [pid for (pid,) in conn.execute(select(_products.c.id))]
+        rng = random.Random(0)
+        for start in range(0, sales, 10000):
+            conn.execute(insert(_sales), [
+                {"product_id": rng.choice(ids), "quantity_sold": 1,
+                 "sale_date": _START + timedelta(days=rng.randrange(_DAYS)), "total_price": 10.0}
+                for _ in range(min(10000, sales - start))
+            ])
+    with sessionmaker(bind=engine)() as db:
+        rollup.rebuild(db)
+    engine.dispose()
+
+
+def run(url: str, profile: str, readers: int, writers: int, seconds: float) -> dict:
+    engine = create_profiled_engine(url, profile)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    with engine.connect() as conn:
+        ids = [pid for (pid,) in conn.execute(select(_products.c.id))]
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    latencies = {"read": [], "write": []}
+    errors = {"read": 0, "write": 0}
+
+    def reader(seed: int):
+        rng = random.Random(seed)
+        own, failed = [], 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                with engine.connect() as conn:
+                    params = {"product_id": rng.choice(ids)}
+                    if rng.random() < 0.7:
+                        conn.execute(_get_product, params).first()
+                    else:
+                        since = _START + timedelta(days=rng.randrange(_DAYS - 30))
+                        conn.execute(_product_summary, {**params, "since": since}).first()
+            except OperationalError:
+                failed += 1
+                continue
+            own.append(time.perf_counter() - started)
+        with lock:
+            latencies["read"] += own
+            errors["read"] += failed
+
+    def writer(seed: int):
+        rng = random.Random(seed)
+        own, failed = [], 0
+        while not stop.is_set():
+            sale = schemas.SaleCreate(product_id=rng.choice(ids), quantity_sold=1,
+                                      sale_date=_START + timedelta(days=rng.randrange(_DAYS)), total_price=10.0)
+            started = time.perf_counter()
+            try:
+                with Session() as db:
+                    db.execute(_decrement_stock, {"product_id": sale.product_id, "sold": sale.quantity_sold})
+                    db.execute(insert(_sales), [sale.model_dump()])
+                    rollup.apply_sales(db, added=[sale])
+                    db.commit()
+            except OperationalError:
+                failed += 1
+                continue
+            own.append(time.perf_counter() - started)
+        with lock:
+            latencies["write"] += own
+            errors["write"] += failed
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(1000 + i,)) for i in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+
+    result = {"profile": profile}
+    for kind in ("read", "write"):
+        values = latencies[kind]
+        result[kind] = {
+            "per_sec": len(values) / elapsed,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "errors": errors[kind],
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare engine profiles under a mixed read/write load.")
+    parser.add_argument("--profiles", nargs="+", choices=list(DB_PROFILES), default=list(DB_PROFILES))
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--sales", type=int, default=200000, help="sales to seed the scratch database with")
+    parser.add_argument("--url", help="scratch database to use instead of a temporary SQLite file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="dbbench-") as tmp:
+        if args.url is None:
+            seed_path = os.path.join(tmp, "seed.db")
+            # seeded in rollback-journal mode so every profile starts from the same single file
+            seed(f"sqlite:///{seed_path}", "legacy", args.products, args.sales)
+        else:
+            seed(args.url, "legacy", args.products, args.sales)
+
+        print(f"{args.readers} readers, {args.writers} writers, {args.seconds:g}s per profile")
+        print(f"{'profile':<10} {'reads/s':>9} {'p50':>8} {'p99':>9} {'writes/s':>9} {'p50':>8} {'p99':>9} {'errors':>7}")
+        for profile in args.profiles:
+            url = args.url
+            if url is None:
+                path = os.path.join(tmp, f"{profile}.db")
+                shutil.copyfile(seed_path, path)
+                url = f"sqlite:///{path}"
+            r = run(url, profile, args.readers, args.writers, args.seconds)
+            read, write = r["read"], r["write"]
+            print(f"{profile:<10} {read['per_sec']:>9.0f} {read['p50_ms']:>6.1f}ms {read['p99_ms']:>7.1f}ms "
+                  f"{write['per_sec']:>9.0f} {write['p50_ms']:>6.1f}ms {write['p99_ms']:>7.1f}ms "
+                  f"{read['errors'] + write['errors']:>7}")
+
+if __name__ == "__main__":
+    main()
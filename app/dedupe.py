@@ -0,0 +1,74 @@
+"""
+Resolve duplicate product names, so the unique index ux_products_name can be created.
+
+The API refuses to start while product names are duplicated. This migration makes
+them unique, once, after the duplicates have been reviewed:
+- a duplicate identical to the first product of its name, and without sales, is deleted
+- any other duplicate is kept and renamed to "<name> (#<id>)"
+
+Every change is printed. ``--dry-run`` prints them without applying them.
+
+    python -m app.dedupe [--dry-run]
+"""
+import argparse
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.engine import Connection
+
+from . import models
+from .database import engine
+
+_products = models.Product.__table__
+
+
+def duplicate_names(conn: Connection) -> list:
+    """Product names held by more than one product."""
+    return list(conn.scalars(
+        select(_products.c.name).group_by(_products.c.name).having(func.count() > 1).order_by(_products.c.name)
+    ))
+
+
+def dedupe_product_names(conn: Connection) -> list:
+    """Delete or rename duplicate products (see the module docstring); a line per change."""
+    rows = conn.execute(
+        select(_products).where(_products.c.name.in_(duplicate_names(conn))).order_by(_products.c.id)
+    ).all()
+    if not rows:
+        return []
+    sold = set(conn.scalars(select(models.Sale.product_id).where(models.Sale.product_id.in_([r.id for r in rows]))))
+    changes = []
+    first = {}
+    for row in rows:
+        kept = first.setdefault(row.name, row)
+        if kept is row:
+            continue
+        if row.id not in sold and {**row._mapping, "id": kept.id} == dict(kept._mapping):
+            conn.execute(delete(_products).where(_products.c.id == row.id))
+            changes.append(f"Deleted product {row.id}, a duplicate of product {kept.id} ({row.name!r})")
+        else:
+            renamed = f"{row.name} (#{row.id})"
+            conn.execute(update(_products).where(_products.c.id == row.id).values(name=renamed))
+            changes.append(f"Renamed product {row.id} from {row.name!r} to {renamed!r}")
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Make product names unique so ux_products_name can be created.")
+    parser.add_argument("--dry-run", action="store_true", help="print the changes without applying them")
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        changes = dedupe_product_names(conn)
+        for change in changes:
+            print(change)
+        if args.dry_run:
+            conn.rollback()
+            print(f"Dry run, nothing changed: {len(changes)} changes listed.")
+            return
+        conn.commit()
+    print(f"Applied {len(changes)} changes; product names are unique.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Micro-batched query embedding.
+
+``EmbeddingBatcher`` puts submitted texts on an in-process queue. One worker
+thread takes whatever arrives within ``max_wait_ms`` of the first text (or up
+to ``max_batch`` texts) and encodes them in a single call, so N concurrent
+/rag/ask requests cost one batched forward pass instead of N batch-of-one
+passes, and no request thread sits in the model. Each submitter gets a future
+resolved with its own embedding.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+RAG_EMBED_MAX_BATCH = int(os.getenv("RAG_EMBED_MAX_BATCH", "64"))
+RAG_EMBED_MAX_WAIT_MS = float(os.getenv("RAG_EMBED_MAX_WAIT_MS", "5"))
+
+_STOP = object()
+
+# encode(texts) -> one embedding (list of floats) per text, in order
+Encoder = Callable[[list], list]
+
+
+class EmbeddingBatcher:
+    def __init__(self, encode: Encoder, max_batch: int = 64, max_wait_ms: float = 5):
+        self.encode = encode
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.failed_batches = 0
+        self.max_batch_seen = 0
+        self.max_queue_depth = 0
+        self.encode_seconds = 0.0
+
+    def submit(self, text: str) -> Future:
+        """Queue ``text`` for the next batch; the future resolves to its embedding."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((text, future))
+        depth = self._queue.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+        return future
+
+    def close(self, timeout: float | None = None):
+        """Encode everything already queued, then stop the worker thread."""
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put((_STOP, None))
+            thread.join(timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="query-embedder", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first[0] is _STOP:
+                return
+            batch = [first]
+            stop = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry[0] is _STOP:
+                    stop = True
+                    break
+                batch.append(entry)
+            try:
+                self._process(batch)
+            except Exception as e:
+                # the thread must outlive a bad batch: every later submit would wait forever
+                logger.exception("Query embedder failed on a batch of %d queries", len(batch))
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            if stop:
+                return
+
+    def _process(self, batch: list):
+        # submitters that were cancelled (e.g. a client disconnected) are dropped; the
+        # others can no longer be cancelled, so resolving their futures can't fail
+        batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        texts = [text for text, _ in batch]
+        futures = [future for _, future in batch]
+        started = time.perf_counter()
+        try:
+            embeddings = self.encode(texts)
+            if len(embeddings) != len(texts):
+                raise ValueError(f"encoder returned {len(embeddings)} embeddings for {len(texts)} texts")
+        except Exception as e:
+            logger.exception("Encoding a batch of %d queries failed", len(batch))
+            with self._stats_lock:
+                self.failed_batches += 1
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        with self._stats_lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            self.encode_seconds += time.perf_counter() - started
+        for future, embedding in zip(futures, embeddings):
+            future.set_result(embedding)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "running": self._thread is not None,
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "batches": self.batches,
+                "items": self.items,
+                "failed_batches": self.failed_batches,
+                "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+                "max_batch_size": self.max_batch_seen,
+                "avg_encode_ms": self.encode_seconds / self.batches * 1000 if self.batches else 0.0,
+            }
@@ -0,0 +1,70 @@
+"""
+Streaming NDJSON / CSV exports.
+
+Rows are fetched from the database in chunks (``yield_per`` -> server-side
+cursor where the driver supports it) and written to the response as each chunk
+arrives, so memory stays flat regardless of table size.
+"""
+import csv
+import io
+import json
+from typing import Literal
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select, select
+
+from . import models, replica
+
+ExportFormat = Literal["ndjson", "csv"]
+
+EXPORT_CHUNK_SIZE = 2000
+
+_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def products_query() -> Select:
+    p = models.Product
+    return select(p.id, p.name, p.Brand, p.category, p.price, p.quantity, p.expiry_date).order_by(p.id)
+
+
+def sales_query() -> Select:
+    s = models.Sale
+    return select(s.id, s.product_id, s.quantity_sold, s.sale_date, s.total_price).order_by(s.id)
+
+
+def _iter_export(stmt: Select, fmt: str, chunk_size: int):
+    # the request-scoped session is closed before the body is streamed, so use our own
+    with replica.read_session() as db:
+        result = db.execute(stmt.execution_options(yield_per=chunk_size))
+        columns = list(result.keys())
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if fmt == "csv" else None
+        if writer is not None:
+            writer.writerow(columns)
+
+        for rows in result.partitions():
+            if writer is not None:
+                writer.writerows(rows)
+            else:
+                for row in rows:
+                    buffer.write(json.dumps(dict(zip(columns, row)), default=str))
+                    buffer.write("\n")
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+        # header-only CSV / empty NDJSON
+        if buffer.tell():
+            yield buffer.getvalue()
+
+
+def export_response(stmt: Select, fmt: ExportFormat, filename: str, chunk_size: int = EXPORT_CHUNK_SIZE) -> StreamingResponse:
+    """Stream the rows of ``stmt`` as NDJSON or CSV."""
+    return StreamingResponse(
+        _iter_export(stmt, fmt, chunk_size),
+        media_type=_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
@@ -0,0 +1,173 @@
+"""
+Group commit for single-item writes.
+
+``GroupCommitWriter`` puts submitted items on an in-process queue. A writer
+thread takes whatever arrives within ``max_wait_ms`` of the first item (or up
+to ``max_batch`` items), hands the batch to a handler inside one session and
+commits once, so N concurrent requests cost one commit (one fsync on SQLite)
+instead of N. Each submitter gets a future resolved with its own result or
+exception.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+SALES_GROUP_COMMIT = os.getenv("SALES_GROUP_COMMIT", "").lower() in ("1", "true", "yes", "on")
+SALES_GROUP_COMMIT_MAX_BATCH = int(os.getenv("SALES_GROUP_COMMIT_MAX_BATCH", "200"))
+SALES_GROUP_COMMIT_MAX_WAIT_MS = float(os.getenv("SALES_GROUP_COMMIT_MAX_WAIT_MS", "5"))
+
+# upper bounds of the batch size histogram buckets
+_BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+_STOP = object()
+
+# handler(db, items) -> one result or Exception per item, in order. It must not
+# commit; an exception raised by the handler itself fails the whole batch.
+BatchHandler = Callable[[Session, list], list]
+
+
+class GroupCommitWriter:
+    def __init__(self, handler: BatchHandler, max_batch: int = 200, max_wait_ms: float = 5, on_commit: Callable | None = None):
+        self.handler = handler
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.on_commit = on_commit
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.failed_items = 0
+        self.failed_batches = 0
+        self.max_queue_depth = 0
+        self.commit_seconds = 0.0
+        self.histogram = {bound: 0 for bound in _BATCH_BUCKETS}
+        self.histogram_overflow = 0
+
+    def submit(self, item) -> Future:
+        """Queue ``item`` for the next batch; the future resolves after its commit."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future))
+        depth = self._queue.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+        return future
+
+    def close(self, timeout: float | None = None):
+        """Commit everything already queued, then stop the writer thread."""
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put((_STOP, None))
+            thread.join(timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="group-commit-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first[0] is _STOP:
+                return
+            batch = [first]
+            stop = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry[0] is _STOP:
+                    stop = True
+                    break
+                batch.append(entry)
+            try:
+                self._process(batch)
+            except Exception as e:
+                # the thread must outlive a bad batch: every later submit would wait forever
+                logger.exception("Group commit writer failed on a batch of %d items", len(batch))
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            if stop:
+                return
+
+    def _process(self, batch: list):
+        # submitters that were cancelled (e.g. a client disconnected) are dropped; the
+        # others can no longer be cancelled, so resolving their futures can't fail
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        items = [item for item, _ in batch]
+        futures = [future for _, future in batch]
+        started = time.perf_counter()
+        try:
+            with SessionLocal() as db:
+                outcomes = self.handler(db, items)
+                db.commit()
+        except Exception as e:
+            logger.exception("Group commit of %d items failed", len(batch))
+            outcomes = [e] * len(batch)
+            self._record(len(batch), len(batch), time.perf_counter() - started, failed_batch=True)
+        else:
+            failed = sum(isinstance(o, Exception) for o in outcomes)
+            self._record(len(batch), failed, time.perf_counter() - started)
+            if self.on_commit is not None and failed < len(batch):
+                self.on_commit()
+
+        for future, outcome in zip(futures, outcomes):
+            if isinstance(outcome, Exception):
+                future.set_exception(outcome)
+            else:
+                future.set_result(outcome)
+
+    def _record(self, size: int, failed: int, seconds: float, failed_batch: bool = False):
+        with self._stats_lock:
+            self.batches += 1
+            self.items += size
+            self.failed_items += failed
+            self.failed_batches += failed_batch
+            self.commit_seconds += seconds
+            for bound in _BATCH_BUCKETS:
+                if size <= bound:
+                    self.histogram[bound] += 1
+                    break
+            else:
+                self.histogram_overflow += 1
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            histogram = {f"<={bound}": count for bound, count in self.histogram.items()}
+            histogram[f">{_BATCH_BUCKETS[-1]}"] = self.histogram_overflow
+            return {
+                "running": self._thread is not None,
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "batches": self.batches,
+                "items": self.items,
+                "failed_items": self.failed_items,
+                "failed_batches": self.failed_batches,
+                "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+                "avg_batch_ms": self.commit_seconds / self.batches * 1000 if self.batches else 0.0,
+                "batch_size_histogram": histogram,
+            }
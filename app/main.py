@@ -1,11 +1,30 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from .database import engine
-from . import models
+from .database import async_engine, read_async_engine, engine, SessionLocal
+from . import dedupe, models, replica, rollup, search, vector_index
 from .routers import auth, registration, products, sales, dashboard, RAG
 from fastapi.middleware.cors import CORSMiddleware
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # change capture is only installed when the sync worker starts here, with the RAG stack
+    if RAG.RAG_WARMUP or vector_index.RAG_INDEX_SYNC:
+        RAG.start_warmup()
+    yield
+    RAG.query_embedder.close()
+    if sales._sale_writer is not None:
+        # commits the sales still queued
+        sales._sale_writer.close()
+    vector_index.sync_worker.close()
+    replica.close()
+    # pooled aiosqlite connections each own a non-daemon thread that would keep the process alive
+    await async_engine.dispose()
+    if read_async_engine is not async_engine:
+        await read_async_engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -13,8 +32,28 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Granularity"],
 )
 models.Base.metadata.create_all(bind=engine)
+with engine.connect() as conn:
+    _duplicates = dedupe.duplicate_names(conn)
+if _duplicates:
+    # resolving them deletes or renames products: that is for someone to review, not for startup to do
+    raise RuntimeError(
+        f"Duplicate product names ({len(_duplicates)}, e.g. {_duplicates[0]!r}): "
+        "the unique index ux_products_name can't be created. Review them with "
+        "`python -m app.dedupe --dry-run`, then resolve them with `python -m app.dedupe`."
+    )
+# create_all() skips indexes on tables that already exist, so add any new ones here
+for table in models.Base.metadata.sorted_tables:
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
+search.ensure_search_index(engine)
+if vector_index.RAG_INDEX_SYNC:
+    vector_index.ensure_change_capture(engine)
+
+with SessionLocal() as db:
+    rollup.ensure_populated(db)
 
 app.include_router(registration.router)
 app.include_router(auth.router)
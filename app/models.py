@@ -1,5 +1,5 @@
 from .database import Base
-from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Date, DateTime, Boolean, Text, ForeignKey, Index, func
 from sqlalchemy.orm import relationship
 
 class User(Base):
@@ -13,7 +13,7 @@ class Product(Base):
     __tablename__ = 'products'
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     name = Column(String, index=True)
-    Brand = Column(String)
+    Brand = Column(String, index=True)
     category = Column(String, index=True)
     price = Column(Float)
     cost_price = Column(Float)
@@ -21,6 +21,16 @@ class Product(Base):
     expiry_date = Column(Date)
     sales = relationship("Sale", back_populates="product")
 
+    __table_args__ = (
+        # product names are the business key used by CSV import and bulk upsert
+        Index("ux_products_name", "name", unique=True),
+        # low-stock and expiry alerts; partial where the backend supports it
+        Index("ix_products_quantity", "quantity",
+              sqlite_where=quantity.is_not(None), postgresql_where=quantity.is_not(None)),
+        Index("ix_products_expiry_date", "expiry_date",
+              sqlite_where=expiry_date.is_not(None), postgresql_where=expiry_date.is_not(None)),
+    )
+
 class Sale(Base):
     __tablename__ = 'sales'
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
@@ -28,4 +38,61 @@ class Sale(Base):
     quantity_sold = Column(Integer)
     sale_date = Column(Date)
     total_price = Column(Float)
-    product = relationship("Product", back_populates="sales")
\ No newline at end of file
+    product = relationship("Product", back_populates="sales")
+
+    __table_args__ = (
+        Index("ix_sales_sale_date", "sale_date"),
+        Index("ix_sales_product_id_sale_date", "product_id", "sale_date"),
+    )
+
+class SalesDailyRollup(Base):
+    __tablename__ = 'sales_daily_rollup'
+    sale_date = Column(Date, primary_key=True)
+    product_id = Column(Integer, ForeignKey('products.id'), primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+    order_count = Column(Integer, nullable=False, default=0)
+
+class ImportCheckpoint(Base):
+    # progress of a resumable bulk import (see app/backfill.py), committed with each chunk
+    __tablename__ = 'import_checkpoints'
+    source = Column(String, primary_key=True)
+    byte_offset = Column(BigInteger, nullable=False, default=0)
+    rows_read = Column(Integer, nullable=False, default=0)
+    rows_imported = Column(Integer, nullable=False, default=0)
+    rows_rejected = Column(Integer, nullable=False, default=0)
+    # JSON {product_id: quantity sold} not yet applied to Product.quantity
+    stock_deltas = Column(Text)
+    completed = Column(Boolean, nullable=False, default=False)
+
+class ReplicaHeartbeat(Base):
+    # single row the primary rewrites every second; its age on the replica is the replication lag (see app/replica.py)
+    __tablename__ = 'replica_heartbeat'
+    id = Column(Integer, primary_key=True)
+    written_at = Column(Float, nullable=False)  # unix time on the primary
+
+class IndexOutbox(Base):
+    # vector index documents changed since the worker last synced, written by triggers (see app/vector_index.py)
+    __tablename__ = 'index_outbox'
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    doc_id = Column(String, nullable=False)
+    changed_at = Column(DateTime, nullable=False, server_default=func.current_timestamp())
+
+class IndexWatermark(Base):
+    # last outbox change applied to a vector collection, and when
+    __tablename__ = 'index_watermarks'
+    collection = Column(String, primary_key=True)
+    outbox_id = Column(BigInteger, nullable=False, default=0)
+    synced_at = Column(DateTime)
+
+class IndexBuildCheckpoint(Base):
+    # progress of a full vector index build (see app/vector_index.py), committed every few batches
+    __tablename__ = 'index_build_checkpoints'
+    collection = Column(String, primary_key=True)
+    outbox_id = Column(BigInteger, nullable=False, default=0)  # changes up to here are reflected in the build
+    last_product_id = Column(Integer, nullable=False, default=0)
+    last_sale_id = Column(Integer, nullable=False, default=0)
+    docs_indexed = Column(BigInteger, nullable=False, default=0)
+    build_seconds = Column(Float, nullable=False, default=0)
+    started_at = Column(DateTime)
+    completed = Column(Boolean, nullable=False, default=False)
@@ -1,9 +1,12 @@
 from jose import JWTError, jwt
 from dotenv import load_dotenv
+import hashlib
 import os
+import time
 from datetime import datetime, timedelta
-from . import schemas, models, database
-from sqlalchemy.orm import Session
+from . import schemas, models, database, cache
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends, status, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 
@@ -28,24 +31,35 @@ def create_access_token(data:dict):
 
     return encoded_jwt
 
-def verify_token(token:str,credentials_exception):
+def _decode_token(token: str, credentials_exception) -> dict:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        # token is created with key "user_id" in auth.login
-        id: str = payload.get("user_id") or payload.get("users_id")
-
-        if id is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(id=id)
-        return token_data
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
         raise credentials_exception
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+def _token_data(payload: dict, credentials_exception) -> schemas.TokenData:
+    # token is created with key "user_id" in auth.login
+    id: str = payload.get("user_id") or payload.get("users_id")
+
+    if id is None:
+        raise credentials_exception
+    return schemas.TokenData(id=id)
+
+def verify_token(token:str,credentials_exception):
+    return _token_data(_decode_token(token, credentials_exception), credentials_exception)
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_async_db)):
+    # a hit skips both the signature check and the user query
+    cache_key = hashlib.sha256(token.encode()).hexdigest()
+    user = cache.principal_cache.get(cache_key)
+    if user is not cache.MISSING:
+        return user
+
     credential_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                                         detail=f"Could not validate credentials",
                                         headers={"WWW-Authenticate":"Bearer"})
-    token_data = verify_token(token, credential_exception)
+    payload = _decode_token(token, credential_exception)
+    token_data = _token_data(payload, credential_exception)
 
     # token_data.id should be the user id
     try:
@@ -53,9 +67,24 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except Exception:
         user_id = token_data.id
 
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    user = (await db.execute(select(models.User).where(models.User.id == user_id))).scalars().first()
     if user is None:
         raise credential_exception
+
+    # never cache a principal past its token's expiry
+    ttl = cache.principal_cache.ttl
+    if "exp" in payload:
+        remaining = payload["exp"] - time.time()
+        ttl = remaining if ttl is None else min(ttl, remaining)
+    if ttl is None or ttl > 0:
+        # detach it: the cached instance outlives this request's session
+        db.expunge(user)
+        cache.principal_cache.set(cache_key, user, ttl)
     return user
 
 
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_principals(mapper, connection, target):
+    # user changes are rare, so drop everything rather than track tokens per user
+    cache.principal_cache.clear()
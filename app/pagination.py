@@ -0,0 +1,62 @@
+"""
+Opaque keyset-pagination cursors.
+
+A cursor is the sort key of the last row of a page (e.g. ``[id]`` or
+``[sale_date, id]``) serialized as url-safe base64 JSON. The next page is
+fetched with ``WHERE key > cursor ORDER BY key LIMIT n``, which is an index
+seek, so deep pages cost the same as the first one.
+"""
+import base64
+import binascii
+import json
+from datetime import date
+
+from fastapi import HTTPException, Response, status
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, date) else v for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, kinds: tuple) -> list:
+    """Decode a cursor whose values must match ``kinds`` (e.g. ``(date, int)``)."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if not isinstance(values, list) or len(values) != len(kinds):
+            raise ValueError("cursor shape")
+        decoded = []
+        for value, kind in zip(values, kinds):
+            if kind is date:
+                value = date.fromisoformat(value)
+            elif not isinstance(value, kind):
+                raise ValueError("cursor type")
+            decoded.append(value)
+        return decoded
+    except (binascii.Error, TypeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def _page(rows: list, limit: int, response: Response, cursor_key) -> list:
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*cursor_key(rows[-1]))
+    return rows
+
+
+def paginate(query, limit: int, response: Response, cursor_key):
+    """
+    Run ``query`` (already filtered and ordered by the keyset) for one page and
+    set the next-page cursor header when more rows exist.
+    """
+    return _page(query.limit(limit + 1).all(), limit, response, cursor_key)
+
+
+async def paginate_async(db: AsyncSession, stmt: Select, limit: int, response: Response, cursor_key):
+    """``paginate`` for a select() of ORM entities on an AsyncSession."""
+    rows = (await db.execute(stmt.limit(limit + 1))).scalars().all()
+    return _page(list(rows), limit, response, cursor_key)
@@ -0,0 +1,133 @@
+"""
+Query plans and latency of the sales/product access paths on a large table.
+
+Seeds a scratch SQLite database with ``--sales`` sales (default 1M) over about
+five years and ``--products`` products. Each access path is then timed twice:
+- "before": the predicate as it used to be written (the date column wrapped in
+  date()/strftime()), without the sales/products indexes
+- "after": the half-open range predicate the app uses now, with the indexes
+  declared in app/models.py
+
+Both are timed as the mean of ``--repeat`` runs, and the plan of each
+(EXPLAIN QUERY PLAN) is printed.
+
+    python -m app.querybench [--sales 1000000] [--products 2000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine
+
+from . import models
+
+# the indexes the "before" run goes without
+_ACCESS_INDEXES = ("ix_sales_sale_date", "ix_sales_product_id_sale_date", "ix_products_quantity", "ix_products_expiry_date")
+
+_START = date(2022, 1, 1)
+_DAYS = 1750
+_DAY = date(2024, 6, 3)
+
+# name -> (before sql, after sql, before params, after params)
+_QUERIES = {
+    "sales of a day": (
+        "SELECT sum(total_price) FROM sales WHERE date(sale_date) = ?",
+        "SELECT sum(total_price) FROM sales WHERE sale_date >= ? AND sale_date < ?",
+        (_DAY.isoformat(),), (_DAY.isoformat(), (_DAY + timedelta(days=1)).isoformat()),
+    ),
+    "sales of a month": (
+        "SELECT sum(total_price) FROM sales WHERE CAST(strftime('%m', sale_date) AS INTEGER) = ? "
+        "AND CAST(strftime('%Y', sale_date) AS INTEGER) = ?",
+        "SELECT sum(total_price) FROM sales WHERE sale_date >= ? AND sale_date < ?",
+        (_DAY.month, _DAY.year), ("2024-06-01", "2024-07-01"),
+    ),
+    "product, half year": (
+        "SELECT sum(total_price) FROM sales WHERE product_id = ? AND date(sale_date) BETWEEN ? AND ?",
+        "SELECT sum(total_price) FROM sales WHERE product_id = ? AND sale_date >= ? AND sale_date < ?",
+        (42, "2024-01-01", "2024-06-30"), (42, "2024-01-01", "2024-07-01"),
+    ),
+    "low stock": (
+        "SELECT count(*) FROM products WHERE quantity <= ?",
+        "SELECT count(*) FROM products WHERE quantity <= ?",
+        (10,), (10,),
+    ),
+    "expiring": (
+        "SELECT count(*) FROM products WHERE expiry_date <= ?",
+        "SELECT count(*) FROM products WHERE expiry_date <= ?",
+        ("2026-02-01",), ("2026-02-01",),
+    ),
+}
+
+
+def seed(path: str, products: int, sales: int):
+    """Create the app's schema at ``path`` and fill it, without the access indexes."""
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    engine.dispose()
+    conn = sqlite3.connect(path)
+    for name in _ACCESS_INDEXES:
+        conn.execute(f"DROP INDEX {name}")
+    rng = random.Random(1)
+    conn.executemany(
+        "INSERT INTO products (id, name, quantity, expiry_date, price) VALUES (?, ?, ?, ?, ?)",
+        ((i, f"bench product {i}", rng.randint(0, 500),
+          (date(2026, 1, 1) + timedelta(days=rng.randint(0, 1500))).isoformat(), 10.0)
+         for i in range(1, products + 1)),
+    )
+    conn.executemany(
+        "INSERT INTO sales (product_id, quantity_sold, sale_date, total_price) VALUES (?, 1, ?, 10.0)",
+        ((rng.randint(1, products), (_START + timedelta(days=rng.randrange(_DAYS))).isoformat())
+         for _ in range(sales)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def _time(conn: sqlite3.Connection, sql: str, params: tuple, repeat: int):
+    """(mean ms, query plan) of ``sql``."""
+    plan = " | ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+    started = time.perf_counter()
+    for _ in range(repeat):
+        conn.execute(sql, params).fetchall()
+    return (time.perf_counter() - started) / repeat * 1000, plan
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare query plans and latency before/after the sales and product indexes.")
+    parser.add_argument("--sales", type=int, default=1_000_000)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="querybench-") as tmp:
+        path = os.path.join(tmp, "querybench.db")
+        started = time.perf_counter()
+        seed(path, args.products, args.sales)
+        print(f"seeded {args.sales:,} sales, {args.products:,} products in {time.perf_counter() - started:.1f}s")
+
+        conn = sqlite3.connect(path)
+        before = {name: _time(conn, q[0], q[2], args.repeat) for name, q in _QUERIES.items()}
+        conn.close()
+
+        engine = create_engine(f"sqlite:///{path}")
+        for table in (models.Sale.__table__, models.Product.__table__):
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
+        engine.dispose()
+        conn = sqlite3.connect(path)
+        conn.execute("ANALYZE")
+        after = {name: _time(conn, q[1], q[3], args.repeat) for name, q in _QUERIES.items()}
+        conn.close()
+
+    print(f"{'query':<20} {'before':>10} {'after':>10}  plan before -> after")
+    for name in _QUERIES:
+        (before_ms, before_plan), (after_ms, after_plan) = before[name], after[name]
+        print(f"{name:<20} {before_ms:>8.2f}ms {after_ms:>8.2f}ms  {before_plan} -> {after_plan}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Load benchmark for POST /rag/ask/.
+
+Seeds a scratch SQLite database, imports the app against it and replaces the
+Gemini model with a local stub that answers after ``--llm-ms``. The vector index
+is built with the configured embedder. Then ``--users`` concurrent clients send
+questions back to back for ``--seconds``. Requests go through the ASGI app in
+process (httpx), so the event loop, threadpool, embedding batcher and LLM
+semaphore are the real ones; only the network hop is skipped.
+
+    python -m app.ragbench [--users 50] [--seconds 20] [--llm-ms 300] [--distinct 0]
+
+With ``--distinct 0`` every question is unique, so the answer and embedding
+caches never answer one; ``--distinct N`` cycles through N questions instead.
+"""
+import argparse
+import asyncio
+import os
+import time
+import types
+from datetime import date, timedelta
+
+from sqlalchemy import insert
+
+from . import bench
+
+
+class StubLLM:
+    """Stands in for genai.GenerativeModel: a fixed answer after a fixed latency."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def generate_content_async(self, prompt: str):
+        await asyncio.sleep(self.latency)
+        return types.SimpleNamespace(text="stub answer")
+
+
+def seed(engine, products: int, sales: int):
+    from . import models
+
+    with engine.begin() as conn:
+        conn.execute(insert(models.Product), [
+            {"name": f"bench product {i}", "Brand": f"brand {i % 15}", "category": f"cat {i % 20}",
+             "price": 10.0 + i % 50, "cost_price": 6.0, "quantity": 100 + i, "expiry_date": None}
+            for i in range(1, products + 1)
+        ])
+        conn.execute(insert(models.Sale), [
+            {"product_id": 1 + i % products, "quantity_sold": 1 + i % 5,
+             "sale_date": date(2024, 1, 1) + timedelta(days=i % 365), "total_price": 10.0 + i % 90}
+            for i in range(sales)
+        ])
+
+
+async def run(users: int, seconds: float, llm_latency: float, distinct: int, products: int, sales: int) -> dict:
+    app = bench.load_app()
+    from . import database
+    from .routers import RAG
+
+    seed(database.engine, products, sales)
+    RAG._llm, RAG._llm_checked = StubLLM(llm_latency), True
+
+    latencies, errors, counter = [], 0, 0
+
+    def next_question() -> str:
+        nonlocal counter
+        counter += 1
+        n = counter % distinct if distinct else counter
+        return f"How is bench product {1 + n % products} selling, case {n}?"
+
+    async def user(client, deadline):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await client.post("/rag/ask/", json={"question": next_question(), "k": 4})
+            latencies.append(time.perf_counter() - started)
+            errors += response.status_code != 200
+
+    async with bench.serve(app, "ragbench") as client:
+        # loads the embedder and builds the index; not part of the measurement
+        started = time.perf_counter()
+        await client.post("/rag/ask/", json={"question": "warmup", "k": 4})
+        warmup = time.perf_counter() - started
+
+        started = time.perf_counter()
+        deadline = started + seconds
+        await asyncio.gather(*(user(client, deadline) for _ in range(users)))
+        elapsed = time.perf_counter() - started
+        stats = (await client.get("/rag/cache-stats")).json()
+
+    return {
+        "warmup_seconds": warmup,
+        "requests": len(latencies),
+        "per_sec": len(latencies) / elapsed,
+        "p50_ms": bench.percentile(latencies, 50) * 1000,
+        "p95_ms": bench.percentile(latencies, 95) * 1000,
+        "p99_ms": bench.percentile(latencies, 99) * 1000,
+        "errors": errors,
+        "stats": stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test POST /rag/ask/ with a stub LLM.")
+    parser.add_argument("--users", type=int, default=50, help="concurrent clients")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--llm-ms", type=float, default=300, help="stub LLM latency per answer")
+    parser.add_argument("--distinct", type=int, default=0, help="distinct questions (0: every question is new)")
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--sales", type=int, default=5000)
+    args = parser.parse_args()
+
+    with bench.scratch_app("ragbench") as tmp:
+        cwd = os.getcwd()
+        # keeps the RAG stack's ./chroma_db out of the working tree
+        os.chdir(tmp)
+        try:
+            r = asyncio.run(run(args.users, args.seconds, args.llm_ms / 1000, args.distinct, args.products, args.sales))
+        finally:
+            os.chdir(cwd)
+
+    embedder, llm = r["stats"]["query_embedder"], r["stats"]["llm"]
+    print(f"{args.users} users, {args.seconds:g}s, stub LLM {args.llm_ms:g}ms (index build/warmup {r['warmup_seconds']:.1f}s)")
+    print(f"  {r['requests']} requests, {r['per_sec']:.1f} req/s, {r['errors']} errors")
+    print(f"  latency p50 {r['p50_ms']:.0f}ms  p95 {r['p95_ms']:.0f}ms  p99 {r['p99_ms']:.0f}ms")
+    print(f"  query embedding: {embedder['batches']} batches, avg {embedder['avg_batch_size']:.1f} / max "
+          f"{embedder['max_batch_size']} questions, {embedder['avg_encode_ms']:.1f}ms per batch")
+    print(f"  LLM: {llm['calls']} calls, max {llm['max_in_flight']} in flight (limit {llm['concurrency']})")
+    print(f"  answer cache hit rate {r['stats']['answer_cache']['hit_rate']:.0%}, "
+          f"{r['stats']['coalescing']['coalesced']} coalesced")
+
+
+if __name__ == "__main__":
+    main()
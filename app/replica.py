@@ -0,0 +1,178 @@
+"""
+Read routing for analytics and listings.
+
+With READ_DATABASE_URL set, dashboards, list/search/export endpoints and the
+RAG index build read from that replica instead of the primary. Replication
+itself happens outside the app (streaming replication, litestream, a periodic
+file copy, ...).
+
+Lag is measured with a heartbeat: a background thread rewrites the single
+``replica_heartbeat`` row on the primary every REPLICA_HEARTBEAT_SECONDS and
+reads it back from the replica; the age of the replica's copy is the lag.
+While it exceeds REPLICA_MAX_LAG_SECONDS, or the replica can't be read, read
+sessions go to the primary. Without a replica URL they always do.
+"""
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import select
+
+from . import models
+from .database import READ_DATABASE_URL, AsyncReadSessionLocal, AsyncSessionLocal, ReadSessionLocal, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_HEARTBEAT_SECONDS = float(os.getenv("REPLICA_HEARTBEAT_SECONDS", "1"))
+
+
+class ReplicaMonitor:
+    def __init__(self, interval: float = 1, max_lag: float = 5):
+        self.interval = interval
+        self.max_lag = max_lag
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.lag = None                 # seconds; None until a check succeeds
+        self.replica_written_at = None  # primary time of the newest heartbeat the replica has
+        self.checked_at = None          # time.monotonic() of the last successful check
+        self.error = None
+        self.checks = 0
+        self.failed_checks = 0
+        self.replica_sessions = 0
+        self.primary_sessions = 0
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="replica-monitor", daemon=True)
+                self._thread.start()
+
+    def close(self):
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def _run(self):
+        while True:
+            self.check()
+            if self._stop.wait(self.interval):
+                return
+
+    def check(self):
+        """Write a heartbeat on the primary and read the replica's copy of it back."""
+        was_usable = self.usable_now()
+        self.checks += 1
+        try:
+            with SessionLocal() as db:
+                db.merge(models.ReplicaHeartbeat(id=1, written_at=time.time()))
+                db.commit()
+            with ReadSessionLocal() as db:
+                written_at = db.scalar(select(models.ReplicaHeartbeat.written_at).where(models.ReplicaHeartbeat.id == 1))
+        except Exception as e:
+            self.failed_checks += 1
+            self.lag, self.error = None, str(e)
+            if was_usable:
+                logger.warning("Read replica unavailable, reading from the primary: %s", e)
+            return
+
+        self.error = None
+        self.replica_written_at = written_at
+        self.lag = max(0.0, time.time() - written_at) if written_at is not None else None
+        self.checked_at = time.monotonic()
+        if was_usable and not self.usable_now():
+            logger.warning("Read replica lag %s s exceeds %s s, reading from the primary",
+                           None if self.lag is None else round(self.lag, 2), self.max_lag)
+        elif not was_usable and self.usable_now():
+            logger.info("Read replica in use (lag %.2f s)", self.lag)
+
+    def usable_now(self) -> bool:
+        if self.lag is None or self.checked_at is None:
+            return False
+        # a stalled monitor must not keep vouching for the replica
+        if time.monotonic() - self.checked_at > self.interval * 3 + self.max_lag:
+            return False
+        return self.lag <= self.max_lag
+
+    def usable(self) -> bool:
+        """True if reads may go to the replica; starts the monitor on first use."""
+        self._ensure_started()
+        usable = self.usable_now()
+        if usable:
+            self.replica_sessions += 1
+        else:
+            self.primary_sessions += 1
+        return usable
+
+    def covers(self, when: float) -> bool:
+        """True if the replica has everything the primary committed up to ``when`` (unix time)."""
+        return self.replica_written_at is not None and self.replica_written_at >= when
+
+    def stats(self) -> dict:
+        return {
+            "configured": True,
+            "running": self._thread is not None,
+            "in_use": self.usable_now(),
+            "lag_seconds": self.lag,
+            "max_lag_seconds": self.max_lag,
+            "error": self.error,
+            "checks": self.checks,
+            "failed_checks": self.failed_checks,
+            "replica_sessions": self.replica_sessions,
+            "primary_sessions": self.primary_sessions,
+        }
+
+
+_monitor = ReplicaMonitor(REPLICA_HEARTBEAT_SECONDS, REPLICA_MAX_LAG_SECONDS) if READ_DATABASE_URL else None
+
+
+def read_session():
+    """A Session on the replica when it is fresh enough, otherwise on the primary."""
+    if _monitor is not None and _monitor.usable():
+        db = ReadSessionLocal()
+        db.info["replica"] = True
+        return db
+    return SessionLocal()
+
+
+def async_read_session():
+    """An AsyncSession on the replica when it is fresh enough, otherwise on the primary."""
+    if _monitor is not None and _monitor.usable():
+        db = AsyncReadSessionLocal()
+        db.info["replica"] = True
+        return db
+    return AsyncSessionLocal()
+
+
+def is_fresh(db, since: float) -> bool:
+    """False if ``db`` reads from a replica that may not have the primary's commits up to ``since`` yet."""
+    return not db.info.get("replica") or _monitor.covers(since)
+
+
+def get_read_db():
+    db = read_session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db():
+    async with async_read_session() as db:
+        yield db
+
+
+def stats() -> dict:
+    return _monitor.stats() if _monitor is not None else {"configured": False}
+
+
+def close():
+    if _monitor is not None:
+        _monitor.close()
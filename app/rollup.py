@@ -0,0 +1,133 @@
+"""
+Pre-aggregated daily sales rollup (one row per sale_date x product).
+
+The dashboard reads from ``sales_daily_rollup`` instead of scanning ``sales``,
+so its cost grows with the number of days and products rather than the number
+of individual sales. Every write path that touches ``sales`` must call
+``apply_sales`` inside the same transaction to keep the rollup in sync.
+
+Backfill / repair:  python -m app.rollup rebuild
+"""
+import argparse
+from collections import defaultdict
+from typing import Iterable
+
+from sqlalchemy import delete, func, insert, select, tuple_
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal, engine, upsert_insert
+
+
+def _collect_deltas(added: Iterable, removed: Iterable) -> dict:
+    deltas = defaultdict(lambda: [0, 0.0, 0])
+    for sign, sales in ((1, added), (-1, removed)):
+        for s in sales:
+            if s.sale_date is None or s.product_id is None:
+                continue
+            d = deltas[(s.sale_date, s.product_id)]
+            d[0] += sign * (s.quantity_sold or 0)
+            d[1] += sign * (s.total_price or 0)
+            d[2] += sign
+    return deltas
+
+
+def apply_sales(db: Session, added: Iterable = (), removed: Iterable = ()):
+    """
+    Add ``added`` sales to and subtract ``removed`` sales from the rollup.
+
+    Sales may be ORM rows or schema objects; only sale_date, product_id,
+    quantity_sold and total_price are read. Nothing is committed here, the
+    caller commits together with its own changes to ``sales``.
+    """
+    deltas = _collect_deltas(added, removed)
+    rows = [
+        {"sale_date": day, "product_id": product_id, "quantity": qty, "revenue": revenue, "order_count": orders}
+        for (day, product_id), (qty, revenue, orders) in deltas.items()
+        if qty or revenue or orders
+    ]
+    if not rows:
+        return
+
+    table = models.SalesDailyRollup.__table__
+    insert_fn = upsert_insert(db)
+    if insert_fn is not None:
+        stmt = insert_fn(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.sale_date, table.c.product_id],
+            set_={
+                "quantity": table.c.quantity + stmt.excluded.quantity,
+                "revenue": table.c.revenue + stmt.excluded.revenue,
+                "order_count": table.c.order_count + stmt.excluded.order_count,
+            },
+        )
+        db.execute(stmt, rows)
+    else:
+        for row in rows:
+            bucket = db.get(models.SalesDailyRollup, (row["sale_date"], row["product_id"]))
+            if bucket is None:
+                db.add(models.SalesDailyRollup(**row))
+            else:
+                bucket.quantity += row["quantity"]
+                bucket.revenue += row["revenue"]
+                bucket.order_count += row["order_count"]
+        db.flush()
+
+    # drop buckets whose last sale was removed so they don't show up as zero rows
+    if any(row["order_count"] < 0 for row in rows):
+        keys = [(row["sale_date"], row["product_id"]) for row in rows]
+        db.execute(
+            delete(table)
+            .where(tuple_(table.c.sale_date, table.c.product_id).in_(keys))
+            .where(table.c.order_count <= 0)
+        )
+
+
+def rebuild(db: Session) -> int:
+    """Recompute the whole rollup from ``sales``. Returns the number of buckets written."""
+    table = models.SalesDailyRollup.__table__
+    db.execute(delete(table))
+    aggregated = (
+        select(
+            models.Sale.sale_date,
+            models.Sale.product_id,
+            func.coalesce(func.sum(models.Sale.quantity_sold), 0),
+            func.coalesce(func.sum(models.Sale.total_price), 0),
+            func.count(models.Sale.id),
+        )
+        .where(models.Sale.sale_date.is_not(None))
+        .where(models.Sale.product_id.is_not(None))
+        .group_by(models.Sale.sale_date, models.Sale.product_id)
+    )
+    db.execute(
+        insert(table).from_select(
+            ["sale_date", "product_id", "quantity", "revenue", "order_count"], aggregated
+        )
+    )
+    db.commit()
+    return db.query(func.count()).select_from(table).scalar()
+
+
+def ensure_populated(db: Session):
+    """Backfill the rollup on first start against a database that already has sales."""
+    has_buckets = db.query(models.SalesDailyRollup).first() is not None
+    if not has_buckets and db.query(models.Sale.id).first() is not None:
+        rebuild(db)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the daily sales rollup table.")
+    parser.add_argument("command", choices=["rebuild"], help="rebuild: recompute the rollup from the sales table")
+    parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        buckets = rebuild(db)
+    finally:
+        db.close()
+    print(f"Rebuilt sales rollup: {buckets} day/product buckets.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List, Dict, Any
-import chromadb
-from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import date
 
 from ..database import get_db
-from .. import models, schemas
+from ..replica import get_async_read_db, read_session
+from .. import analytics, cache, embedding, replica, schemas, vector_index
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/rag",
     tags=["rag"],
 )
 
+# chromadb and sentence-transformers (and torch behind it) are imported on first use
+# rather than with this module, so processes that never answer /rag/ask start fast and
+# small. RAG_WARMUP=1 loads them in a background thread at startup instead.
+RAG_WARMUP = os.getenv("RAG_WARMUP", "").lower() in ("1", "true", "yes", "on")
+RAG_LLM_CONCURRENCY = int(os.getenv("RAG_LLM_CONCURRENCY", "4"))
+RAG_LLM_TIMEOUT_SECONDS = float(os.getenv("RAG_LLM_TIMEOUT_SECONDS", "30"))
+
 # Simple, module-level singletons for client, collection and embedder
 _client = None
 _collection = None
@@ -21,164 +34,301 @@ _embedder = None
 _collection_name = "products_sales_collection"
 _chroma_path = "./chroma_db"
 
+_init_lock = threading.Lock()
+_warmup_thread = None
+# set once the collection is known to be built and tracked by the sync worker
+_index_checked = False
+_load_seconds = None
+_load_error = None
+# concurrent identical questions share one embed/retrieve/LLM round
+_answer_flights = cache.SingleFlight()
+# at most RAG_LLM_CONCURRENCY LLM calls in flight; the rest wait here, not in a thread
+_llm_slots = asyncio.Semaphore(RAG_LLM_CONCURRENCY)
+_llm = None
+_llm_checked = False
+_llm_stats = {"calls": 0, "in_flight": 0, "max_in_flight": 0, "waiting": 0, "failures": 0}
+
+
+def _encode_queries(texts: list) -> list:
+    _init_embedding_and_client()
+    return _embedder.encode(texts, convert_to_numpy=True).tolist()
 
-def _init_embedding_and_client():
-    global _client, _embedder, _collection
-    if _embedder is None:
-        # use a lightweight sentence-transformers model already in requirements
-        _embedder = SentenceTransformer("all-MiniLM-L6-v2")
-
-    if _client is None:
-        _client = chromadb.PersistentClient(path=_chroma_path, settings=Settings(anonymized_telemetry=False))
 
-    if _collection is None:
-        try:
-            _collection = _client.get_collection(name=_collection_name)
-        except Exception:
-            _collection = _client.create_collection(name=_collection_name, metadata={"description": "Products and sales"})
+# query embeddings for /rag/ask, batched across concurrent requests
+query_embedder = embedding.EmbeddingBatcher(
+    _encode_queries,
+    max_batch=embedding.RAG_EMBED_MAX_BATCH,
+    max_wait_ms=embedding.RAG_EMBED_MAX_WAIT_MS,
+)
 
 
-def _build_documents_from_db(db: Session) -> List[Dict[str, Any]]:
-    docs = []
+def _init_embedding_and_client():
+    global _client, _embedder, _collection, _load_seconds, _load_error
+    if _embedder is not None and _collection is not None:
+        return
+    with _init_lock:
+        started = time.perf_counter()
+        try:
+            if _embedder is None:
+                from sentence_transformers import SentenceTransformer
+                # use a lightweight sentence-transformers model already in requirements
+                _embedder = SentenceTransformer("all-MiniLM-L6-v2")
+
+            if _client is None:
+                import chromadb
+                from chromadb.config import Settings
+                _client = chromadb.PersistentClient(path=_chroma_path, settings=Settings(anonymized_telemetry=False))
+
+            if _collection is None:
+                try:
+                    _collection = _client.get_collection(name=_collection_name)
+                except Exception:
+                    _collection = _create_collection()
+        except Exception as e:
+            _load_error = str(e)
+            raise
+        _load_error = None
+        if _load_seconds is None:
+            _load_seconds = time.perf_counter() - started
+
+
+def _warmup():
+    try:
+        _init_embedding_and_client()
+        # the first encode initializes the model's kernels; pay for it here rather than in a request
+        _embedder.encode(["warmup"], convert_to_numpy=True)
+        logger.info("RAG stack loaded in %.1fs", _load_seconds)
+        with read_session() as db:
+            _ensure_collection_populated(db)
+    except Exception:
+        logger.exception("RAG warmup failed; it will be retried on the first /rag/ask")
 
-    products = db.query(models.Product).all()
-    for p in products:
-        text = f"Product: {p.name}. Brand: {p.Brand or ''}. Category: {p.category or ''}. Price: {p.price or ''}. Quantity: {p.quantity or ''}."
-        docs.append({"id": f"product_{p.id}", "text": text, "meta": {"type": "product", "product_id": p.id}})
 
-    sales = db.query(models.Sale).all()
-    for s in sales:
-        prod_name = s.product.name if s.product else f"product_id_{s.product_id}"
-        text = f"Sale: Product: {prod_name}. Quantity sold: {s.quantity_sold}. Date: {s.sale_date}. Total: {s.total_price}."
-        docs.append({"id": f"sale_{s.id}", "text": text, "meta": {"type": "sale", "sale_id": s.id, "product_id": s.product_id}})
+def start_warmup():
+    """Load the embedder and vector store in a background thread (idempotent)."""
+    global _warmup_thread
+    if _warmup_thread is None:
+        _warmup_thread = threading.Thread(target=_warmup, name="rag-warmup", daemon=True)
+        _warmup_thread.start()
 
-    return docs
 
+def _create_collection():
+    return _client.create_collection(name=_collection_name, metadata={"description": "Products and sales"})
 
-def _ensure_collection_populated(db: Session):
-    """Initialize chroma client/collection and populate it from the database if empty."""
-    _init_embedding_and_client()
 
-    global _collection
+def _collection_has_data() -> bool:
     # try to check if collection already has data
     try:
         info = _collection.count()
         if info and info > 0:
-            return
+            return True
     except Exception:
         # fallback: attempt to get a single item
         try:
             resp = _collection.get(limit=1)
             if resp and resp.get("ids"):
-                return
+                return True
         except Exception:
             pass
+    return False
 
-    # build docs and add
-    docs = _build_documents_from_db(db)
-    if not docs:
-        return
 
-    ids = [d["id"] for d in docs]
-    documents = [d["text"] for d in docs]
-    metadatas = [d["meta"] for d in docs]
+def build_collection(db: Session, restart: bool = False, **options) -> dict:
+    """
+    Build the collection from the database in streamed batches (see vector_index.build_index),
+    resuming an interrupted build unless ``restart``. Returns the build's totals.
+    """
+    global _collection
+    _init_embedding_and_client()
+    has_data = _collection_has_data()
+    resume = not restart and has_data and vector_index.build_pending(_collection_name)
+    if not resume and has_data:
+        # nothing to resume, so what is there (an index from before change capture) is stale: start over
+        _client.delete_collection(name=_collection_name)
+        _collection = _create_collection()
+        vector_index.sync_worker.collection = _collection
+    return vector_index.build_index(db, _collection, _embedder, restart=not resume, **options)
 
-    # compute embeddings
-    embeddings = _embedder.encode(documents, convert_to_numpy=True).tolist()
 
-    # add to collection
-    _collection.add(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+def _ensure_collection_populated(db: Session):
+    """
+    Initialize chroma client/collection, build it from the database if it is empty,
+    predates change capture or has an unfinished build, and start the worker that
+    keeps it in sync.
+    """
+    global _index_checked
+    _init_embedding_and_client()
+
+    if not _index_checked:
+        with vector_index.index_lock:
+            if not _index_checked:
+                current = _collection_has_data() and not vector_index.build_pending(_collection_name)
+                if vector_index.RAG_INDEX_SYNC:
+                    current = current and vector_index.has_watermark(_collection_name)
+                if not current:
+                    build_collection(db)
+                _index_checked = True
+
+    if vector_index.RAG_INDEX_SYNC:
+        vector_index.sync_worker.start(_collection, _embedder)
+
+
+def _llm_model():
+    """The Gemini model if google-generativeai is installed and GOOGLE_API_KEY is set, else None."""
+    global _llm, _llm_checked
+    if not _llm_checked:
+        try:
+            import google.generativeai as genai
+            from dotenv import load_dotenv
+            load_dotenv()
+
+            api_key = os.getenv("GOOGLE_API_KEY")
+            if api_key:
+                genai.configure(api_key=api_key)
+                _llm = genai.GenerativeModel("gemini-pro")
+        except Exception:
+            _llm = None
+        _llm_checked = True
+    return _llm
 
 
-def _synthesize_with_llm(question: str, context: str) -> str:
+async def _synthesize_with_llm(question: str, context: str) -> str:
     """
     Try to call Google Generative AI (Gemini) if GOOGLE_API_KEY is set.
     If not available or on error, return None to let the caller use fallback.
     """
+    model = _llm_model()
+    if model is None:
+        return None
+
+    system_prompt = "You are an assistant that answers questions only using the provided context about products and sales. If the context doesn't contain the answer, say you can't find it."
+
+    full_prompt = f"{system_prompt}\n\nContext:\n{context}\n\nQuestion: {question}\n\nAnswer concisely using only the context."
+
+    _llm_stats["waiting"] += 1
     try:
-        import os
-        import google.generativeai as genai
-        from dotenv import load_dotenv
-        load_dotenv()
-
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            return None
-        
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-pro")
-        
-        system_prompt = "You are an assistant that answers questions only using the provided context about products and sales. If the context doesn't contain the answer, say you can't find it."
-        
-        full_prompt = f"{system_prompt}\n\nContext:\n{context}\n\nQuestion: {question}\n\nAnswer concisely using only the context."
-        
-        response = model.generate_content(full_prompt)
+        async with _llm_slots:
+            _llm_stats["waiting"] -= 1
+            _llm_stats["calls"] += 1
+            _llm_stats["in_flight"] += 1
+            _llm_stats["max_in_flight"] = max(_llm_stats["max_in_flight"], _llm_stats["in_flight"])
+            try:
+                response = await asyncio.wait_for(model.generate_content_async(full_prompt), RAG_LLM_TIMEOUT_SECONDS)
+            finally:
+                _llm_stats["in_flight"] -= 1
         return response.text.strip() if response.text else None
     except Exception:
+        _llm_stats["failures"] += 1
         return None
 
 
-def _is_aggregation_query(question: str) -> bool:
-    """Detect if question is asking for counts, sums, or totals."""
-    agg_keywords = ["total", "count", "how many", "sum", "number of", "all products", "all sales"]
-    question_lower = question.lower()
-    return any(keyword in question_lower for keyword in agg_keywords)
-
-
-def _handle_aggregation_query(question: str, db: Session) -> str:
-    """Answer aggregation queries directly from DB."""
-    question_lower = question.lower()
-    
-    if "total number of products" in question_lower or "how many products" in question_lower:
-        count = db.query(models.Product).count()
-        return f"The total number of products in the database is {count}."
-    
-    if "total number of sales" in question_lower or "how many sales" in question_lower:
-        count = db.query(models.Sale).count()
-        return f"The total number of sales is {count}."
-    
-    if "total sales" in question_lower and ("revenue" in question_lower or "amount" in question_lower):
-        total = db.query(func.sum(models.Sale.total_price)).scalar() or 0
-        return f"The total sales revenue is {total}."
-    
-    if "total quantity sold" in question_lower or "total sold" in question_lower:
-        total = db.query(func.sum(models.Sale.quantity_sold)).scalar() or 0
-        return f"The total quantity sold is {total}."
-    
-    return None
+@router.get("/ready")
+def rag_ready(response: Response):
+    """Readiness of the RAG stack: 200 once the embedder and vector store are loaded, 503 before."""
+    ready = _embedder is not None and _collection is not None
+    if not ready:
+        response.status_code = 503
+    return {
+        "ready": ready,
+        "embedder_loaded": _embedder is not None,
+        "vector_store_loaded": _collection is not None,
+        "loading": _init_lock.locked(),
+        "load_seconds": _load_seconds,
+        "error": _load_error,
+    }
 
 
-@router.post("/ask/", response_model=schemas.AskResponse)
-def ask_rag(request: schemas.AskRequest, db: Session = Depends(get_db)):
-    """RAG ask: retrieve top-k docs, synthesize final answer with an LLM when available."""
-    
-    # Check if this is an aggregation query (count, sum, total) — answer directly from DB
-    if _is_aggregation_query(request.question):
-        agg_answer = _handle_aggregation_query(request.question, db)
-        if agg_answer:
-            return schemas.AskResponse(
-                question=request.question,
-                answer=agg_answer,
-                sources=[]
-            )
-    
-    try:
+@router.get("/index-lag")
+def index_lag(db: Session = Depends(get_db)):
+    """How far the vector index is behind the database: pending changes and their age."""
+    return {**vector_index.index_lag(db, _collection_name), **vector_index.sync_worker.stats()}
+
+
+def _normalize_question(question: str) -> str:
+    return " ".join(question.lower().split()).rstrip("?!. ")
+
+
+async def _embed_question(question: str) -> list:
+    vector = cache.question_embedding_cache.get(question)
+    if vector is cache.MISSING:
+        vector = await asyncio.wrap_future(query_embedder.submit(question))
+        cache.question_embedding_cache.set(question, vector)
+    return vector
+
+
+def _populate_index():
+    with read_session() as db:
         _ensure_collection_populated(db)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to initialize vector store: {e}")
 
-    _init_embedding_and_client()
 
+@router.get("/cache-stats")
+def rag_cache_stats():
+    """Hit rates of the question embedding and answer caches, and how many asks were coalesced."""
+    return {
+        "data_version": cache.data_version(),
+        "index_version": vector_index.index_version(),
+        "embedding_cache": cache.question_embedding_cache.stats(),
+        "answer_cache": cache.rag_answer_cache.stats(),
+        "coalescing": _answer_flights.stats(),
+        "query_embedder": query_embedder.stats(),
+        "llm": {"concurrency": RAG_LLM_CONCURRENCY, **_llm_stats},
+    }
+
+
+@router.post("/ask/", response_model=schemas.AskResponse)
+async def ask_rag(request: schemas.AskRequest, db: AsyncSession = Depends(get_async_read_db)):
+    """RAG ask: retrieve top-k docs, synthesize final answer with an LLM when available."""
+    question = _normalize_question(request.question)
     k = max(1, request.k)
+    # answers go stale with the data (aggregations), the index (retrieval) and the date ("this week")
+    key = (question, k, cache.data_version(), vector_index.index_version(), date.today())
+    value = cache.rag_answer_cache.get(key)
+    if value is cache.MISSING:
+        value = await _answer_flights.do(key, lambda: _answer_and_cache(key, request.question, question, k, db))
+    answer, sources = value
+    return schemas.AskResponse(question=request.question, answer=answer, sources=sources)
+
+
+async def _answer_and_cache(key, question: str, normalized: str, k: int, db: AsyncSession):
+    changed_at = cache.data_changed_at()
+    value = await _answer(question, normalized, k, db)
+    # as on the dashboard: a lagging replica's answer is served but not cached under the new data_version
+    if replica.is_fresh(db, changed_at):
+        cache.rag_answer_cache.set(key, value)
+    return value
 
-    # embed the query with the same embedder and use query_embeddings for consistent retrieval
+
+async def _answer(question: str, normalized: str, k: int, db: AsyncSession):
+    """(answer, sources) for ``question``."""
+
+    # analytic questions (totals, counts, rankings, breakdowns) are answered from SQL, without retrieval or the LLM
     try:
-        query_emb = _embedder.encode([request.question], convert_to_numpy=True).tolist()
+        computed = await db.run_sync(lambda session: analytics.answer(question, session))
+    except Exception:
+        # a question the analytics get wrong is still a question: answer it by retrieval instead
+        logger.exception("Analytic answer failed for %r; falling back to retrieval", question)
+        await db.rollback()
+        computed = None
+    if computed is not None:
+        return computed
+
+    # loading the model and building the index block for a long time: only the first ask waits on a thread for it
+    if not _index_checked:
+        try:
+            await run_in_threadpool(_populate_index)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to initialize vector store: {e}")
+
+    # embed the query with the same embedder and use query_embeddings for consistent retrieval;
+    # the normalized text, so every spelling of a question shares one cached embedding
+    try:
+        query_emb = [await _embed_question(normalized)]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to embed query: {e}")
 
     try:
-        results = _collection.query(query_embeddings=query_emb, n_results=k, include=["documents", "metadatas", "distances"])
+        results = await run_in_threadpool(_collection.query, query_embeddings=query_emb, n_results=k,
+                                          include=["documents", "metadatas", "distances"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Vector store query failed: {e}")
 
@@ -196,11 +346,7 @@ def ask_rag(request: schemas.AskRequest, db: Session = Depends(get_db)):
             selected.append((doc, meta, float(dist)))
 
     if not selected:
-        return schemas.AskResponse(
-            question=request.question,
-            answer="I can only answer questions about products and sales. I couldn't find relevant information for your question.",
-            sources=[]
-        )
+        return "I can only answer questions about products and sales. I couldn't find relevant information for your question.", []
 
     # build context for LLM: include small metadata + doc text
     context_pieces = []
@@ -211,10 +357,10 @@ def ask_rag(request: schemas.AskRequest, db: Session = Depends(get_db)):
     context = "\n\n".join(context_pieces)
 
     # Try to synthesize final answer via LLM if available, otherwise return concatenated docs as fallback
-    llm_answer = _synthesize_with_llm(request.question, context)
+    llm_answer = await _synthesize_with_llm(question, context)
     if llm_answer:
         answer = llm_answer
     else:
         answer = "Based on retrieved passages:\n\n" + context
 
-    return schemas.AskResponse(question=request.question, answer=answer, sources=sources)
+    return answer, sources
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, status, HTTPException, Response
-from sqlalchemy.orm import Session
-from .. import database, models, utils, oauth2
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import database, models, utils, oauth2, cache
 from ..schemas import UserLogin
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
 
@@ -8,17 +9,21 @@ from fastapi.security.oauth2 import OAuth2PasswordRequestForm
 router = APIRouter(prefix="/auth",tags=["Login and signup"])
 
 @router.post('/')
-def login(user_credentials: UserLogin, db:Session = Depends(database.get_db)):
-    user = db.query(models.User).filter(models.User.email == user_credentials.email).first()
+async def login(user_credentials: UserLogin, db:AsyncSession = Depends(database.get_async_db)):
+    user = (await db.execute(select(models.User).where(models.User.email == user_credentials.email))).scalars().first()
+    # the connection goes back to the pool before the (slow) bcrypt check on the hashing pool
+    await db.close()
     
     if not user:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Invalid Credentials")
-    if not utils.verify_password(user_credentials.password, user.password):
+    if not await utils.verify_password_async(user_credentials.password, user.password):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Invalid Credentials")
     
     #Create a Token
     #Return the Token
     access_token = oauth2.create_access_token(data={"user_id":user.id})
-    return {"access_token":access_token, "token_type":"bearer"}  
- 
-          
+    return {"access_token":access_token, "token_type":"bearer"}
+
+@router.get('/cache-stats')
+def principal_cache_stats(current_user: models.User = Depends(oauth2.get_current_user)):
+    return cache.principal_cache.stats()
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
-from .. import models, schemas, oauth2
-from ..database import get_db
+from sqlalchemy import func, desc, cast, type_coerce, Date, Integer
+from .. import models, schemas, oauth2, cache, export, replica
+from ..replica import get_async_read_db
 from datetime import date, timedelta
-from typing import List
+from typing import List, Literal, Optional
+import asyncio
+import os
 
 router = APIRouter(
     prefix="/dashboard",
@@ -12,41 +15,43 @@ router = APIRouter(
     dependencies=[Depends(oauth2.get_current_user)],
 )
 
-@router.get("/sales-analytics")
-def sales_analytics(db: Session = Depends(get_db), current_user: models.User = Depends(oauth2.get_current_user)):
-    # 1. Total Sales Value
-    total_sales = db.query(func.sum(models.Sale.total_price)).scalar() or 0
-    
-    # 2. Total Products Sold
-    total_products_sold = db.query(func.sum(models.Sale.quantity_sold)).scalar() or 0
-
-    # 3. Average Order Value
-    total_orders = db.query(func.count(models.Sale.id)).scalar() or 0
+# All sales aggregates are served from the per-day x product rollup (see app/rollup.py)
+Rollup = models.SalesDailyRollup
+
+# default and upper limit for the points of a sales-over-time series
+SALES_OVER_TIME_MAX_POINTS = int(os.getenv("SALES_OVER_TIME_MAX_POINTS", "1000"))
+
+
+def _sales_analytics(db: Session):
+    total_sales, total_products_sold, total_orders = db.query(
+        func.coalesce(func.sum(Rollup.revenue), 0),
+        func.coalesce(func.sum(Rollup.quantity), 0),
+        func.coalesce(func.sum(Rollup.order_count), 0),
+    ).one()
     avg_order_value = total_sales / total_orders if total_orders > 0 else 0
 
-    # 4. Best Selling Product (by quantity)
     best_selling = (
-        db.query(models.Product.name, func.sum(models.Sale.quantity_sold).label("total_qty"))
-        .join(models.Product, models.Sale.product_id == models.Product.id)
+        db.query(models.Product.name, func.sum(Rollup.quantity).label("total_qty"))
+        .join(models.Product, Rollup.product_id == models.Product.id)
         .group_by(models.Product.name)
-        .order_by(desc(func.sum(models.Sale.quantity_sold)))
+        .order_by(desc(func.sum(Rollup.quantity)))
         .first()
     )
     best_selling_product = {"name": best_selling[0], "quantity": best_selling[1]} if best_selling else None
 
-    # 5. Sales Today
+    # half-open date ranges keep the predicates sargable (no function around the column)
     today = date.today()
     sales_today = (
-        db.query(func.sum(models.Sale.total_price))
-        .filter(func.date(models.Sale.sale_date) == today)
+        db.query(func.sum(Rollup.revenue))
+        .filter(Rollup.sale_date >= today, Rollup.sale_date < today + timedelta(days=1))
         .scalar()
     ) or 0
 
-    # 6. Monthly Sales (current month)
+    month_start = today.replace(day=1)
+    next_month_start = (month_start + timedelta(days=32)).replace(day=1)
     monthly_sales = (
-        db.query(func.sum(models.Sale.total_price))
-        .filter(func.extract("month", models.Sale.sale_date) == today.month)
-        .filter(func.extract("year", models.Sale.sale_date) == today.year)
+        db.query(func.sum(Rollup.revenue))
+        .filter(Rollup.sale_date >= month_start, Rollup.sale_date < next_month_start)
         .scalar()
     ) or 0
 
@@ -59,104 +64,273 @@ def sales_analytics(db: Session = Depends(get_db), current_user: models.User = D
         "sales_this_month": monthly_sales,
     }
 
+
+def _low_stock_products(db: Session, low_stock_threshold: int):
+    return _as_products(db.query(models.Product).filter(models.Product.quantity <= low_stock_threshold).all())
+
+
+def _expiring_products(db: Session, days_before_expiry: int):
+    expiry_limit_date = date.today() + timedelta(days=days_before_expiry)
+    return _as_products(db.query(models.Product).filter(models.Product.expiry_date <= expiry_limit_date).all())
+
+
+GRANULARITIES = ("day", "week", "month", "quarter")
+Granularity = Literal["day", "week", "month", "quarter"]
+
+
+def _bucket_start(d: date, granularity: str) -> date:
+    if granularity == "week":
+        return d - timedelta(days=d.weekday())
+    if granularity == "month":
+        return d.replace(day=1)
+    if granularity == "quarter":
+        return d.replace(month=(d.month - 1) // 3 * 3 + 1, day=1)
+    return d
+
+
+def _next_bucket(d: date, granularity: str) -> date:
+    if granularity == "week":
+        return d + timedelta(days=7)
+    if granularity in ("month", "quarter"):
+        months = d.month - 1 + (3 if granularity == "quarter" else 1)
+        return date(d.year + months // 12, months % 12 + 1, 1)
+    return d + timedelta(days=1)
+
+
+def _bucket_count(start: date, end: date, granularity: str) -> int:
+    first, last = _bucket_start(start, granularity), _bucket_start(end, granularity)
+    if granularity == "day":
+        return (last - first).days + 1
+    if granularity == "week":
+        return (last - first).days // 7 + 1
+    months = (last.year - first.year) * 12 + last.month - first.month
+    return months // (3 if granularity == "quarter" else 1) + 1
+
+
+def _bucket_expr(db: Session, granularity: str):
+    """SQL expression truncating sale_date to the bucket start, or None if the dialect has no mapping."""
+    if granularity == "day":
+        return Rollup.sale_date
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return cast(func.date_trunc(granularity, Rollup.sale_date), Date)
+    if dialect == "sqlite":
+        if granularity == "week":
+            expr = func.date(Rollup.sale_date, "weekday 0", "-6 days")
+        elif granularity == "month":
+            expr = func.date(Rollup.sale_date, "start of month")
+        else:
+            months_into_quarter = (cast(func.strftime("%m", Rollup.sale_date), Integer) - 1) % 3
+            expr = func.date(Rollup.sale_date, "start of month", func.printf("-%d months", months_into_quarter))
+        return type_coerce(expr, Date)
+    return None
+
+
+def _sales_over_time(db: Session, start: Optional[date] = None, end: Optional[date] = None,
+                     granularity: str = "day", max_points: int = SALES_OVER_TIME_MAX_POINTS):
+    """
+    Revenue per day/week/month/quarter between start and end (inclusive), with
+    empty buckets filled with zeros. Returns (granularity used, points); raises
+    422 if even quarterly buckets exceed max_points.
+    """
+    if start is None or end is None:
+        first_day, last_day = db.query(func.min(Rollup.sale_date), func.max(Rollup.sale_date)).one()
+        if first_day is None:
+            return granularity, []
+        start = start or first_day
+        end = end or last_day
+    if start > end:
+        return granularity, []
+
+    # step up to a coarser bucket until the series fits in max_points
+    for coarser in GRANULARITIES[GRANULARITIES.index(granularity):]:
+        granularity = coarser
+        count = _bucket_count(start, end, granularity)
+        if count <= max_points:
+            break
+    else:
+        raise HTTPException(status_code=422, detail=f"{start} to {end} spans {count} quarters, more than max_points ({max_points})")
+
+    # inclusive end: end + 1 day overflows for date.max
+    date_filter = (Rollup.sale_date >= start, Rollup.sale_date <= end)
+    bucket = _bucket_expr(db, granularity)
+    totals = {}
+    if bucket is not None:
+        bucket = bucket.label("bucket")
+        rows = db.query(bucket, func.sum(Rollup.revenue)).filter(*date_filter).group_by(bucket).all()
+        totals = {day: total for day, total in rows}
+    else:
+        rows = db.query(Rollup.sale_date, func.sum(Rollup.revenue)).filter(*date_filter).group_by(Rollup.sale_date).all()
+        for day, total in rows:
+            key = _bucket_start(day, granularity)
+            totals[key] = totals.get(key, 0) + total
+
+    points = []
+    current = _bucket_start(start, granularity)
+    for i in range(count):
+        if i:
+            # never past the last bucket, which may be the last one before date.max
+            current = _next_bucket(current, granularity)
+        points.append({"sale_date": current, "total_sales": totals.get(current, 0)})
+    return granularity, points
+
+
+def _sales_over_time_points(db: Session):
+    return _sales_over_time(db)[1]
+
+
+def _top_selling_products(db: Session, limit: int):
+    rows = (
+        db.query(models.Product.name, func.sum(Rollup.quantity).label("total_sold"))
+        .join(Rollup, Rollup.product_id == models.Product.id)
+        .group_by(models.Product.name)
+        .order_by(desc(func.sum(Rollup.quantity)))
+        .limit(limit)
+        .all()
+    )
+    return [{"name": r.name, "total_sold": r.total_sold} for r in rows]
+
+
+def _stock_levels(db: Session):
+    return _as_products(db.query(models.Product).all())
+
+
+def _sales_by_product(db: Session):
+    rows = (
+        db.query(models.Product.name, func.sum(Rollup.revenue).label("total_revenue"))
+        .join(Rollup, Rollup.product_id == models.Product.id)
+        .group_by(models.Product.name)
+        .all()
+    )
+    return [{"name": r.name, "total_revenue": r.total_revenue} for r in rows]
+
+
+def _as_products(products):
+    return [schemas.Product.model_validate(p, from_attributes=True) for p in products]
+
+
+def _cache_key(section, params):
+    # today is part of the key because several sections are relative to the current date
+    return (section, params, cache.data_version(), date.today())
+
+
+async def _cached(section, compute, db: AsyncSession, *params):
+    """Serve a dashboard section from the result cache, computing it on a miss."""
+    key = _cache_key(section, params)
+    value = cache.dashboard_cache.get(key)
+    if value is cache.MISSING:
+        # section queries are written against Session; run_sync drives them on the async connection
+        changed_at = cache.data_changed_at()
+        value = await db.run_sync(compute, *params)
+        _cache_if_fresh(db, changed_at, key, value)
+    return value
+
+
+def _cache_if_fresh(db, changed_at: float, key, value):
+    # a replica that hasn't caught up with the last write would pin pre-write results
+    # under the post-write data_version, so those are served but not cached
+    if replica.is_fresh(db, changed_at):
+        cache.dashboard_cache.set(key, value)
+
+
+async def _compute_section(key, compute, *params):
+    # each /all section gets its own session / connection so they run concurrently
+    changed_at = cache.data_changed_at()
+    async with replica.async_read_session() as db:
+        value = await db.run_sync(compute, *params)
+        _cache_if_fresh(db, changed_at, key, value)
+    return value
+
+
+@router.get("/sales-analytics")
+async def sales_analytics(db: AsyncSession = Depends(get_async_read_db), current_user: models.User = Depends(oauth2.get_current_user)):
+    return await _cached("sales_analytics", _sales_analytics, db)
+
 @router.get("/low-stock-alert", response_model=List[schemas.Product])
-def low_stock_alert(low_stock_threshold: int = 10, db: Session = Depends(get_db), current_user: models.User = Depends(oauth2.get_current_user)):
-    low_stock_products = db.query(models.Product).filter(models.Product.quantity <= low_stock_threshold).all()
-    return low_stock_products
+async def low_stock_alert(low_stock_threshold: int = 10, db: AsyncSession = Depends(get_async_read_db), current_user: models.User = Depends(oauth2.get_current_user)):
+    return await _cached("low_stock_products", _low_stock_products, db, low_stock_threshold)
 
 @router.get("/expiry-alert", response_model=List[schemas.Product])
-def expiry_alert(days_before_expiry: int = 30, db: Session = Depends(get_db), current_user: models.User = Depends(oauth2.get_current_user)):
-    expiry_date = date.today() + timedelta(days=days_before_expiry)
-    expiring_products = db.query(models.Product).filter(models.Product.expiry_date <= expiry_date).all()
-    return expiring_products
+async def expiry_alert(days_before_expiry: int = 30, db: AsyncSession = Depends(get_async_read_db), current_user: models.User = Depends(oauth2.get_current_user)):
+    return await _cached("expiring_products", _expiring_products, db, days_before_expiry)
 
 @router.get("/sales-over-time")
-def sales_over_time(db: Session = Depends(get_db), current_user: models.User = Depends(oauth2.get_current_user)):
-    sales_data = db.query(models.Sale.sale_date, func.sum(models.Sale.total_price).label("total_sales")).group_by(models.Sale.sale_date).order_by(models.Sale.sale_date).all()
-    return sales_data
+async def sales_over_time(
+    response: Response,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    granularity: Granularity = "day",
+    max_points: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: models.User = Depends(oauth2.get_current_user)
+):
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    if max_points is None:
+        max_points = SALES_OVER_TIME_MAX_POINTS
+    if max_points < 1:
+        raise HTTPException(status_code=400, detail="max_points must be positive")
+    if max_points > SALES_OVER_TIME_MAX_POINTS:
+        raise HTTPException(status_code=422, detail=f"max_points must be at most {SALES_OVER_TIME_MAX_POINTS}")
+    used_granularity, points = await _cached("sales_over_time", _sales_over_time, db, start, end, granularity, max_points)
+    # may be coarser than requested when max_points applies
+    response.headers["X-Granularity"] = used_granularity
+    return points
 
 @router.get("/top-selling-products")
-def top_selling_products(limit: int = 5, db: Session = Depends(get_db), current_user: models.User = Depends(oauth2.get_current_user)):
-    top_products = db.query(models.Product.name, func.sum(models.Sale.quantity_sold).label("total_sold")).join(models.Sale).group_by(models.Product.name).order_by(desc(func.sum(models.Sale.quantity_sold))).limit(limit).all()
-    return top_products
+async def top_selling_products(limit: int = 5, db: AsyncSession = Depends(get_async_read_db), current_user: models.User = Depends(oauth2.get_current_user)):
+    return await _cached("top_selling_products", _top_selling_products, db, limit)
 
 @router.get("/stock-levels", response_model=List[schemas.Product])
-def stock_levels(db: Session = Depends(get_db), current_user: models.User = Depends(oauth2.get_current_user)):
-    return db.query(models.Product).all()
+async def stock_levels(db: AsyncSession = Depends(get_async_read_db), current_user: models.User = Depends(oauth2.get_current_user)):
+    return await _cached("stock_levels", _stock_levels, db)
+
+@router.get("/stock-levels/export")
+def export_stock_levels(format: export.ExportFormat = "ndjson", current_user: models.User = Depends(oauth2.get_current_user)):
+    return export.export_response(export.products_query(), format, "stock-levels")
 
 @router.get("/sales-by-product")
-def sales_by_product(db: Session = Depends(get_db), current_user: models.User = Depends(oauth2.get_current_user)):
-    sales_data = db.query(models.Product.name, func.sum(models.Sale.total_price).label("total_revenue")).join(models.Sale).group_by(models.Product.name).all()
-    return sales_data
+async def sales_by_product(db: AsyncSession = Depends(get_async_read_db), current_user: models.User = Depends(oauth2.get_current_user)):
+    return await _cached("sales_by_product", _sales_by_product, db)
 
 @router.get("/all")
 async def get_all_dashboard_data(
     low_stock_threshold: int = 10,
     days_before_expiry: int = 30,
     top_selling_limit: int = 5,
-    db: Session = Depends(get_db),
     current_user: models.User = Depends(oauth2.get_current_user)
 ):
-    # Sales Analytics
-    total_sales = db.query(func.sum(models.Sale.total_price)).scalar() or 0
-    total_products_sold = db.query(func.sum(models.Sale.quantity_sold)).scalar() or 0
-    total_orders = db.query(func.count(models.Sale.id)).scalar() or 0
-    avg_order_value = total_sales / total_orders if total_orders > 0 else 0
-    best_selling = (
-        db.query(models.Product.name, func.sum(models.Sale.quantity_sold).label("total_qty"))
-        .join(models.Product, models.Sale.product_id == models.Product.id)
-        .group_by(models.Product.name)
-        .order_by(desc(func.sum(models.Sale.quantity_sold)))
-        .first()
-    )
-    best_selling_product = {"name": best_selling[0], "quantity": best_selling[1]} if best_selling else None
-    today = date.today()
-    sales_today = (
-        db.query(func.sum(models.Sale.total_price))
-        .filter(func.date(models.Sale.sale_date) == today)
-        .scalar()
-    ) or 0
-    monthly_sales = (
-        db.query(func.sum(models.Sale.total_price))
-        .filter(func.extract("month", models.Sale.sale_date) == today.month)
-        .filter(func.extract("year", models.Sale.sale_date) == today.year)
-        .scalar()
-    ) or 0
-
-    sales_analytics_data = {
-        "total_sales_value": total_sales,
-        "total_products_sold": total_products_sold,
-        "average_order_value": avg_order_value,
-        "best_selling_product": best_selling_product,
-        "sales_today": sales_today,
-        "sales_this_month": monthly_sales,
+    sections = {
+        "sales_analytics": (_sales_analytics,),
+        "low_stock_products": (_low_stock_products, low_stock_threshold),
+        "expiring_products": (_expiring_products, days_before_expiry),
+        "sales_over_time": (_sales_over_time_points,),
+        "top_selling_products": (_top_selling_products, top_selling_limit),
+        "stock_levels": (_stock_levels,),
+        "sales_by_product": (_sales_by_product,),
     }
 
-    # Low Stock Alert
-    low_stock_products = db.query(models.Product).filter(models.Product.quantity <= low_stock_threshold).all()
+    # cache hits are answered directly; misses are computed concurrently
+    result = {}
+    pending = {}
+    for section, (compute, *params) in sections.items():
+        key = _cache_key(section, tuple(params))
+        value = cache.dashboard_cache.get(key)
+        if value is cache.MISSING:
+            pending[section] = _compute_section(key, compute, *params)
+        else:
+            result[section] = value
 
-    # Expiry Alert
-    expiry_limit_date = date.today() + timedelta(days=days_before_expiry)
-    expiring_products = db.query(models.Product).filter(models.Product.expiry_date <= expiry_limit_date).all()
+    if pending:
+        computed = await asyncio.gather(*pending.values())
+        result.update(zip(pending, computed))
+    return {section: result[section] for section in sections}
 
-    # Sales Over Time
-    sales_over_time_data = db.query(models.Sale.sale_date, func.sum(models.Sale.total_price).label("total_sales")).group_by(models.Sale.sale_date).order_by(models.Sale.sale_date).all()
+@router.get("/cache-stats")
+def cache_stats(current_user: models.User = Depends(oauth2.get_current_user)):
+    return {"data_version": cache.data_version(), **cache.dashboard_cache.stats()}
 
-    # Top Selling Products
-    top_products = db.query(models.Product.name, func.sum(models.Sale.quantity_sold).label("total_sold")).join(models.Sale).group_by(models.Product.name).order_by(desc(func.sum(models.Sale.quantity_sold))).limit(top_selling_limit).all()
-
-    # Stock Levels
-    stock_levels_data = db.query(models.Product).all()
-    
-    # Sales by Product
-    sales_by_product_data = db.query(models.Product.name, func.sum(models.Sale.total_price).label("total_revenue")).join(models.Sale).group_by(models.Product.name).all()
-
-    return {
-        "sales_analytics": sales_analytics_data,
-        "low_stock_products": low_stock_products,
-        "expiring_products": expiring_products,
-        "sales_over_time": sales_over_time_data,
-        "top_selling_products": top_products,
-        "stock_levels": stock_levels_data,
-        "sales_by_product": sales_by_product_data,
-    }
+@router.get("/replica-stats")
+def replica_stats(current_user: models.User = Depends(oauth2.get_current_user)):
+    """Read replica lag and how many read sessions it served versus the primary."""
+    return replica.stats()
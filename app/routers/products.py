@@ -1,132 +1,340 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from .. import models, schemas, oauth2
-from typing import List, Dict, Any, Optional
-from ..database import get_db
+from sqlalchemy import exc, insert, select
+from .. import models, schemas, oauth2, cache, export, pagination, search
+from typing import Literal, Optional
+from ..database import get_async_db, upsert_insert
+from ..replica import get_async_read_db
 import csv
 import io
+import json
+import logging
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(
     prefix="/products",
     tags=["products"],
 )
 
+async def _commit_product_changes(db: AsyncSession):
+    try:
+        await db.commit()
+    except exc.IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="A product with this name already exists.")
+
+async def _get_product(db: AsyncSession, product_id: int) -> models.Product:
+    db_product = await db.get(models.Product, product_id)
+    if db_product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return db_product
+
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.Product)
-def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db), current_user: models.User = Depends(oauth2.get_current_user)):
+async def create_product(product: schemas.ProductCreate, db: AsyncSession = Depends(get_async_db), current_user: models.User = Depends(oauth2.get_current_user)):
     db_product = models.Product(**product.model_dump())
     db.add(db_product)
-    db.commit()
-    db.refresh(db_product)
+    await _commit_product_changes(db)
+    cache.bump_data_version()
+    await db.refresh(db_product)
     return db_product
 
+UPSERT_LOOKUP_CHUNK_SIZE = 500
+# fields a product must have when the upsert creates it (see schemas.ProductCreate)
+UPSERT_REQUIRED_FOR_INSERT = ("price", "quantity", "expiry_date")
+
+
+def _parse_upsert_body(body: bytes, content_type: str) -> list:
+    try:
+        if "ndjson" in content_type or "jsonl" in content_type:
+            items = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            items = json.loads(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array or NDJSON lines of products.")
+    return items
+
+
+def _lookup_by_name(db: Session, names: list, *columns) -> list:
+    rows = []
+    for start in range(0, len(names), UPSERT_LOOKUP_CHUNK_SIZE):
+        chunk = names[start:start + UPSERT_LOOKUP_CHUNK_SIZE]
+        rows.extend(db.execute(select(*columns).where(models.Product.name.in_(chunk))).all())
+    return rows
+
+
+def _bulk_upsert_products(db: Session, items: list) -> dict:
+    insert_fn = upsert_insert(db)
+    if insert_fn is None:
+        raise HTTPException(status_code=501, detail="Bulk upsert requires SQLite or PostgreSQL.")
+
+    results = [None] * len(items)
+    valid = []
+    for i, item in enumerate(items):
+        try:
+            valid.append((i, schemas.ProductUpsert.model_validate(item)))
+        except ValidationError as e:
+            message = "; ".join(f"{'.'.join(map(str, err['loc'])) or 'item'}: {err['msg']}" for err in e.errors())
+            results[i] = {"index": i, "status": "error", "error": message}
+
+    names = list({p.name for _, p in valid})
+    known = {name for (name,) in _lookup_by_name(db, names, models.Product.name)}
+
+    # one row per name, later items overriding earlier ones field by field: a name
+    # repeated within one multi-VALUES upsert is an error on Postgres
+    rows = {}
+    for i, product in valid:
+        fields = product.model_dump(exclude_unset=True)
+        if product.name in known:
+            action = "updated"
+        else:
+            missing = [f for f in UPSERT_REQUIRED_FOR_INSERT if fields.get(f) is None]
+            if missing:
+                results[i] = {"index": i, "name": product.name, "status": "error",
+                              "error": f"New product requires: {', '.join(missing)}"}
+                continue
+            action = "inserted"
+            known.add(product.name)
+        results[i] = {"index": i, "name": product.name, "status": action}
+        rows.setdefault(product.name, {}).update(fields)
+
+    # consecutive rows with the same set of fields share one executemany statement
+    batches = []
+    for fields in rows.values():
+        columns = tuple(sorted(fields))
+        if batches and batches[-1][0] == columns:
+            batches[-1][1].append(fields)
+        else:
+            batches.append((columns, [fields]))
+
+    table = models.Product.__table__
+    try:
+        for columns, batch in batches:
+            stmt = insert_fn(table)
+            updates = {c: stmt.excluded[c] for c in columns if c != "name"}
+            if updates:
+                stmt = stmt.on_conflict_do_update(index_elements=[table.c.name], set_=updates)
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=[table.c.name])
+            db.execute(stmt, batch)
+        ids = dict(_lookup_by_name(db, names, models.Product.name, models.Product.id))
+        db.commit()
+    except exc.DBAPIError as e:
+        db.rollback()
+        # also raised when the unique index on products.name is missing (see app/dedupe.py)
+        raise HTTPException(status_code=409, detail=f"Bulk upsert failed, no changes were applied: {e.orig}")
+    if batches:
+        cache.bump_data_version()
+
+    for result in results:
+        if result["status"] != "error":
+            result["id"] = ids.get(result["name"])
+    return {
+        "inserted": sum(r["status"] == "inserted" for r in results),
+        "updated": sum(r["status"] == "updated" for r in results),
+        "errors": sum(r["status"] == "error" for r in results),
+        "results": results,
+    }
+
+
+@router.post("/bulk-upsert")
+async def bulk_upsert_products(request: Request, db: AsyncSession = Depends(get_async_db), current_user: models.User = Depends(oauth2.get_current_user)):
+    """
+    Insert or update many products in one transaction, keyed on product name.
+    Accepts a JSON array or NDJSON (Content-Type: application/x-ndjson).
+    """
+    items = _parse_upsert_body(await request.body(), request.headers.get("content-type", ""))
+    return await db.run_sync(_bulk_upsert_products, items)
+
 @router.get("/", response_model=list[schemas.Product])
-def read_products(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: models.User = Depends(oauth2.get_current_user)):
-    products = db.query(models.Product).offset(skip).limit(limit).all()
-    return products
+async def read_products(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    brand: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: models.User = Depends(oauth2.get_current_user)
+):
+    # keyset pagination on id; pass the X-Next-Cursor header back as ?cursor= for the next page
+    stmt = select(models.Product).order_by(models.Product.id)
+    if category is not None:
+        stmt = stmt.where(models.Product.category == category)
+    if brand is not None:
+        stmt = stmt.where(models.Product.Brand == brand)
+    if cursor is not None:
+        (last_id,) = pagination.decode_cursor(cursor, (int,))
+        stmt = stmt.where(models.Product.id > last_id)
+    elif skip:
+        stmt = stmt.offset(skip)
+    return await pagination.paginate_async(db, stmt, limit, response, lambda p: (p.id,))
+
+@router.get("/export")
+def export_products(format: export.ExportFormat = "ndjson", current_user: models.User = Depends(oauth2.get_current_user)):
+    return export.export_response(export.products_query(), format, "products")
+
+@router.get("/search", response_model=list[schemas.Product])
+async def search_products(
+    q: str,
+    mode: Literal["prefix", "fuzzy"] = "prefix",
+    limit: int = 20,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: models.User = Depends(oauth2.get_current_user)
+):
+    """Ranked search over product name, brand and category: word prefixes ("prefix") or typo-tolerant ("fuzzy")."""
+    return await db.run_sync(search.search_products, q, mode, max(1, min(limit, 100)))
 
 @router.get("/{product_id}", response_model=schemas.Product)
-def read_product(product_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(oauth2.get_current_user)):
-    db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
-    if db_product is None:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return db_product
+async def read_product(product_id: int, db: AsyncSession = Depends(get_async_db), current_user: models.User = Depends(oauth2.get_current_user)):
+    return await _get_product(db, product_id)
 
 @router.put("/{product_id}", response_model=schemas.Product)
-def update_product(product_id: int, product: schemas.ProductCreate, db: Session = Depends(get_db), current_user: models.User = Depends(oauth2.get_current_user)):
-    db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
-    if db_product is None:
-        raise HTTPException(status_code=404, detail="Product not found")
+async def update_product(product_id: int, product: schemas.ProductCreate, db: AsyncSession = Depends(get_async_db), current_user: models.User = Depends(oauth2.get_current_user)):
+    db_product = await _get_product(db, product_id)
     for var, value in vars(product).items():
         setattr(db_product, var, value) if value else None
-    db.commit()
-    db.refresh(db_product)
+    await _commit_product_changes(db)
+    cache.bump_data_version()
+    await db.refresh(db_product)
     return db_product
 
 @router.delete("/{product_id}", response_model=schemas.Product)
-def delete_product(product_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(oauth2.get_current_user)):
-    db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
-    if db_product is None:
-        raise HTTPException(status_code=404, detail="Product not found")
-    db.delete(db_product)
-    db.commit()
+async def delete_product(product_id: int, db: AsyncSession = Depends(get_async_db), current_user: models.User = Depends(oauth2.get_current_user)):
+    db_product = await _get_product(db, product_id)
+    await db.delete(db_product)
+    await db.commit()
+    cache.bump_data_version()
     return db_product
 
+CSV_IMPORT_CHUNK_SIZE = 5000
+CSV_REQUIRED_COLUMNS = ["name", "brand", "quantity", "price", "category"]
+
+
+def _parse_csv_row(row: dict) -> dict:
+    """Convert one CSV row to Product column values. Raises ValueError on bad data."""
+    expiry_date_str = row.get("expiry_date")
+    expiry_date = None
+    if expiry_date_str:
+        try:
+            expiry_date = datetime.strptime(expiry_date_str, '%Y-%m-%d').date()
+        except ValueError:
+            raise ValueError(f"Invalid date format for expiry_date: '{expiry_date_str}'. Expected YYYY-MM-DD.")
+    try:
+        quantity = int(row["quantity"])
+        price = float(row["price"])
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid data type for a value in row: {e}")
+    return {
+        "name": row["name"],
+        "Brand": row["brand"],
+        "category": row["category"],
+        "quantity": quantity,
+        "price": price,
+        "expiry_date": expiry_date
+    }
+
+
+def _import_product_chunk(db: Session, chunk: list, errors: list) -> tuple[int, int]:
+    """
+    Insert one chunk of (row_number, csv_row) pairs in a single transaction.
+    Duplicates (same name already stored or earlier in the chunk) are skipped.
+    Returns (added, skipped).
+    """
+    parsed = []
+    for row_number, row in chunk:
+        try:
+            parsed.append(_parse_csv_row(row))
+        except ValueError as e:
+            errors.append({"row": row_number, "error": str(e)})
+
+    names = {p["name"] for p in parsed}
+    existing = set(db.scalars(select(models.Product.name).where(models.Product.name.in_(names)))) if names else set()
+
+    new_rows = []
+    skipped = 0
+    for product in parsed:
+        if product["name"] in existing:
+            skipped += 1
+            continue
+        existing.add(product["name"])
+        new_rows.append(product)
+
+    if new_rows:
+        try:
+            db.execute(insert(models.Product), new_rows)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            first, last = chunk[0][0], chunk[-1][0]
+            errors.append({"row": first, "error": f"An unexpected error occurred while saving rows {first}-{last}: {str(e)}"})
+            return 0, skipped
+    return len(new_rows), skipped
+
+
+def _read_csv_chunk(reader, start: int, size: int) -> list:
+    chunk = []
+    for row in reader:
+        chunk.append((start + len(chunk), row))
+        if len(chunk) >= size:
+            break
+    return chunk
+
+
 @router.post("/upload-csv/", status_code=status.HTTP_201_CREATED)
-async def upload_products_csv(file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def upload_products_csv(file: UploadFile = File(...), db: AsyncSession = Depends(get_async_db)):
     if file.content_type != 'text/csv':
         raise HTTPException(status_code=400, detail="Invalid file type. Please upload a CSV file.")
-    
-    content = await file.read()
-    try:
-        content_decoded = content.decode('utf-8')
-    except UnicodeDecodeError:
-        raise HTTPException(status_code=400, detail="Invalid file encoding. Please use UTF-8.")
 
-    reader = csv.DictReader(io.StringIO(content_decoded))
-    
-    products_added = []
+    # parse the spooled upload incrementally instead of reading it into one string
+    stream = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+    reader = csv.DictReader(stream)
+
+    products_added = 0
     errors = []
     skipped = 0
-    
-    for i, row in enumerate(reader):
-        try:
-            # Validate and convert expiry_date
-            expiry_date_str = row.get("expiry_date")
-            expiry_date = None
-            if expiry_date_str:
-                try:
-                    expiry_date = datetime.strptime(expiry_date_str, '%Y-%m-%d').date()
-                except ValueError:
-                    errors.append({"row": i + 2, "error": f"Invalid date format for expiry_date: '{expiry_date_str}'. Expected YYYY-MM-DD."})
-                    continue
-            
-            # Check for required columns
-            required_columns = ["name", "brand", "quantity", "price", "category"]
-            for col in required_columns:
-                if col not in row:
-                    raise KeyError(f"Missing column: {col}")
-
-            # Skip duplicates: consider duplicate when same name exists
-            existing = db.query(models.Product).filter(models.Product.name == row["name"]).first()
-            if existing:
-                skipped += 1
-                continue
+    chunks = 0
+    try:
+        missing = [col for col in CSV_REQUIRED_COLUMNS if col not in (reader.fieldnames or [])]
+        if missing:
+            raise HTTPException(status_code=400, detail={
+                "message": "CSV processing failed for all rows.",
+                "errors": [{"row": 1, "error": f"Missing column: {col}"} for col in missing],
+            })
 
-            product_data = {
-                "name": row["name"],
-                "Brand": row["brand"],
-                "category": row["category"],
-                "quantity": int(row["quantity"]),
-                "price": float(row["price"]),
-                "expiry_date": expiry_date
-            }
-
-            db_product = models.Product(**product_data)
-            db.add(db_product)
-            products_added.append(product_data)
-
-        except KeyError as e:
-            errors.append({"row": i + 2, "error": str(e)})
-        except ValueError as e:
-            errors.append({"row": i + 2, "error": f"Invalid data type for a value in row: {e}"})
-        except Exception as e:
-            db.rollback()
-            errors.append({"row": i + 2, "error": f"An unexpected error occurred: {str(e)}"})
+        # reading/decoding the spooled file runs in the threadpool, inserts on the async session
+        row_number = 2
+        while chunk := await run_in_threadpool(_read_csv_chunk, reader, row_number, CSV_IMPORT_CHUNK_SIZE):
+            added, dupes = await db.run_sync(_import_product_chunk, chunk, errors)
+            products_added += added
+            skipped += dupes
+            chunks += 1
+            row_number += len(chunk)
+            logger.info("CSV import %s: %d rows read, %d products added so far", file.filename, row_number - 2, products_added)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail={
+            "message": "Invalid file encoding. Please use UTF-8.",
+            "products_added": products_added,
+        })
+    finally:
+        stream.detach()
+        if products_added:
+            cache.bump_data_version()
 
     if not products_added and errors:
         raise HTTPException(status_code=400, detail={"message": "CSV processing failed for all rows.", "errors": errors})
 
-    try:
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Database commit failed: {str(e)}")
-
     return {
-        "detail": f"Successfully added {len(products_added)} products. Skipped {skipped} duplicates.",
-        "products_added": len(products_added),
+        "detail": f"Successfully added {products_added} products. Skipped {skipped} duplicates.",
+        "products_added": products_added,
         "skipped": skipped,
+        "chunks_committed": chunks,
         "errors": errors if errors else "None",
         "error_count": len(errors)
-    }
\ No newline at end of file
+    }
@@ -1,6 +1,7 @@
 from fastapi import status,APIRouter
-from ..database import get_db
-from sqlalchemy.orm import Session
+from ..database import get_async_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends, HTTPException
 from .. import models,schemas,utils
 
@@ -10,19 +11,20 @@ router=APIRouter(
 )
 
 @router.post("/SignUp", status_code=status.HTTP_201_CREATED,response_model=schemas.USER)
-async def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-
-    existing_user = db.query(models.User).filter(models.User.email == user.email).first()
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    existing_user = (await db.execute(select(models.User).where(models.User.email == user.email))).scalars().first()
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="An account with this email already exists."
         )
 
-    hashed_password = utils.hash_password(user.password)
+    # don't hold a pooled connection while hashing (bcrypt runs on the hashing pool)
+    await db.close()
+    hashed_password = await utils.hash_password_async(user.password)
 
     db_user = models.User(email=user.email,username=user.username, password=hashed_password)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
\ No newline at end of file
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
@@ -1,78 +1,259 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from .. import models, schemas, oauth2
-from ..database import get_db
+from sqlalchemy import bindparam, insert, select, tuple_, update
+from .. import models, schemas, oauth2, cache, export, ingest, pagination, rollup
+from collections import defaultdict
+from datetime import date
+from typing import List, Optional
+from ..database import get_async_db
+from ..replica import get_async_read_db
+import asyncio
 
 router = APIRouter(
     prefix="/sales",
     tags=["sales"],
 )
 
-@router.post("/",  status_code=status.HTTP_201_CREATED,response_model=schemas.Sale)
-def create_sale(sale: schemas.SaleCreate, db: Session = Depends(get_db), current_user: models.User = Depends(oauth2.get_current_user)):
-    db_product = db.query(models.Product).filter(models.Product.id == sale.product_id).first()
-    if db_product is None:
+_products = models.Product.__table__
+
+# Stock changes are single conditional UPDATEs instead of read-check-write in Python,
+# so concurrent checkouts can neither oversell nor lose each other's updates.
+_decrement_stock = (
+    update(_products)
+    .where(_products.c.id == bindparam("product_id"), _products.c.quantity >= bindparam("sold"))
+    .values(quantity=_products.c.quantity - bindparam("sold"))
+)
+_increment_stock = (
+    update(_products)
+    .where(_products.c.id == bindparam("product_id"))
+    .values(quantity=_products.c.quantity + bindparam("sold"))
+)
+
+
+_SALE_COLUMNS = ("product_id", "quantity_sold", "sale_date", "total_price")
+
+
+def _insert_sales(db: Session, rows: list) -> list:
+    """Bulk-insert sale rows and return their new ids in the order of ``rows``."""
+    # sort_by_parameter_order would make SQLite fall back to one INSERT per row; instead
+    # RETURNING the content lets ids be matched back (rows with equal content are interchangeable)
+    returned = db.execute(
+        insert(models.Sale).returning(models.Sale.id, *(getattr(models.Sale, c) for c in _SALE_COLUMNS)),
+        rows,
+    ).all()
+    ids_by_content = defaultdict(list)
+    for sale_id, *content in returned:
+        ids_by_content[tuple(content)].append(sale_id)
+    return [ids_by_content[tuple(row[c] for c in _SALE_COLUMNS)].pop() for row in rows]
+
+
+def _take_stock(db: Session, product_id: int, quantity: int):
+    if db.execute(_decrement_stock, {"product_id": product_id, "sold": quantity}).rowcount == 1:
+        return
+    # slow path only: tell a missing product apart from insufficient stock
+    exists = db.query(models.Product.id).filter(models.Product.id == product_id).first() is not None
+    db.rollback()
+    if not exists:
         raise HTTPException(status_code=404, detail="Product not found")
-    if db_product.quantity < sale.quantity_sold:
-        raise HTTPException(status_code=400, detail="Not enough stock")
+    raise HTTPException(status_code=400, detail="Not enough stock")
+
 
-    db_product.quantity -= sale.quantity_sold
+def _return_stock(db: Session, product_id: int, quantity: int):
+    if db.execute(_increment_stock, {"product_id": product_id, "sold": quantity}).rowcount != 1:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Product not found")
+
+
+def _record_sales(db: Session, sales: List[schemas.SaleCreate]) -> list:
+    """
+    Group-commit handler: record each sale whose stock is available and return
+    the created sale (or the HTTPException for that sale) per item. The writer commits.
+    """
+    outcomes = [None] * len(sales)
+    accepted, rejected = [], []
+    for i, sale in enumerate(sales):
+        # one sale's failure only means its own UPDATE matched nothing, so there is nothing to undo
+        taken = db.execute(_decrement_stock, {"product_id": sale.product_id, "sold": sale.quantity_sold}).rowcount == 1
+        (accepted if taken else rejected).append(i)
+
+    if rejected:
+        known = {pid for (pid,) in db.query(models.Product.id).filter(models.Product.id.in_({sales[i].product_id for i in rejected}))}
+        for i in rejected:
+            if sales[i].product_id in known:
+                outcomes[i] = HTTPException(status_code=400, detail="Not enough stock")
+            else:
+                outcomes[i] = HTTPException(status_code=404, detail="Product not found")
+
+    if accepted:
+        rows = [sales[i].model_dump() for i in accepted]
+        ids = _insert_sales(db, rows)
+        rollup.apply_sales(db, added=[sales[i] for i in accepted])
+        for i, sale_id, row in zip(accepted, ids, rows):
+            outcomes[i] = {"id": sale_id, **row}
+    return outcomes
+
+
+# With SALES_GROUP_COMMIT on, POST /sales/ requests are queued and committed in groups
+_sale_writer = ingest.GroupCommitWriter(
+    _record_sales,
+    max_batch=ingest.SALES_GROUP_COMMIT_MAX_BATCH,
+    max_wait_ms=ingest.SALES_GROUP_COMMIT_MAX_WAIT_MS,
+    on_commit=cache.bump_data_version,
+) if ingest.SALES_GROUP_COMMIT else None
+
+
+def _create_sale(db: Session, sale: schemas.SaleCreate):
+    _take_stock(db, sale.product_id, sale.quantity_sold)
     db_sale = models.Sale(**sale.model_dump())
     db.add(db_sale)
+    rollup.apply_sales(db, added=[sale])
     db.commit()
+    cache.bump_data_version()
     db.refresh(db_sale)
     return db_sale
 
+
+@router.post("/",  status_code=status.HTTP_201_CREATED,response_model=schemas.Sale)
+async def create_sale(sale: schemas.SaleCreate, db: AsyncSession = Depends(get_async_db), current_user: models.User = Depends(oauth2.get_current_user)):
+    if _sale_writer is not None:
+        # give back the connection the auth lookup may have checked out, then wait on
+        # the loop, so queued requests don't hold a pooled connection
+        await db.close()
+        return await asyncio.wrap_future(_sale_writer.submit(sale))
+    return await db.run_sync(_create_sale, sale)
+
+def _create_sales_batch(db: Session, sales: List[schemas.SaleCreate]):
+    # read (and lock, where supported) every affected product in one query
+    product_ids = {sale.product_id for sale in sales}
+    stock = dict(
+        db.query(models.Product.id, models.Product.quantity)
+        .filter(models.Product.id.in_(product_ids))
+        .with_for_update()
+        .all()
+    )
+
+    errors = []
+    needed = defaultdict(int)
+    for line, sale in enumerate(sales):
+        if sale.product_id not in stock:
+            errors.append({"line": line, "error": "Product not found"})
+        else:
+            needed[sale.product_id] += sale.quantity_sold
+    for line, sale in enumerate(sales):
+        if sale.product_id in needed and (stock[sale.product_id] or 0) < needed[sale.product_id]:
+            errors.append({"line": line, "error": f"Not enough stock: batch needs {needed[sale.product_id]}, {stock[sale.product_id]} available"})
+    if errors:
+        raise HTTPException(status_code=400, detail={"message": "No sales were recorded.", "errors": sorted(errors, key=lambda e: e["line"])})
+
+    # one guarded decrement per product; the guard catches stock sold concurrently since the read.
+    # Matched ids come back through RETURNING: executemany rowcounts aren't reliable on every
+    # driver (asyncpg always reports -1). Ascending id order keeps lock order consistent.
+    taken = set()
+    for pid in sorted(needed):
+        row = db.execute(_decrement_stock.returning(_products.c.id), {"product_id": pid, "sold": needed[pid]}).first()
+        if row is None:
+            break
+        taken.add(row[0])
+    if taken != set(needed):
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Stock changed while the batch was processed, no sales were recorded. Please retry.")
+
+    rows = [sale.model_dump() for sale in sales]
+    ids = _insert_sales(db, rows)
+    rollup.apply_sales(db, added=sales)
+    db.commit()
+    cache.bump_data_version()
+    return [{"id": sale_id, **row} for sale_id, row in zip(ids, rows)]
+
+@router.post("/batch", status_code=status.HTTP_201_CREATED, response_model=list[schemas.Sale])
+async def create_sales_batch(sales: List[schemas.SaleCreate], db: AsyncSession = Depends(get_async_db), current_user: models.User = Depends(oauth2.get_current_user)):
+    """Create many sales in one transaction: either every line is recorded or none is."""
+    if not sales:
+        return []
+    return await db.run_sync(_create_sales_batch, sales)
+
 @router.get("/", response_model=list[schemas.Sale])
-def read_sales(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: models.User = Depends(oauth2.get_current_user)):
-    sales = db.query(models.Sale).offset(skip).limit(limit).all()
-    return sales
+async def read_sales(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    product_id: Optional[int] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: models.User = Depends(oauth2.get_current_user)
+):
+    # keyset pagination on (sale_date, id); pass the X-Next-Cursor header back as ?cursor= for the next page
+    stmt = select(models.Sale).order_by(models.Sale.sale_date, models.Sale.id)
+    if product_id is not None:
+        stmt = stmt.where(models.Sale.product_id == product_id)
+    if start is not None:
+        stmt = stmt.where(models.Sale.sale_date >= start)
+    if end is not None:
+        stmt = stmt.where(models.Sale.sale_date <= end)
+    if cursor is not None:
+        last_date, last_id = pagination.decode_cursor(cursor, (date, int))
+        stmt = stmt.where(tuple_(models.Sale.sale_date, models.Sale.id) > tuple_(last_date, last_id))
+    elif skip:
+        stmt = stmt.offset(skip)
+    return await pagination.paginate_async(db, stmt, limit, response, lambda s: (s.sale_date, s.id))
+
+@router.get("/ingest-stats")
+def ingest_stats(current_user: models.User = Depends(oauth2.get_current_user)):
+    """Group-commit writer metrics: batch sizes, queue depth, failures."""
+    if _sale_writer is None:
+        return {"enabled": False}
+    return {"enabled": True, **_sale_writer.stats()}
+
+@router.get("/export")
+def export_sales(format: export.ExportFormat = "ndjson", current_user: models.User = Depends(oauth2.get_current_user)):
+    return export.export_response(export.sales_query(), format, "sales")
 
 @router.get("/{sale_id}", response_model=schemas.Sale)
-def read_sale(sale_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(oauth2.get_current_user)):
-    db_sale = db.query(models.Sale).filter(models.Sale.id == sale_id).first()
+async def read_sale(sale_id: int, db: AsyncSession = Depends(get_async_db), current_user: models.User = Depends(oauth2.get_current_user)):
+    db_sale = await db.get(models.Sale, sale_id)
     if db_sale is None:
         raise HTTPException(status_code=404, detail="Sale not found")
     return db_sale
 
-@router.put("/{sale_id}", response_model=schemas.Sale)
-def update_sale(sale_id: int, sale: schemas.SaleCreate, db: Session = Depends(get_db), current_user: models.User = Depends(oauth2.get_current_user)):
+def _update_sale(db: Session, sale_id: int, sale: schemas.SaleCreate):
     db_sale = db.query(models.Sale).filter(models.Sale.id == sale_id).first()
     if db_sale is None:
         raise HTTPException(status_code=404, detail="Sale not found")
 
-    # Revert the stock change from the original sale
-    db_product = db.query(models.Product).filter(models.Product.id == db_sale.product_id).first()
-    if db_product is None:
-        raise HTTPException(status_code=404, detail="Product not found")
-    db_product.quantity += db_sale.quantity_sold
-
-    # Apply the stock change for the updated sale
-    updated_product = db.query(models.Product).filter(models.Product.id == sale.product_id).first()
-    if updated_product is None:
-        raise HTTPException(status_code=404, detail="Product not found")
-    if updated_product.quantity < sale.quantity_sold:
-        db_product.quantity -= db_sale.quantity_sold # Revert the revert
-        raise HTTPException(status_code=400, detail="Not enough stock")
-    updated_product.quantity -= sale.quantity_sold
+    # Revert the stock change from the original sale, then apply the updated one;
+    # a failed take rolls back the revert as well
+    _return_stock(db, db_sale.product_id, db_sale.quantity_sold)
+    _take_stock(db, sale.product_id, sale.quantity_sold)
 
+    previous = schemas.Sale.model_validate(db_sale, from_attributes=True)
     for var, value in vars(sale).items():
         setattr(db_sale, var, value) if value else None
+    rollup.apply_sales(db, added=[db_sale], removed=[previous])
     db.commit()
+    cache.bump_data_version()
     db.refresh(db_sale)
     return db_sale
 
-@router.delete("/{sale_id}", response_model=schemas.Sale)
-def delete_sale(sale_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(oauth2.get_current_user)):
+@router.put("/{sale_id}", response_model=schemas.Sale)
+async def update_sale(sale_id: int, sale: schemas.SaleCreate, db: AsyncSession = Depends(get_async_db), current_user: models.User = Depends(oauth2.get_current_user)):
+    return await db.run_sync(_update_sale, sale_id, sale)
+
+def _delete_sale(db: Session, sale_id: int):
     db_sale = db.query(models.Sale).filter(models.Sale.id == sale_id).first()
     if db_sale is None:
         raise HTTPException(status_code=404, detail="Sale not found")
 
-    db_product = db.query(models.Product).filter(models.Product.id == db_sale.product_id).first()
-    if db_product is None:
-        raise HTTPException(status_code=404, detail="Product not found")
-    db_product.quantity += db_sale.quantity_sold
+    _return_stock(db, db_sale.product_id, db_sale.quantity_sold)
 
     db.delete(db_sale)
+    rollup.apply_sales(db, removed=[db_sale])
     db.commit()
+    cache.bump_data_version()
     return db_sale
+
+@router.delete("/{sale_id}", response_model=schemas.Sale)
+async def delete_sale(sale_id: int, db: AsyncSession = Depends(get_async_db), current_user: models.User = Depends(oauth2.get_current_user)):
+    return await db.run_sync(_delete_sale, sale_id)
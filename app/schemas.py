@@ -1,5 +1,5 @@
 from typing import List
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, field_validator
 from datetime import date
 
 class UserBase(BaseModel):
@@ -43,6 +43,23 @@ class Product(ProductBase):
     class Config:
         orm_mode = True
 
+class ProductUpsert(BaseModel):
+    # name is the upsert key; omitted fields are left unchanged on existing products
+    name: str
+    Brand: str | None = None
+    price: float | None = None
+    quantity: int | None = None
+    category: str | None = None
+    expiry_date: date | None = None
+
+    @field_validator("price", "quantity", "expiry_date")
+    @classmethod
+    def _not_null(cls, value):
+        # may be omitted, but an explicit null would be written onto a column products require
+        if value is None:
+            raise ValueError("may be omitted but not null")
+        return value
+
 class SaleBase(BaseModel):
     product_id: int
     quantity_sold: int
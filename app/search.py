@@ -0,0 +1,183 @@
+"""
+Full-text product search over name, brand and category.
+
+SQLite: an external-content FTS5 table (trigram tokenizer) kept in sync with
+``products`` by triggers. Postgres: pg_trgm + a tsvector expression index.
+Other backends fall back to a LIKE scan.
+"""
+import logging
+import os
+import re
+
+from sqlalchemy import Engine, func, or_, text
+from sqlalchemy.orm import Session
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+# set by ensure_search_index(): "fts5", "postgresql" or None (LIKE fallback)
+_backend = None
+
+# bm25 column weights for name, brand, category
+_FTS_WEIGHTS = "10.0, 3.0, 2.0"
+
+# Only this many best-ranked FTS matches are joined back to ``products``.
+SEARCH_CANDIDATE_LIMIT = int(os.getenv("SEARCH_CANDIDATE_LIMIT", "200"))
+
+_SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE products_fts USING fts5(
+        name, brand, category, content='products', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name, brand, category) VALUES (new.id, new.name, new."Brand", new.category);
+    END""",
+    """CREATE TRIGGER products_fts_ad AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, brand, category)
+        VALUES ('delete', old.id, old.name, old."Brand", old.category);
+    END""",
+    # only re-index when searchable columns change, not on every stock update
+    """CREATE TRIGGER products_fts_au AFTER UPDATE OF name, "Brand", category ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, brand, category)
+        VALUES ('delete', old.id, old.name, old."Brand", old.category);
+        INSERT INTO products_fts(rowid, name, brand, category) VALUES (new.id, new.name, new."Brand", new.category);
+    END""",
+    "INSERT INTO products_fts(products_fts) VALUES ('rebuild')",
+]
+
+_PG_SEARCH_DOCUMENT = """to_tsvector('simple', coalesce(name, '') || ' ' || coalesce("Brand", '') || ' ' || coalesce(category, ''))"""
+
+_PG_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING gin (name gin_trgm_ops)",
+    """CREATE INDEX IF NOT EXISTS ix_products_brand_trgm ON products USING gin ("Brand" gin_trgm_ops)""",
+    f"CREATE INDEX IF NOT EXISTS ix_products_search_tsv ON products USING gin ({_PG_SEARCH_DOCUMENT})",
+]
+
+
+def ensure_search_index(engine: Engine):
+    """Create the search index for the engine's backend (idempotent)."""
+    global _backend
+    dialect = engine.dialect.name
+    try:
+        with engine.begin() as conn:
+            if dialect == "sqlite":
+                exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'products_fts'")).first()
+                if not exists:
+                    for ddl in _SQLITE_DDL:
+                        conn.execute(text(ddl))
+                _backend = "fts5"
+            elif dialect == "postgresql":
+                for ddl in _PG_DDL:
+                    conn.execute(text(ddl))
+                _backend = "postgresql"
+    except Exception as e:
+        logger.warning("Full-text product search unavailable, falling back to LIKE: %s", e)
+        _backend = None
+
+
+def _terms(q: str) -> list:
+    # word characters only, so terms are safe inside FTS5 / tsquery syntax
+    return re.findall(r"\w+", q)
+
+
+def _trigrams(term: str) -> list:
+    term = term.lower()
+    return list(dict.fromkeys(term[i:i + 3] for i in range(len(term) - 2)))
+
+
+def _fts_query(terms: list, mode: str) -> str | None:
+    if mode == "fuzzy":
+        # any shared trigram matches; bm25 ranks rows sharing the most trigrams first
+        grams = [g for t in terms for g in _trigrams(t)]
+        return " OR ".join(f'"{g}"' for g in grams) or None
+    # trigram tokens match any substring; every term must match, and
+    # _word_prefix_patterns() then keeps only matches at the start of a word
+    if any(len(t) < 3 for t in terms):
+        return None
+    return " AND ".join(f'"{t}"' for t in terms)
+
+
+def _word_prefix_patterns(term: str) -> tuple:
+    """LIKE patterns (escape ``\\``) for a value starting with ``term``, or having a word that does."""
+    # \w terms can still contain the LIKE wildcard _
+    term = term.replace("_", r"\_")
+    return f"{term}%", f"% {term}%"
+
+
+def _fts_prefix_filter(terms: list) -> tuple:
+    """SQL condition over products_fts columns requiring a word prefix match per term, and its params."""
+    conditions, params = [], {}
+    for i, term in enumerate(terms):
+        params[f"start{i}"], params[f"word{i}"] = _word_prefix_patterns(term)
+        conditions.append("(" + " OR ".join(
+            f"{column} LIKE :start{i} ESCAPE '\\' OR {column} LIKE :word{i} ESCAPE '\\'"
+            for column in ("name", "brand", "category")
+        ) + ")")
+    return " AND ".join(conditions), params
+
+
+def _like_search(db: Session, terms: list, mode: str, limit: int):
+    query = db.query(models.Product)
+    columns = (models.Product.name, models.Product.Brand, models.Product.category)
+    for term in terms:
+        if mode == "prefix":
+            patterns = _word_prefix_patterns(term)
+        else:
+            patterns = ("%" + term.replace("_", r"\_") + "%",)
+        query = query.filter(or_(*(column.ilike(pattern, escape="\\") for column in columns for pattern in patterns)))
+    return query.order_by(func.length(models.Product.name), models.Product.id).limit(limit).all()
+
+
+def search_products(db: Session, q: str, mode: str = "prefix", limit: int = 20):
+    """
+    Return up to ``limit`` products matching ``q``, best match first. "prefix" matches
+    products where every term starts a word of the name, brand or category; "fuzzy"
+    tolerates typos.
+    """
+    terms = _terms(q)
+    if not terms:
+        return []
+
+    if _backend == "fts5":
+        match = _fts_query(terms, mode)
+        if match is None:
+            # trigram index can't serve terms shorter than 3 characters
+            return _like_search(db, terms, mode, limit)
+        prefix_filter, params = _fts_prefix_filter(terms) if mode == "prefix" else ("1", {})
+        # the candidates are the best-ranked matches: ordering by rank has to happen
+        # inside the FTS query, before its LIMIT
+        stmt = text(
+            f"""SELECT products.* FROM (
+                    SELECT rowid, rank FROM products_fts
+                    WHERE products_fts MATCH :match AND rank MATCH 'bm25({_FTS_WEIGHTS})' AND {prefix_filter}
+                    ORDER BY rank
+                    LIMIT :candidates
+                ) AS hits
+                JOIN products ON products.id = hits.rowid
+                ORDER BY hits.rank, products.id
+                LIMIT :limit"""
+        )
+        params.update(match=match, candidates=max(limit, SEARCH_CANDIDATE_LIMIT), limit=limit)
+        return db.query(models.Product).from_statement(stmt).params(**params).all()
+
+    if _backend == "postgresql":
+        if mode == "fuzzy":
+            stmt = text(
+                """SELECT * FROM products
+                   WHERE name % :q OR "Brand" % :q
+                   ORDER BY greatest(similarity(name, :q), similarity("Brand", :q)) DESC, id
+                   LIMIT :limit"""
+            )
+            params = {"q": " ".join(terms)}
+        else:
+            stmt = text(
+                f"""SELECT * FROM products
+                    WHERE {_PG_SEARCH_DOCUMENT} @@ to_tsquery('simple', :tsq)
+                    ORDER BY ts_rank({_PG_SEARCH_DOCUMENT}, to_tsquery('simple', :tsq)) DESC, id
+                    LIMIT :limit"""
+            )
+            params = {"tsq": " & ".join(f"{t}:*" for t in terms)}
+        return db.query(models.Product).from_statement(stmt).params(limit=limit, **params).all()
+
+    return _like_search(db, terms, mode, limit)
@@ -0,0 +1,74 @@
+"""
+Start-up time and memory of the API process.
+
+Each run starts a fresh interpreter that imports ``app.main`` (routers, table
+and index creation, rollup check) against a scratch SQLite database, and
+reports the import time, total wall time and peak RSS. ``--with-rag`` also
+loads the RAG stack afterwards, as the first /rag/ask or RAG_WARMUP=1 would.
+
+    python -m app.startbench [--runs 5] [--with-rag]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from . import bench
+
+_CHILD = """
+import json, resource, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter() - started
+rag = None
+if {with_rag}:
+    from app.routers import RAG
+    started = time.perf_counter()
+    RAG._init_embedding_and_client()
+    rag = time.perf_counter() - started
+# ru_maxrss is in KiB on Linux
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps({{"import_seconds": imported, "rag_seconds": rag, "peak_rss_mib": peak}}))
+"""
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(with_rag: bool = False) -> dict:
+    """One cold start in a child process: import/RAG load seconds, wall seconds, peak RSS in MiB."""
+    with tempfile.TemporaryDirectory(prefix="startbench-") as tmp:
+        env = bench.scratch_environ(tmp, "startbench", PYTHONPATH=_REPO_ROOT)
+
+        started = time.perf_counter()
+        # cwd=tmp keeps the RAG stack's ./chroma_db out of the working tree
+        child = subprocess.Popen([sys.executable, "-c", _CHILD.format(with_rag=with_rag)], cwd=tmp, env=env,
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        stdout, stderr = child.communicate()
+        wall = time.perf_counter() - started
+    if child.returncode != 0:
+        raise RuntimeError(f"app failed to start:\n{stderr.strip()}")
+    result = json.loads(stdout.strip().splitlines()[-1])
+    result["wall_seconds"] = wall
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API start-up time and memory.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--with-rag", action="store_true", help="also load the embedder and vector store")
+    args = parser.parse_args()
+
+    runs = [measure(args.with_rag) for _ in range(args.runs)]
+    print(f"{args.runs} cold starts of app.main{' + RAG stack' if args.with_rag else ''} (median):")
+    print(f"  import app.main  {statistics.median(r['import_seconds'] for r in runs):.2f}s")
+    if args.with_rag:
+        print(f"  load RAG stack   {statistics.median(r['rag_seconds'] for r in runs):.2f}s")
+    print(f"  process wall     {statistics.median(r['wall_seconds'] for r in runs):.2f}s")
+    print(f"  peak RSS         {statistics.median(r['peak_rss_mib'] for r in runs):.0f} MiB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Concurrency stress test for stock changes: no oversell, no lost updates.
+
+Seeds a scratch SQLite database with one product holding ``--stock`` units and
+imports the app against it. ``--clients`` concurrent clients then send
+``--requests`` requests in total through the ASGI app in process (httpx), so the
+routes, sessions and pooled connections are the real ones. Each request either
+buys one unit (POST /sales/), buys two units as a two-line batch
+(POST /sales/batch) or deletes one of the client's own sales (returning its
+stock). There are far more buys than units, so stock runs out while clients race.
+
+It prints the wall time and requests/s of the run, and p50/p99 latency per kind
+of request.
+
+Afterwards the database must satisfy:
+- stock left + units in ``sales`` == ``--stock`` (no oversell, no lost update)
+- units in ``sales`` == units bought minus units returned, by HTTP response
+- the rollup holds the same units as ``sales``
+- no request failed with a 5xx
+
+    python -m app.stockstress [--stock 1000] [--requests 5000] [--clients 32] [--group-commit]
+
+Exits with status 1 if a check fails.
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import date
+
+from sqlalchemy import func, insert, select
+
+from . import bench
+
+_SALE = {"product_id": 1, "quantity_sold": 1, "sale_date": date(2025, 6, 1).isoformat(), "total_price": 10.0}
+
+
+async def run(stock: int, requests: int, clients: int, seed: int) -> dict:
+    app = bench.load_app()
+    from . import database, models
+
+    headers = bench.add_user(1, "stress")
+    with database.engine.begin() as conn:
+        conn.execute(insert(models.Product), [{"id": 1, "name": "stress product", "Brand": "stress", "category": "stress",
+                                               "price": 10.0, "cost_price": 6.0, "quantity": stock, "expiry_date": None}])
+
+    statuses = Counter()
+    latencies = defaultdict(list)
+    units = {"bought": 0, "returned": 0}
+    remaining = requests
+
+    async def client(http, rng: random.Random):
+        nonlocal remaining
+        own = []  # ids of this client's sales, with their units
+        while remaining > 0:
+            remaining -= 1
+            roll = rng.random()
+            started = time.perf_counter()
+            if own and roll < 0.15:
+                sale_id, quantity = own.pop(rng.randrange(len(own)))
+                response = await http.delete(f"/sales/{sale_id}")
+                if response.status_code == 200:
+                    units["returned"] += quantity
+                kind = "delete"
+            elif roll < 0.4:
+                response = await http.post("/sales/batch", json=[_SALE, _SALE])
+                if response.status_code == 201:
+                    own.extend((sale["id"], 1) for sale in response.json())
+                    units["bought"] += 2
+                kind = "batch"
+            else:
+                response = await http.post("/sales/", json=_SALE)
+                if response.status_code == 201:
+                    own.append((response.json()["id"], 1))
+                    units["bought"] += 1
+                kind = "sale"
+            latencies[kind].append(time.perf_counter() - started)
+            statuses[kind, response.status_code] += 1
+
+    async with bench.serve(app, "stockstress", headers=headers) as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(http, random.Random(seed + i)) for i in range(clients)))
+        wall = time.perf_counter() - started
+
+    with database.engine.connect() as conn:
+        left = conn.scalar(select(models.Product.quantity).where(models.Product.id == 1))
+        sold = conn.scalar(select(func.coalesce(func.sum(models.Sale.quantity_sold), 0)))
+        rolled_up = conn.scalar(select(func.coalesce(func.sum(models.SalesDailyRollup.quantity), 0)))
+    timings = {
+        kind: {"requests": len(values), "p50_ms": bench.percentile(values, 50) * 1000,
+               "p99_ms": bench.percentile(values, 99) * 1000}
+        for kind, values in sorted(latencies.items())
+    }
+    return {"statuses": statuses, "units": units, "left": left, "sold": sold, "rolled_up": rolled_up,
+            "wall": wall, "timings": timings}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Race concurrent sales against limited stock and check no unit is oversold or lost.")
+    parser.add_argument("--stock", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=5000, help="requests in total")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent clients")
+    parser.add_argument("--group-commit", action="store_true", help="run with SALES_GROUP_COMMIT on")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with bench.scratch_app("stockstress", SALES_GROUP_COMMIT="1" if args.group_commit else "0"):
+        r = asyncio.run(run(args.stock, args.requests, args.clients, args.seed))
+
+    print(f"{args.requests} requests from {args.clients} clients against {args.stock} units "
+          f"(group commit {'on' if args.group_commit else 'off'})")
+    print(f"  {r['wall']:.2f}s, {args.requests / r['wall']:,.0f} requests/s")
+    for kind, t in r["timings"].items():
+        print(f"  {kind:<6} {t['requests']:>6} requests  p50 {t['p50_ms']:6.1f}ms  p99 {t['p99_ms']:6.1f}ms")
+    for (kind, status), count in sorted(r["statuses"].items()):
+        print(f"  {kind:<6} {status}: {count}")
+    units = r["units"]
+    print(f"  stock left {r['left']}, units in sales {r['sold']}, in rollup {r['rolled_up']}; "
+          f"bought {units['bought']}, returned {units['returned']}")
+
+    failures = []
+    if r["left"] < 0 or r["left"] + r["sold"] != args.stock:
+        failures.append(f"stock left + units sold = {r['left'] + r['sold']}, expected {args.stock}")
+    if r["sold"] != units["bought"] - units["returned"]:
+        failures.append(f"{r['sold']} units in sales, but responses confirmed {units['bought'] - units['returned']}")
+    if r["rolled_up"] != r["sold"]:
+        failures.append(f"rollup has {r['rolled_up']} units, sales {r['sold']}")
+    server_errors = sum(count for (_, status), count in r["statuses"].items() if status >= 500)
+    if server_errors:
+        failures.append(f"{server_errors} requests failed with a server error")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK: no oversell, no lost updates")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,573 @@
+"""
+Change capture and incremental sync for the RAG vector index.
+
+Triggers on ``products`` and ``sales`` queue the id of every affected index
+document (``product_{id}`` / ``sale_{id}``) in ``index_outbox`` in the same
+transaction as the write, so ORM writes and bulk statements are all captured.
+A document has at most one pending entry however often it changes. A product
+rename or delete also queues ``sales_of_product_{id}``, because sale documents
+include the product name. Bulk imports (app/backfill.py) skip capture for
+their own inserts and have the worker index them with a catch-up build instead.
+
+``IndexSyncWorker`` drains the outbox in batches. It re-reads the current
+rows, re-embeds and upserts the documents that still exist, deletes the
+others from the collection, then deletes the applied outbox rows and
+advances the collection's watermark. Rows are consumed by id rather than
+"everything above the watermark", so a transaction that commits out of id
+order is still picked up. The outbox survives restarts, so a restarted
+worker catches up from where it stopped instead of rebuilding the index.
+
+``build_index`` does the full build the worker starts from. It streams
+products and then sales in id order, embeds and upserts them in batches of
+RAG_BUILD_BATCH_SIZE (optionally across a pool of RAG_BUILD_PROCESSES
+encoder processes), and commits the last indexed id per table to
+``index_build_checkpoints`` every few batches. An interrupted build resumes
+after its last checkpoint.
+
+    python -m app.vector_index build [--restart] [--batch-size 1000] [--processes 4]
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from sqlalchemy import Engine, delete, func, select, text
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Capture only pays off with a worker draining the outbox, which needs the RAG stack loaded:
+# on by default only with RAG_WARMUP, and when on the app loads the stack at startup.
+RAG_INDEX_SYNC = os.getenv("RAG_INDEX_SYNC", os.getenv("RAG_WARMUP", "")).lower() in ("1", "true", "yes", "on")
+RAG_INDEX_SYNC_INTERVAL_SECONDS = float(os.getenv("RAG_INDEX_SYNC_INTERVAL_SECONDS", "2"))
+RAG_INDEX_SYNC_BATCH_SIZE = int(os.getenv("RAG_INDEX_SYNC_BATCH_SIZE", "256"))
+RAG_BUILD_BATCH_SIZE = int(os.getenv("RAG_BUILD_BATCH_SIZE", "1000"))
+RAG_BUILD_PROCESSES = int(os.getenv("RAG_BUILD_PROCESSES", "1"))
+
+# a build checkpoint is committed after this many batches
+_BATCHES_PER_CHECKPOINT = 10
+
+# keeps IN lists well below the bound parameter limits of every backend
+_ID_CHUNK = 500
+
+_SALES_OF_PRODUCT = "sales_of_product_"
+
+# one pending entry per document: a change to a document that is already queued moves its
+# entry to a new id instead of appending another. The worker deletes only the ids it applied,
+# so it picks the moved entry up again, and a hot row costs one entry, not one per write.
+_SQLITE_QUEUE = "ON CONFLICT(doc_id) DO UPDATE SET id = (SELECT max(id) FROM index_outbox) + 1"
+_SQLITE_SALES_INSERT_TRIGGER = f"""CREATE TRIGGER IF NOT EXISTS sales_index_ai AFTER INSERT ON sales BEGIN
+        INSERT INTO index_outbox(doc_id) VALUES ('sale_' || new.id) {_SQLITE_QUEUE};
+    END"""
+_SQLITE_DROP = [
+    f"DROP TRIGGER IF EXISTS {name}"
+    for name in ("products_index_ai", "products_index_au", "products_index_ad", "sales_index_ai", "sales_index_au", "sales_index_ad")
+]
+
+# entries queued before they were collapsed: keep the newest per document, then enforce it
+_DEDUPE_OUTBOX = [
+    "DELETE FROM index_outbox WHERE id NOT IN (SELECT max(id) FROM index_outbox GROUP BY doc_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_index_outbox_doc_id ON index_outbox (doc_id)",
+]
+
+# dropped first, so triggers from before the upsert are replaced
+_SQLITE_DDL = _DEDUPE_OUTBOX + _SQLITE_DROP + [
+    f"""CREATE TRIGGER products_index_ai AFTER INSERT ON products BEGIN
+        INSERT INTO index_outbox(doc_id) VALUES ('product_' || new.id) {_SQLITE_QUEUE};
+    END""",
+    # only columns that appear in the product document
+    f"""CREATE TRIGGER products_index_au AFTER UPDATE OF name, "Brand", category, price, quantity ON products BEGIN
+        INSERT INTO index_outbox(doc_id) VALUES ('product_' || new.id) {_SQLITE_QUEUE};
+        INSERT INTO index_outbox(doc_id) SELECT 'sales_of_product_' || new.id WHERE new.name IS NOT old.name {_SQLITE_QUEUE};
+    END""",
+    f"""CREATE TRIGGER products_index_ad AFTER DELETE ON products BEGIN
+        INSERT INTO index_outbox(doc_id) VALUES ('product_' || old.id), ('sales_of_product_' || old.id) {_SQLITE_QUEUE};
+    END""",
+    _SQLITE_SALES_INSERT_TRIGGER,
+    f"""CREATE TRIGGER sales_index_au AFTER UPDATE ON sales BEGIN
+        INSERT INTO index_outbox(doc_id) VALUES ('sale_' || new.id) {_SQLITE_QUEUE};
+    END""",
+    f"""CREATE TRIGGER sales_index_ad AFTER DELETE ON sales BEGIN
+        INSERT INTO index_outbox(doc_id) VALUES ('sale_' || old.id) {_SQLITE_QUEUE};
+    END""",
+]
+
+_PG_DDL = _DEDUPE_OUTBOX + [
+    # see _SQLITE_QUEUE
+    """CREATE OR REPLACE FUNCTION index_outbox_queue(doc text) RETURNS void LANGUAGE sql AS $$
+        INSERT INTO index_outbox(doc_id) VALUES (doc)
+        ON CONFLICT (doc_id) DO UPDATE SET id = nextval(pg_get_serial_sequence('index_outbox', 'id'))
+    $$""",
+    # app.index_capture = 'off' for the current transaction skips capture (see uncaptured_sale_inserts)
+    """CREATE OR REPLACE FUNCTION index_outbox_capture() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF current_setting('app.index_capture', true) = 'off' THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP = 'DELETE' THEN
+            PERFORM index_outbox_queue(TG_ARGV[0] || OLD.id);
+            IF TG_TABLE_NAME = 'products' THEN
+                PERFORM index_outbox_queue('sales_of_product_' || OLD.id);
+            END IF;
+            RETURN OLD;
+        END IF;
+        PERFORM index_outbox_queue(TG_ARGV[0] || NEW.id);
+        IF TG_TABLE_NAME = 'products' AND TG_OP = 'UPDATE' THEN
+            IF NEW.name IS DISTINCT FROM OLD.name THEN
+                PERFORM index_outbox_queue('sales_of_product_' || NEW.id);
+            END IF;
+        END IF;
+        RETURN NEW;
+    END $$""",
+    "DROP TRIGGER IF EXISTS products_index_outbox ON products",
+    """CREATE TRIGGER products_index_outbox
+        AFTER INSERT OR DELETE OR UPDATE OF name, "Brand", category, price, quantity ON products
+        FOR EACH ROW EXECUTE FUNCTION index_outbox_capture('product_')""",
+    "DROP TRIGGER IF EXISTS sales_index_outbox ON sales",
+    """CREATE TRIGGER sales_index_outbox AFTER INSERT OR UPDATE OR DELETE ON sales
+        FOR EACH ROW EXECUTE FUNCTION index_outbox_capture('sale_')""",
+]
+_PG_DROP = [
+    "DROP TRIGGER IF EXISTS products_index_outbox ON products",
+    "DROP TRIGGER IF EXISTS sales_index_outbox ON sales",
+]
+
+# without capture, nothing records what changes in the meantime: queued entries and the
+# watermarks go, so turning capture back on rebuilds the index once
+_FORGET_CHANGES = ["DELETE FROM index_outbox", "DELETE FROM index_watermarks"]
+
+
+def ensure_change_capture(engine: Engine):
+    """
+    Install the outbox triggers. Idempotent. The app only calls it together with starting
+    the sync worker at startup (RAG_INDEX_SYNC); with sync off, triggers installed earlier
+    stay and keep queuing changes (one entry per document at most) for when it is turned
+    back on. remove_change_capture takes them out.
+    """
+    _run_capture_ddl(engine, {"sqlite": _SQLITE_DDL, "postgresql": _PG_DDL})
+
+
+def remove_change_capture(engine: Engine):
+    """Drop the outbox triggers and forget queued changes; turning capture back on rebuilds the index once."""
+    _run_capture_ddl(engine, {"sqlite": _SQLITE_DROP + _FORGET_CHANGES, "postgresql": _PG_DROP + _FORGET_CHANGES})
+
+
+def _run_capture_ddl(engine: Engine, statements_by_dialect: dict):
+    dialect = engine.dialect.name
+    if dialect not in statements_by_dialect:
+        logger.warning("No change capture for %s; the vector index is only built once", dialect)
+        return
+    try:
+        with engine.begin() as conn:
+            for ddl in statements_by_dialect[dialect]:
+                conn.execute(text(ddl))
+    except Exception as e:
+        logger.warning("Could not set up vector index change capture: %s", e)
+
+
+@contextmanager
+def uncaptured_sale_inserts(db: Session):
+    """
+    Sales inserted inside the block, in ``db``'s current transaction, are not queued in the
+    outbox; the caller commits after the block. For bulk imports, which are indexed by a
+    catch-up build instead (see queue_sales_catch_up).
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        db.execute(text("SELECT set_config('app.index_capture', 'off', true)"))
+        yield
+        db.execute(text("SELECT set_config('app.index_capture', 'on', true)"))
+    elif dialect == "sqlite":
+        # SQLite has no session variables: the insert trigger is dropped and recreated inside
+        # the transaction, so no other connection ever writes without it
+        installed = db.scalar(text("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'sales_index_ai'"))
+        if installed:
+            raw = db.connection().connection.dbapi_connection
+            if not raw.in_transaction:
+                # the sqlite3 module only opens transactions before DML, and the DDL has to be in one
+                raw.execute("BEGIN")
+            db.execute(text("DROP TRIGGER sales_index_ai"))
+        yield
+        if installed:
+            db.execute(text(_SQLITE_SALES_INSERT_TRIGGER))
+    else:
+        yield
+
+
+def queue_sales_catch_up(db: Session):
+    """
+    Have every built collection index the sales added from now on with a resumable build
+    (see build_index) instead of through the outbox; the sync worker runs it. The caller commits.
+    """
+    max_sale_id = db.scalar(select(func.max(models.Sale.id))) or 0
+    for checkpoint in db.scalars(select(models.IndexBuildCheckpoint)):
+        if checkpoint.completed:
+            # products are current: the sales phase restarts after the last existing sale.
+            # The build covers no queued changes, so it must not consume any outbox entries.
+            checkpoint.completed = False
+            checkpoint.last_sale_id = max_sale_id
+            checkpoint.outbox_id = 0
+        else:
+            checkpoint.last_sale_id = min(checkpoint.last_sale_id, max_sale_id)
+
+
+def product_document(p) -> dict:
+    text = f"Product: {p.name}. Brand: {p.Brand or ''}. Category: {p.category or ''}. Price: {p.price or ''}. Quantity: {p.quantity or ''}."
+    return {"id": f"product_{p.id}", "text": text, "meta": {"type": "product", "product_id": p.id}}
+
+
+def sale_document(s, product_name) -> dict:
+    prod_name = product_name if product_name is not None else f"product_id_{s.product_id}"
+    text = f"Sale: Product: {prod_name}. Quantity sold: {s.quantity_sold}. Date: {s.sale_date}. Total: {s.total_price}."
+    return {"id": f"sale_{s.id}", "text": text, "meta": {"type": "sale", "sale_id": s.id, "product_id": s.product_id}}
+
+
+def products_select():
+    p = models.Product
+    return select(p.id, p.name, p.Brand, p.category, p.price, p.quantity)
+
+
+def sales_select():
+    """Sales joined with their product's name, so documents need no per-sale product lookup."""
+    s = models.Sale
+    return (
+        select(s.id, s.product_id, s.quantity_sold, s.sale_date, s.total_price, models.Product.name.label("product_name"))
+        .outerjoin(models.Product, models.Product.id == s.product_id)
+    )
+
+
+def load_documents(db: Session, product_ids=(), sale_ids=()) -> list:
+    """Current documents for the given ids; ids whose row no longer exists are left out."""
+    docs = []
+    product_ids, sale_ids = sorted(product_ids), sorted(sale_ids)
+    for i in range(0, len(product_ids), _ID_CHUNK):
+        chunk = product_ids[i:i + _ID_CHUNK]
+        docs += [product_document(p) for p in db.execute(products_select().where(models.Product.id.in_(chunk)))]
+    for i in range(0, len(sale_ids), _ID_CHUNK):
+        chunk = sale_ids[i:i + _ID_CHUNK]
+        docs += [sale_document(s, s.product_name) for s in db.execute(sales_select().where(models.Sale.id.in_(chunk)))]
+    return docs
+
+
+def max_outbox_id(db: Session) -> int:
+    return db.scalar(select(func.max(models.IndexOutbox.id))) or 0
+
+
+def has_watermark(collection: str) -> bool:
+    with SessionLocal() as db:
+        return db.get(models.IndexWatermark, collection) is not None
+
+
+def _advance_watermark(db: Session, collection: str, outbox_id: int):
+    mark = db.get(models.IndexWatermark, collection)
+    if mark is None:
+        mark = models.IndexWatermark(collection=collection, outbox_id=0)
+        db.add(mark)
+    mark.outbox_id = max(mark.outbox_id or 0, outbox_id)
+    mark.synced_at = _utcnow()
+
+
+def build_pending(collection: str) -> bool:
+    """True if a full build of ``collection`` was started and has not completed."""
+    with SessionLocal() as db:
+        checkpoint = db.get(models.IndexBuildCheckpoint, collection)
+        return checkpoint is not None and not checkpoint.completed
+
+
+def _index_batch(collection, embedder, docs: list, encode_options: dict):
+    texts = [d["text"] for d in docs]
+    embeddings = embedder.encode(texts, convert_to_numpy=True, **encode_options).tolist()
+    # upsert, not add: a resumed build redoes the batches after its last checkpoint
+    collection.upsert(ids=[d["id"] for d in docs], documents=texts,
+                      metadatas=[d["meta"] for d in docs], embeddings=embeddings)
+
+
+def _log_progress(checkpoint, docs_this_run: int, elapsed: float):
+    logger.info("Vector index build: %d documents indexed (%.0f docs/s)",
+                checkpoint.docs_indexed, docs_this_run / elapsed if elapsed else 0)
+
+
+def build_index(db: Session, collection, embedder, restart: bool = False, batch_size: int = RAG_BUILD_BATCH_SIZE,
+                processes: int = RAG_BUILD_PROCESSES, progress=_log_progress) -> dict:
+    """
+    Build ``collection`` from ``db``, or resume its interrupted build unless ``restart``.
+    Returns the build's totals (see ``_build_stats``).
+
+    Rows are streamed in id order, one window of ``_BATCHES_PER_CHECKPOINT`` batches
+    per query. The checkpoint is written once a window's result is exhausted, so no
+    read cursor is open while the primary is written to.
+    """
+    name = collection.name
+    started = time.perf_counter()
+    docs_this_run = 0
+    pool = None
+    with SessionLocal() as state:
+        checkpoint = state.get(models.IndexBuildCheckpoint, name)
+        if checkpoint is None or checkpoint.completed or restart:
+            if checkpoint is None:
+                checkpoint = models.IndexBuildCheckpoint(collection=name)
+                state.add(checkpoint)
+            # read before the documents, so every change up to here is reflected in them
+            checkpoint.outbox_id = max_outbox_id(db) if RAG_INDEX_SYNC else 0
+            checkpoint.last_product_id = checkpoint.last_sale_id = 0
+            checkpoint.docs_indexed, checkpoint.build_seconds = 0, 0.0
+            checkpoint.started_at, checkpoint.completed = _utcnow(), False
+            state.commit()
+        elif checkpoint.docs_indexed:
+            logger.info("Resuming vector index build after %d documents", checkpoint.docs_indexed)
+        seconds_before = checkpoint.build_seconds
+
+        try:
+            encode_options = {}
+            if processes > 1:
+                # one model copy per process; each encodes a share of every batch
+                pool = embedder.start_multi_process_pool(["cpu"] * processes)
+                encode_options = {"pool": pool}
+
+            phases = [
+                ("last_product_id", products_select(), models.Product.id, product_document),
+                ("last_sale_id", sales_select(), models.Sale.id, lambda s: sale_document(s, s.product_name)),
+            ]
+            window = batch_size * _BATCHES_PER_CHECKPOINT
+            while True:
+                for position, stmt, id_column, to_document in phases:
+                    while True:
+                        after_id = getattr(checkpoint, position)
+                        result = db.execute(
+                            stmt.where(id_column > after_id).order_by(id_column).limit(window)
+                            .execution_options(yield_per=batch_size)
+                        )
+                        indexed = 0
+                        for rows in result.partitions():
+                            _index_batch(collection, embedder, [to_document(r) for r in rows], encode_options)
+                            indexed += len(rows)
+                            after_id = rows[-1].id
+                        if not indexed:
+                            break
+                        docs_this_run += indexed
+                        setattr(checkpoint, position, after_id)
+                        checkpoint.docs_indexed += indexed
+                        checkpoint.build_seconds = seconds_before + time.perf_counter() - started
+                        state.commit()
+                        if progress is not None:
+                            progress(checkpoint, docs_this_run, time.perf_counter() - started)
+                        if indexed < window:
+                            break
+                # a bulk import may have queued more sales meanwhile (queue_sales_catch_up); the row
+                # lock keeps it from doing so between this check and the completion commit
+                state.refresh(checkpoint, with_for_update=True)
+                more = db.scalar(select(models.Sale.id).where(models.Sale.id > checkpoint.last_sale_id).limit(1))
+                if more is None:
+                    break
+        finally:
+            if pool is not None:
+                embedder.stop_multi_process_pool(pool)
+
+        # the outbox rows the build covers, the watermark and the completion flag commit together
+        if RAG_INDEX_SYNC:
+            state.execute(delete(models.IndexOutbox).where(models.IndexOutbox.id <= checkpoint.outbox_id))
+            _advance_watermark(state, name, checkpoint.outbox_id)
+        checkpoint.build_seconds = seconds_before + time.perf_counter() - started
+        checkpoint.completed = True
+        state.commit()
+        stats = _build_stats(checkpoint)
+    bump_index_version()
+    logger.info("Vector index built: %d documents in %.1fs (%.0f docs/s)",
+                stats["docs_indexed"], stats["build_seconds"], stats["docs_per_second"])
+    return stats
+
+
+def _build_stats(checkpoint) -> dict:
+    seconds = checkpoint.build_seconds or 0.0
+    return {
+        "completed": checkpoint.completed,
+        "docs_indexed": checkpoint.docs_indexed,
+        "build_seconds": seconds,
+        "docs_per_second": checkpoint.docs_indexed / seconds if seconds else 0.0,
+        "started_at": checkpoint.started_at,
+    }
+
+
+def _utcnow() -> datetime:
+    # changed_at comes from CURRENT_TIMESTAMP, which is UTC
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def index_lag(db: Session, collection: str) -> dict:
+    pending, oldest = db.execute(select(func.count(), func.min(models.IndexOutbox.changed_at))).one()
+    mark = db.get(models.IndexWatermark, collection)
+    checkpoint = db.get(models.IndexBuildCheckpoint, collection)
+    return {
+        "pending_changes": pending,
+        "oldest_pending_age_seconds": max(0.0, (_utcnow() - oldest).total_seconds()) if oldest else 0.0,
+        "watermark": mark.outbox_id if mark else None,
+        "last_synced_at": mark.synced_at if mark else None,
+        "build": _build_stats(checkpoint) if checkpoint else None,
+    }
+
+
+# held while the collection is rebuilt or a sync batch is applied
+index_lock = threading.Lock()
+
+# bumped whenever this process changes the collection; answer caches put it in their keys
+_index_version = 0
+_index_version_lock = threading.Lock()
+
+
+def index_version() -> int:
+    return _index_version
+
+
+def bump_index_version() -> int:
+    global _index_version
+    with _index_version_lock:
+        _index_version += 1
+        return _index_version
+
+
+class IndexSyncWorker:
+    def __init__(self, interval: float = 2, batch_size: int = 256):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.collection = None
+        self.embedder = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.batches = 0
+        self.upserted = 0
+        self.deleted = 0
+        self.errors = 0
+        self.last_error = None
+
+    def start(self, collection, embedder):
+        """Sync into ``collection`` with ``embedder``; starts the thread on first call."""
+        self.collection, self.embedder = collection, embedder
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="vector-index-sync", daemon=True)
+                self._thread.start()
+
+    def close(self):
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if build_pending(self.collection.name):
+                    # e.g. queued by a bulk import (queue_sales_catch_up)
+                    self.catch_up()
+                applied = self.sync_once()
+            except Exception as e:
+                logger.exception("Vector index sync failed, retrying")
+                self.errors += 1
+                self.last_error = str(e)
+                applied = 0
+            # a full batch means more is probably waiting
+            if applied < self.batch_size and self._stop.wait(self.interval):
+                return
+
+    def catch_up(self) -> dict:
+        """Finish the collection's pending build."""
+        with index_lock, SessionLocal() as db:
+            return build_index(db, self.collection, self.embedder)
+
+    def sync_once(self) -> int:
+        """Apply up to batch_size outbox rows. Returns the number of rows applied."""
+        with index_lock, SessionLocal() as db:
+            rows = db.execute(
+                select(models.IndexOutbox.id, models.IndexOutbox.doc_id).order_by(models.IndexOutbox.id).limit(self.batch_size)
+            ).all()
+            if not rows:
+                return 0
+
+            product_ids, sale_ids = set(), set()
+            for _, doc_id in rows:
+                if doc_id.startswith(_SALES_OF_PRODUCT):
+                    product_id = int(doc_id[len(_SALES_OF_PRODUCT):])
+                    sale_ids.update(db.scalars(select(models.Sale.id).where(models.Sale.product_id == product_id)))
+                elif doc_id.startswith("product_"):
+                    product_ids.add(int(doc_id[len("product_"):]))
+                elif doc_id.startswith("sale_"):
+                    sale_ids.add(int(doc_id[len("sale_"):]))
+
+            docs = load_documents(db, product_ids, sale_ids)
+            if docs:
+                _index_batch(self.collection, self.embedder, docs, {})
+            wanted = {f"product_{i}" for i in product_ids} | {f"sale_{i}" for i in sale_ids}
+            gone = sorted(wanted - {d["id"] for d in docs})
+            if gone:
+                self.collection.delete(ids=gone)
+
+            # the collection is updated first: a crash before this commit only replays upserts
+            db.execute(delete(models.IndexOutbox).where(models.IndexOutbox.id.in_([outbox_id for outbox_id, _ in rows])))
+            _advance_watermark(db, self.collection.name, rows[-1][0])
+            db.commit()
+
+        if docs or gone:
+            bump_index_version()
+        self.batches += 1
+        self.upserted += len(docs)
+        self.deleted += len(gone)
+        self.last_error = None
+        return len(rows)
+
+    def stats(self) -> dict:
+        return {
+            "worker_running": self._thread is not None,
+            "batches": self.batches,
+            "upserted_docs": self.upserted,
+            "deleted_docs": self.deleted,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+sync_worker = IndexSyncWorker(RAG_INDEX_SYNC_INTERVAL_SECONDS, RAG_INDEX_SYNC_BATCH_SIZE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the RAG vector index from the database.")
+    parser.add_argument("command", choices=["build", "remove-capture"],
+                        help="build: (re)index every product and sale, resuming an interrupted build; "
+                             "remove-capture: drop the change capture triggers and forget queued changes")
+    parser.add_argument("--restart", action="store_true", help="discard an interrupted build instead of resuming it")
+    parser.add_argument("--batch-size", type=int, default=RAG_BUILD_BATCH_SIZE, help="documents per embed/upsert call")
+    parser.add_argument("--processes", type=int, default=RAG_BUILD_PROCESSES,
+                        help="encoder processes (default 1: encode in this process)")
+    args = parser.parse_args()
+
+    # imported here: the router module imports this one
+    from .database import engine
+    from .replica import read_session
+    from .routers import RAG
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    models.Base.metadata.create_all(bind=engine)
+    if args.command == "remove-capture":
+        remove_change_capture(engine)
+        print("Removed vector index change capture; queued changes are forgotten.")
+        return
+    if RAG_INDEX_SYNC:
+        ensure_change_capture(engine)
+    with read_session() as db:
+        stats = RAG.build_collection(db, restart=args.restart, batch_size=args.batch_size, processes=args.processes)
+    print(f"Indexed {stats['docs_indexed']} documents in {stats['build_seconds']:.1f}s "
+          f"({stats['docs_per_second']:.0f} docs/s).")
+
+
+if __name__ == "__main__":
+    main()